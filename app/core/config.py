@@ -6,6 +6,13 @@ DEFAULT_DATABASE_URL = "sqlite:///./mathlingo.db"
 DEFAULT_SECRET_KEY = "supersecretkey"
 DEFAULT_ALGORITHM = "HS256"
 DEFAULT_ACCESS_TOKEN_EXPIRE_MINUTES = 60
+DEFAULT_RECOMMENDATION_CACHE_SIZE = 10000
+DEFAULT_RECOMMENDATION_CACHE_TTL_SECONDS = 300
+DEFAULT_ADAPTIVE_ENGINE_MODE = "python"
+DEFAULT_ADAPTIVE_LATENCY_BUDGET_MS = 0
+DEFAULT_ADAPTIVE_SELECTION_POLICY = "heuristic"
+DEFAULT_MASTERY_RATES_PATH = ""
+DEFAULT_CURRICULUM_GRAPH_CHECK_SECONDS = 5
 
 
 def _load_dotenv(path: str = ".env") -> None:
@@ -28,6 +35,13 @@ class SettingsProtocol(Protocol):
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+    RECOMMENDATION_CACHE_SIZE: int
+    RECOMMENDATION_CACHE_TTL_SECONDS: int
+    ADAPTIVE_ENGINE_MODE: str
+    ADAPTIVE_LATENCY_BUDGET_MS: int
+    ADAPTIVE_SELECTION_POLICY: str
+    MASTERY_RATES_PATH: str
+    CURRICULUM_GRAPH_CHECK_SECONDS: int
 
 
 try:
@@ -42,6 +56,13 @@ if _PydanticBaseSettings is not None:
         SECRET_KEY: str = DEFAULT_SECRET_KEY
         ALGORITHM: str = DEFAULT_ALGORITHM
         ACCESS_TOKEN_EXPIRE_MINUTES: int = DEFAULT_ACCESS_TOKEN_EXPIRE_MINUTES
+        RECOMMENDATION_CACHE_SIZE: int = DEFAULT_RECOMMENDATION_CACHE_SIZE
+        RECOMMENDATION_CACHE_TTL_SECONDS: int = DEFAULT_RECOMMENDATION_CACHE_TTL_SECONDS
+        ADAPTIVE_ENGINE_MODE: str = DEFAULT_ADAPTIVE_ENGINE_MODE
+        ADAPTIVE_LATENCY_BUDGET_MS: int = DEFAULT_ADAPTIVE_LATENCY_BUDGET_MS
+        ADAPTIVE_SELECTION_POLICY: str = DEFAULT_ADAPTIVE_SELECTION_POLICY
+        MASTERY_RATES_PATH: str = DEFAULT_MASTERY_RATES_PATH
+        CURRICULUM_GRAPH_CHECK_SECONDS: int = DEFAULT_CURRICULUM_GRAPH_CHECK_SECONDS
 
         class Config:
             env_file = ".env"
@@ -60,5 +81,32 @@ else:
                 str(DEFAULT_ACCESS_TOKEN_EXPIRE_MINUTES),
             )
         )
+        RECOMMENDATION_CACHE_SIZE: int = int(
+            os.getenv(
+                "RECOMMENDATION_CACHE_SIZE",
+                str(DEFAULT_RECOMMENDATION_CACHE_SIZE),
+            )
+        )
+        RECOMMENDATION_CACHE_TTL_SECONDS: int = int(
+            os.getenv(
+                "RECOMMENDATION_CACHE_TTL_SECONDS",
+                str(DEFAULT_RECOMMENDATION_CACHE_TTL_SECONDS),
+            )
+        )
+        ADAPTIVE_ENGINE_MODE: str = os.getenv("ADAPTIVE_ENGINE_MODE", DEFAULT_ADAPTIVE_ENGINE_MODE)
+        ADAPTIVE_LATENCY_BUDGET_MS: int = int(
+            os.getenv(
+                "ADAPTIVE_LATENCY_BUDGET_MS",
+                str(DEFAULT_ADAPTIVE_LATENCY_BUDGET_MS),
+            )
+        )
+        ADAPTIVE_SELECTION_POLICY: str = os.getenv("ADAPTIVE_SELECTION_POLICY", DEFAULT_ADAPTIVE_SELECTION_POLICY)
+        MASTERY_RATES_PATH: str = os.getenv("MASTERY_RATES_PATH", DEFAULT_MASTERY_RATES_PATH)
+        CURRICULUM_GRAPH_CHECK_SECONDS: int = int(
+            os.getenv(
+                "CURRICULUM_GRAPH_CHECK_SECONDS",
+                str(DEFAULT_CURRICULUM_GRAPH_CHECK_SECONDS),
+            )
+        )
 
     settings: SettingsProtocol = _FallbackSettings()
@@ -2,6 +2,7 @@
 
 from app.models.attempt import Attempt
 from app.models.certificate import Certificate
+from app.models.daily_plan import DailyPlan
 from app.models.exercise import Exercise
 from app.models.level import Level
 from app.models.module import Module
@@ -16,6 +17,7 @@ from app.models.user_mastery import UserMastery
 __all__ = [
     'Attempt',
     'Certificate',
+    'DailyPlan',
     'Exercise',
     'Level',
     'Module',
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from datetime import date, datetime
+
+from sqlalchemy import JSON, Date, DateTime, ForeignKey, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+
+
+class DailyPlan(Base):
+    """Precomputed ordered practice plan of one user for one day."""
+
+    __tablename__ = 'daily_plans'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=False, unique=True, index=True)
+    plan_date: Mapped[date] = mapped_column(Date, nullable=False)
+    generated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    # Newest attempt id of the user when the plan was computed; any later attempt voids the plan.
+    last_attempt_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    topic_ids: Mapped[list[int]] = mapped_column(JSON, nullable=False, default=list)
+    exercise_ids: Mapped[list[int]] = mapped_column(JSON, nullable=False, default=list)
+
+    def __repr__(self) -> str:
+        return (
+            f"DailyPlan(user_id={self.user_id}, plan_date={self.plan_date}, "
+            f"exercises={len(self.exercise_ids or [])})"
+        )
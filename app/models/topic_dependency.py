@@ -56,3 +56,19 @@ def validate_same_subject(mapper, connection, target: TopicDependency) -> None:
         raise ValueError('TopicDependency references non-existent topics')
     if topic_subject != depends_on_subject:
         raise ValueError('TopicDependency must connect topics from the same subject')
+
+    # The edge closes a cycle if the prerequisite already depends on the topic.
+    edges = TopicDependency.__table__
+    reachable = (
+        select(edges.c.depends_on_id.label('topic_id'))
+        .where(edges.c.topic_id == target.depends_on_id)
+        .cte('reachable', recursive=True)
+    )
+    reachable = reachable.union(
+        select(edges.c.depends_on_id).where(edges.c.topic_id == reachable.c.topic_id)
+    )
+    closes_cycle = connection.execute(
+        select(reachable.c.topic_id).where(reachable.c.topic_id == target.topic_id).limit(1)
+    ).first()
+    if closes_cycle is not None:
+        raise ValueError('TopicDependency would create a prerequisite cycle')
@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import TYPE_CHECKING
 
-from sqlalchemy import CheckConstraint, DateTime, Float, ForeignKey, Integer, UniqueConstraint, func
+from sqlalchemy import JSON, Boolean, CheckConstraint, DateTime, Float, ForeignKey, Index, Integer, UniqueConstraint, false, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.core.database import Base
@@ -20,6 +20,11 @@ class UserMastery(Base):
     __table_args__ = (
         UniqueConstraint('user_id', 'topic_id', name='uq_user_mastery_user_topic'),
         CheckConstraint('mastery_score >= 0.0 AND mastery_score <= 1.0', name='ck_user_mastery_score_range'),
+        # Due-review queue: range scan of one user's rows ordered by due time.
+        Index('ix_user_mastery_user_next_review', 'user_id', 'next_review_at'),
+        # Review queues and completion counts per user read these directly.
+        Index('ix_user_mastery_user_review_priority', 'user_id', 'review_priority'),
+        Index('ix_user_mastery_user_completed', 'user_id', 'is_completed'),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -32,6 +37,16 @@ class UserMastery(Base):
         onupdate=func.now(),
         nullable=False,
     )
+    next_review_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Last answer on the topic; unlike `last_updated` it is not bumped by maintenance writes.
+    last_seen_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Decayed spaced-repetition priority, refreshed by the review refresh job.
+    review_priority: Mapped[float | None] = mapped_column(Float, nullable=True)
+    is_completed: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default=false())
+    # Most recent correct-attempt timestamps (ISO, oldest first), capped at the revalidation count.
+    recent_correct_at: Mapped[list[str] | None] = mapped_column(JSON, nullable=True)
+    # A stale topic counts as revalidated until this moment.
+    revalidated_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     user: Mapped[User] = relationship('User', back_populates='mastery')
     topic: Mapped[Topic] = relationship('Topic', back_populates='mastery')
@@ -1,15 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel
+from datetime import datetime
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
 from app.core.database import get_db
+from app.core.security import require_admin
 from app.models.attempt import Attempt
 from app.models.exercise import Exercise
 from app.models.topic import Topic
 from app.models.user import User
+from app.schemas.adaptive import RankedTopicOut, RecommendationExplainOut, StageTimingOut
 from app.schemas.exercise import ExerciseSuggestion
-from app.services.adaptation_engine import select_next_exercise
-from app.services.mastery_engine import update_mastery
+from app.schemas.mastery import DueReviewOut
+from app.schemas.user import UserOut
+from app.services.adaptation_engine import (
+    AdaptiveScope,
+    explain_next_exercise,
+    mastery_before_answer,
+    observe_answer,
+    recommend_next_exercise,
+    recommend_practice_queue,
+)
+from app.services.cohort_engine import select_next_exercises_for_users
+from app.services.recommendation_budget import recommend_within_budget
+from app.services.mastery_engine import _utcnow, get_due_reviews, update_mastery
+from app.services.offline_sync import OfflineAnswer, normalize_answer, submit_offline_answers
 
 router = APIRouter(prefix='/adaptive', tags=['Adaptive'])
 
@@ -18,6 +35,9 @@ class AdaptiveSubmitRequest(BaseModel):
     user_id: int
     exercise_id: int
     answer: str
+    subject_id: int | None = None
+    pathway_id: int | None = None
+    module_id: int | None = None
 
 
 class AdaptiveSubmitResponse(BaseModel):
@@ -27,18 +47,160 @@ class AdaptiveSubmitResponse(BaseModel):
     next_exercise_id: int | None = None
 
 
-def _normalize_answer(value: str) -> str:
-    return ' '.join(value.strip().lower().split())
+class OfflineAnswerIn(BaseModel):
+    exercise_id: int
+    answer: str
+    answered_at: datetime | None = None
 
 
-@router.get('/next_exercise', response_model=ExerciseSuggestion)
-def get_next_exercise(user_id: int, db: Session = Depends(get_db)):
-    """Suggest the next exercise based on adaptive mastery logic."""
-    exercise = select_next_exercise(db, user_id)
-    if exercise is None:
+class AdaptiveSyncRequest(BaseModel):
+    user_id: int
+    answers: list[OfflineAnswerIn] = Field(min_length=1, max_length=500)
+    subject_id: int | None = None
+    pathway_id: int | None = None
+    module_id: int | None = None
+
+
+class AdaptiveSyncResult(BaseModel):
+    exercise_id: int
+    correct: bool
+    correct_answer: str
+    mastery_score: float
+
+
+class AdaptiveSyncResponse(BaseModel):
+    results: list[AdaptiveSyncResult]
+    next_exercise_id: int | None = None
+
+
+class NextExerciseResponse(ExerciseSuggestion):
+    fallback: bool = False
+
+
+class BatchNextExerciseRequest(BaseModel):
+    user_ids: list[int] = Field(min_length=1, max_length=500)
+    subject_id: int | None = None
+    pathway_id: int | None = None
+    module_id: int | None = None
+
+
+class BatchNextExerciseItem(BaseModel):
+    user_id: int
+    exercise: ExerciseSuggestion | None = None
+
+
+class PracticeQueueResponse(BaseModel):
+    user_id: int
+    assume: Literal['correct', 'incorrect']
+    exercises: list[ExerciseSuggestion]
+
+
+@router.get('/next_exercise', response_model=NextExerciseResponse)
+def get_next_exercise(
+    user_id: int,
+    subject_id: int | None = None,
+    pathway_id: int | None = None,
+    module_id: int | None = None,
+    db: Session = Depends(get_db),
+):
+    """Suggest the next exercise based on adaptive mastery logic, optionally within a subject/pathway/module.
+
+    `fallback` is true when selection exceeded the latency budget and a
+    previous or default suggestion was served instead.
+    """
+    scope = AdaptiveScope(subject_id=subject_id, pathway_id=pathway_id, module_id=module_id)
+    result = recommend_within_budget(db, user_id, scope=scope)
+    if result.exercise is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='No exercise available')
 
-    return ExerciseSuggestion.model_validate(exercise)
+    suggestion = ExerciseSuggestion.model_validate(result.exercise)
+    return NextExerciseResponse(**suggestion.model_dump(), fallback=result.fallback)
+
+
+@router.get('/next_exercise/explain', response_model=RecommendationExplainOut)
+def explain_next_exercise_route(
+    user_id: int,
+    subject_id: int | None = None,
+    pathway_id: int | None = None,
+    module_id: int | None = None,
+    db: Session = Depends(get_db),
+    admin_user: UserOut = Depends(require_admin),
+):
+    """Trace an uncached selection for a user: sets, ranking, and per-stage timings (admin only)."""
+    trace = explain_next_exercise(
+        db,
+        user_id,
+        scope=AdaptiveScope(subject_id=subject_id, pathway_id=pathway_id, module_id=module_id),
+    )
+    return RecommendationExplainOut(
+        user_id=user_id,
+        unlocked_topic_ids=trace.unlocked_topic_ids,
+        reinforcement_topic_ids=trace.reinforcement_topic_ids,
+        ranked_topics=[RankedTopicOut.model_validate(topic) for topic in trace.ranked_topics],
+        picked_exercise_id=trace.picked_exercise_id,
+        used_fallback=trace.used_fallback,
+        stages=[StageTimingOut.model_validate(stage) for stage in trace.stages],
+        total_ms=sum(stage.elapsed_ms for stage in trace.stages),
+        total_statements=trace.statements,
+    )
+
+
+@router.post('/next_exercise/batch', response_model=list[BatchNextExerciseItem])
+def get_next_exercises_batch(data: BatchNextExerciseRequest, db: Session = Depends(get_db)):
+    """Suggest the next exercise for a whole classroom in one pass."""
+    scope = AdaptiveScope(subject_id=data.subject_id, pathway_id=data.pathway_id, module_id=data.module_id)
+    suggestions = select_next_exercises_for_users(db, data.user_ids, scope=scope)
+    return [
+        BatchNextExerciseItem(
+            user_id=user_id,
+            exercise=ExerciseSuggestion.model_validate(exercise) if exercise is not None else None,
+        )
+        for user_id, exercise in suggestions.items()
+    ]
+
+
+@router.get('/practice_queue', response_model=PracticeQueueResponse)
+def get_practice_queue(
+    user_id: int,
+    size: int = Query(default=5, ge=1, le=20),
+    assume: Literal['correct', 'incorrect'] = 'correct',
+    subject_id: int | None = None,
+    pathway_id: int | None = None,
+    module_id: int | None = None,
+    db: Session = Depends(get_db),
+):
+    """Return the next exercises the engine would serve, assuming every answer is correct (or wrong)."""
+    exercises = recommend_practice_queue(
+        db,
+        user_id,
+        size=size,
+        assume_correct=assume == 'correct',
+        scope=AdaptiveScope(subject_id=subject_id, pathway_id=pathway_id, module_id=module_id),
+    )
+    return PracticeQueueResponse(
+        user_id=user_id,
+        assume=assume,
+        exercises=[ExerciseSuggestion.model_validate(exercise) for exercise in exercises],
+    )
+
+
+@router.get('/due_reviews', response_model=list[DueReviewOut])
+def list_due_reviews(
+    user_id: int,
+    limit: int = Query(default=20, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    """Return the user's topics due for review, most overdue first."""
+    now = _utcnow()
+    return [
+        DueReviewOut(
+            topic_id=row.topic_id,
+            mastery_score=float(row.mastery_score),
+            next_review_at=row.next_review_at,
+            overdue_days=(now - row.next_review_at.replace(tzinfo=None)).total_seconds() / 86400.0,
+        )
+        for row in get_due_reviews(db, user_id, limit=limit, now=now)
+    ]
 
 
 @router.post('/submit', response_model=AdaptiveSubmitResponse)
@@ -62,7 +224,11 @@ def submit_adaptive_answer(data: AdaptiveSubmitRequest, db: Session = Depends(ge
     if topic is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Topic not found')
 
-    is_correct = _normalize_answer(data.answer) == _normalize_answer(exercise.answer)
+    # Plain copies: the commit below expires the loaded rows.
+    topic_id = int(exercise.topic_id)
+    correct_answer = exercise.answer
+    is_correct = normalize_answer(data.answer) == normalize_answer(correct_answer)
+    previous_score = mastery_before_answer(db, data.user_id, topic_id, subject_id=int(topic.subject_id))
 
     attempt = Attempt(
         user_id=data.user_id,
@@ -70,21 +236,63 @@ def submit_adaptive_answer(data: AdaptiveSubmitRequest, db: Session = Depends(ge
         is_correct=is_correct,
     )
     db.add(attempt)
+    try:
+        mastery = update_mastery(
+            db=db,
+            user_id=data.user_id,
+            topic_id=topic_id,
+            is_correct=is_correct,
+            difficulty=float(exercise.difficulty),
+            criticality_level=int(topic.criticality_level),
+            subject_id=int(topic.subject_id),
+            commit=False,
+        )
+        mastery_score = float(mastery.mastery_score)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if previous_score is not None:
+        observe_answer(
+            data.user_id,
+            topic_id=topic_id,
+            exercise_id=data.exercise_id,
+            is_correct=is_correct,
+            mastery_gain=mastery_score - previous_score,
+        )
 
-    mastery = update_mastery(
-        db=db,
-        user_id=data.user_id,
-        topic_id=int(exercise.topic_id),
-        is_correct=is_correct,
-        difficulty=float(exercise.difficulty),
-        criticality_level=int(topic.criticality_level),
-    )
-    db.refresh(attempt)
-
-    next_exercise = select_next_exercise(db, data.user_id)
+    scope = AdaptiveScope(subject_id=data.subject_id, pathway_id=data.pathway_id, module_id=data.module_id)
+    next_exercise = recommend_next_exercise(db, data.user_id, scope=scope)
     return AdaptiveSubmitResponse(
         correct=is_correct,
-        correct_answer=exercise.answer,
-        mastery_score=float(mastery.mastery_score),
+        correct_answer=correct_answer,
+        mastery_score=mastery_score,
+        next_exercise_id=next_exercise.id if next_exercise is not None else None,
+    )
+
+
+@router.post('/submit_batch', response_model=AdaptiveSyncResponse)
+def submit_adaptive_answers_batch(data: AdaptiveSyncRequest, db: Session = Depends(get_db)):
+    """Sync answers recorded offline in one transaction and suggest the next exercise once."""
+    graded = submit_offline_answers(
+        db,
+        data.user_id,
+        [
+            OfflineAnswer(exercise_id=item.exercise_id, answer=item.answer, answered_at=item.answered_at)
+            for item in data.answers
+        ],
+    )
+    scope = AdaptiveScope(subject_id=data.subject_id, pathway_id=data.pathway_id, module_id=data.module_id)
+    next_exercise = recommend_next_exercise(db, data.user_id, scope=scope)
+    return AdaptiveSyncResponse(
+        results=[
+            AdaptiveSyncResult(
+                exercise_id=item.exercise_id,
+                correct=item.correct,
+                correct_answer=item.correct_answer,
+                mastery_score=item.mastery_score,
+            )
+            for item in graded
+        ],
         next_exercise_id=next_exercise.id if next_exercise is not None else None,
     )
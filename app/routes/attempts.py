@@ -9,6 +9,7 @@ from app.models.exercise import Exercise
 from app.models.topic import Topic
 from app.models.user import User
 from app.schemas.attempt import AttemptCreate, AttemptOut
+from app.services.adaptation_engine import mastery_before_answer, observe_answer
 from app.services.certificate_service import ensure_subject_certificate
 from app.services.mastery_engine import update_mastery
 
@@ -32,35 +33,52 @@ def create_attempt(data: AttemptCreate, db: Session = Depends(get_db)):
             detail='Exercise has no topic assigned',
         )
 
-    attempt = Attempt(
-        user_id=data.user_id,
-        exercise_id=data.exercise_id,
-        is_correct=data.is_correct,
-    )
-    db.add(attempt)
-    db.commit()
-    db.refresh(attempt)
-
     topic_id = cast(int, exercise.topic_id)
     topic = db.query(Topic).filter(Topic.id == topic_id).first()
     if topic is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Topic not found')
 
-    mastery = update_mastery(
-        db=db,
+    previous_score = mastery_before_answer(db, data.user_id, topic_id, subject_id=int(topic.subject_id))
+
+    # Attempt, mastery and a possible certificate are committed together or not at all.
+    attempt = Attempt(
         user_id=data.user_id,
-        topic_id=topic_id,
+        exercise_id=data.exercise_id,
         is_correct=data.is_correct,
-        difficulty=float(exercise.difficulty),
-        criticality_level=int(topic.criticality_level),
-    )
-    ensure_subject_certificate(db, user_id=data.user_id, subject_id=int(topic.subject_id))
-
-    return AttemptOut(
-        id=attempt.id,
-        user_id=attempt.user_id,
-        exercise_id=attempt.exercise_id,
-        is_correct=attempt.is_correct,
-        created_at=attempt.created_at,
-        mastery_score=mastery.mastery_score,
     )
+    db.add(attempt)
+    try:
+        mastery = update_mastery(
+            db=db,
+            user_id=data.user_id,
+            topic_id=topic_id,
+            is_correct=data.is_correct,
+            difficulty=float(exercise.difficulty),
+            criticality_level=int(topic.criticality_level),
+            subject_id=int(topic.subject_id),
+            commit=False,
+        )
+        ensure_subject_certificate(db, user_id=data.user_id, subject_id=int(topic.subject_id), commit=False)
+        # The flush fetched the id and server-side created_at via RETURNING, so no refresh is needed.
+        response = AttemptOut(
+            id=attempt.id,
+            user_id=attempt.user_id,
+            exercise_id=attempt.exercise_id,
+            is_correct=attempt.is_correct,
+            created_at=attempt.created_at,
+            mastery_score=mastery.mastery_score,
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    # Learning selection policies see every answer, not only adaptive submissions.
+    if previous_score is not None:
+        observe_answer(
+            data.user_id,
+            topic_id=topic_id,
+            exercise_id=data.exercise_id,
+            is_correct=data.is_correct,
+            mastery_gain=response.mastery_score - previous_score,
+        )
+    return response
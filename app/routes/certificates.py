@@ -2,7 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from app.core.database import get_db
-from app.schemas.certificate import CertificateVerifyOut
+from app.schemas.certificate import CertificatePathOut, CertificateVerifyOut
+from app.services.certificate_path import plan_certificate_path
 from app.services.certificate_service import verify_certificate_hash
 
 router = APIRouter(tags=['Certificates'])
@@ -18,3 +19,9 @@ def verify_certificate(certificate_hash: str, db: Session = Depends(get_db)):
             detail='Certificate not found',
         )
     return CertificateVerifyOut.model_validate(certificate)
+
+
+@router.get('/certificate_path', response_model=CertificatePathOut)
+def read_certificate_path(user_id: int, subject_id: int, db: Session = Depends(get_db)):
+    """Topics the user still has to master, in order, to earn the subject certificate."""
+    return CertificatePathOut.model_validate(plan_certificate_path(db, user_id=user_id, subject_id=subject_id))
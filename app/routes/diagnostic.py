@@ -2,9 +2,9 @@ from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 
 from app.core.database import get_db
-from app.models.topic import Topic
 from app.schemas.diagnostic import BranchLevelOut
-from app.services.diagnostic_engine import calculate_branch_level
+from app.services.adaptation_engine import AdaptiveScope
+from app.services.diagnostic_engine import calculate_branch_level, resolve_branch_topic_ids
 
 router = APIRouter(prefix='/diagnostic', tags=['Diagnostic'])
 
@@ -13,13 +13,13 @@ router = APIRouter(prefix='/diagnostic', tags=['Diagnostic'])
 def get_branch_level(
     user_id: int,
     topic_ids: list[int] | None = Query(default=None),
+    subject_id: int | None = None,
+    pathway_id: int | None = None,
+    module_id: int | None = None,
     db: Session = Depends(get_db),
 ):
     """Return a coarse branch level based on average mastery."""
-    if topic_ids is None:
-        resolved_topic_ids = [topic.id for topic in db.query(Topic).all()]
-    else:
-        resolved_topic_ids = topic_ids
-
-    level = calculate_branch_level(db, user_id=user_id, topic_ids=resolved_topic_ids)
+    scope = AdaptiveScope(subject_id=subject_id, pathway_id=pathway_id, module_id=module_id)
+    level = calculate_branch_level(db, user_id=user_id, topic_ids=topic_ids, scope=scope)
+    resolved_topic_ids = topic_ids if topic_ids is not None else resolve_branch_topic_ids(db, scope)
     return BranchLevelOut(user_id=user_id, topic_ids=resolved_topic_ids, branch_level=level)
@@ -2,9 +2,17 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 
 from app.core.database import get_db
+from app.core.security import require_admin
 from app.models.topic import Topic
 from app.models.topic_dependency import TopicDependency
-from app.schemas.topic import TopicOut
+from app.schemas.topic import (
+    TopicDependencyBulkCreate,
+    TopicDependencyBulkResult,
+    TopicOut,
+    TopicPrerequisitesOut,
+)
+from app.schemas.user import UserOut
+from app.services.topic_graph_service import get_all_prerequisites, import_topic_dependencies
 
 router = APIRouter(prefix='/topics', tags=['Topics'])
 
@@ -29,3 +37,19 @@ def list_topics(db: Session = Depends(get_db)):
         )
         for topic in topics
     ]
+
+
+@router.get('/{topic_id}/prerequisites', response_model=TopicPrerequisitesOut)
+def list_all_prerequisites(topic_id: int, db: Session = Depends(get_db)):
+    """Return every direct and indirect prerequisite of a topic."""
+    return TopicPrerequisitesOut(topic_id=topic_id, prerequisites=get_all_prerequisites(db, topic_id))
+
+
+@router.post('/dependencies/bulk', response_model=TopicDependencyBulkResult)
+def import_dependencies(
+    data: TopicDependencyBulkCreate,
+    db: Session = Depends(get_db),
+    admin_user: UserOut = Depends(require_admin),
+):
+    """Validate and import a batch of prerequisite edges (admin only)."""
+    return import_topic_dependencies(db, data.edges)
@@ -44,8 +44,14 @@ def get_user_progress(
     mastery_rows = get_user_mastery(db, user_id)
     return UserProgressOut(
         user_id=user_id,
+        completed_topics=sum(1 for row in mastery_rows if row.is_completed),
         mastery=[
-            UserMasteryOut(topic_id=row.topic_id, mastery_score=row.mastery_score)
+            UserMasteryOut(
+                topic_id=row.topic_id,
+                mastery_score=row.mastery_score,
+                is_completed=row.is_completed,
+                review_priority=row.review_priority,
+            )
             for row in mastery_rows
         ],
     )
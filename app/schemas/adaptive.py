@@ -0,0 +1,42 @@
+from pydantic import BaseModel, Field
+
+
+class StageTimingOut(BaseModel):
+    """Wall time and SQL statements of one adaptive selection stage."""
+
+    name: str
+    elapsed_ms: float
+    statements: int
+
+    class Config:
+        from_attributes = True
+
+
+class RankedTopicOut(BaseModel):
+    """Urgency components of a candidate topic."""
+
+    topic_id: int
+    mastery_score: float
+    threshold: float
+    criticality_weight: float
+    weakness: float
+    review_priority: float
+    urgency: float
+    completed: bool
+
+    class Config:
+        from_attributes = True
+
+
+class RecommendationExplainOut(BaseModel):
+    """What the adaptive engine did for one user and what each stage cost."""
+
+    user_id: int
+    unlocked_topic_ids: list[int] = Field(default_factory=list)
+    reinforcement_topic_ids: list[int] = Field(default_factory=list)
+    ranked_topics: list[RankedTopicOut] = Field(default_factory=list)
+    picked_exercise_id: int | None = None
+    used_fallback: bool = False
+    stages: list[StageTimingOut] = Field(default_factory=list)
+    total_ms: float
+    total_statements: int
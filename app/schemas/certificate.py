@@ -16,3 +16,31 @@ class CertificateVerifyOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class CertificatePathStepOut(BaseModel):
+    """One topic still to master on the way to a certificate."""
+
+    topic_id: int
+    current_score: float
+    target_score: float
+    reason: str
+    depth: int
+    prerequisite_ids: list[int]
+
+    class Config:
+        from_attributes = True
+
+
+class CertificatePathOut(BaseModel):
+    """Remaining topics, in prerequisite order, before a subject certificate."""
+
+    subject_id: int
+    completed: bool
+    weighted_average: float
+    projected_average: float
+    certificate_threshold: float
+    steps: list[CertificatePathStepOut]
+
+    class Config:
+        from_attributes = True
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from pydantic import BaseModel
 
 
@@ -6,6 +8,8 @@ class UserMasteryOut(BaseModel):
 
     topic_id: int
     mastery_score: float
+    is_completed: bool = False
+    review_priority: float | None = None
 
     class Config:
         from_attributes = True
@@ -15,4 +19,14 @@ class UserProgressOut(BaseModel):
     """Aggregated mastery progress for a user."""
 
     user_id: int
+    completed_topics: int = 0
     mastery: list[UserMasteryOut]
+
+
+class DueReviewOut(BaseModel):
+    """A topic whose spaced-repetition review is due."""
+
+    topic_id: int
+    mastery_score: float
+    next_review_at: datetime
+    overdue_days: float
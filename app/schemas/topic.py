@@ -12,3 +12,30 @@ class TopicOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class TopicDependencyIn(BaseModel):
+    """Directed prerequisite edge: `topic_id` depends on `depends_on_id`."""
+
+    topic_id: int
+    depends_on_id: int
+
+
+class TopicDependencyBulkCreate(BaseModel):
+    """Batch of prerequisite edges validated and imported together."""
+
+    edges: list[TopicDependencyIn] = Field(min_length=1)
+
+
+class TopicDependencyBulkResult(BaseModel):
+    """Outcome of a bulk dependency import."""
+
+    created: int
+    skipped: int
+
+
+class TopicPrerequisitesOut(BaseModel):
+    """All direct and indirect prerequisites of a topic."""
+
+    topic_id: int
+    prerequisites: list[int]
@@ -1,51 +1,52 @@
 from __future__ import annotations
 
-from datetime import datetime
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from typing import Protocol
 
+import numpy as np
+from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.models.exercise import Exercise
-from app.models.topic import Topic
-from app.models.topic_dependency import TopicDependency
-from app.services.mastery_engine import (
-    get_mastery_map,
-    get_mastery_row,
-    get_topic_review_priority,
-    get_threshold,
-    has_passed_revalidation,
-    is_inactive,
-    is_topic_completed,
-    is_topic_in_development,
-    is_topic_ready_for_unlock,
-)
+from app.models.user_mastery import UserMastery
+from app.services.curriculum_graph import CurriculumGraph, ExerciseIndex, TopicNode, get_curriculum_graph
+from app.services.daily_plan import get_active_daily_plan
+from app.services.learning_state import UserLearningState, load_user_learning_state
+from app.services.mastery_engine import _utcnow, initial_mastery_score
+from app.services.recommendation_cache import recommendation_cache
+from app.services.recommendation_trace import RankedTopic, SelectionTrace, trace_stage
+from app.services.scoring_kernel import rank_topics, review_priorities, topic_urgency
+from app.services.unlock_frontier import UnlockFrontierCache, unlock_frontiers
 
 MIN_DIFFICULTY = 0.1
 MAX_DIFFICULTY = 2.0
 TARGET_DIFFICULTY_GAP = 0.15
+ENGINE_MODE_PYTHON = 'python'
+ENGINE_MODE_SQL = 'sql'
+POLICY_HEURISTIC = 'heuristic'
 
 
-def _dependency_map(db: Session) -> dict[int, list[int]]:
-    """Build a map of topic_id to prerequisite topic_ids."""
-    dependencies: dict[int, list[int]] = {}
-    for dep in db.query(TopicDependency).all():
-        dependencies.setdefault(dep.topic_id, []).append(dep.depends_on_id)
-    return dependencies
+@dataclass(frozen=True)
+class AdaptiveScope:
+    """Optional catalog scope for adaptive selection; all None means every subject."""
 
+    subject_id: int | None = None
+    pathway_id: int | None = None
+    module_id: int | None = None
+
+    def is_global(self) -> bool:
+        return self.subject_id is None and self.pathway_id is None and self.module_id is None
 
-def _is_unlocked_with_thresholds(
-    db: Session,
-    user_id: int,
-    topic: Topic,
-    deps: dict[int, list[int]],
-) -> bool:
-    """Dependencies are unlocked only if each prerequisite is ready for unlock."""
-    for prereq_id in deps.get(topic.id, []):
-        prereq_topic = db.query(Topic).filter(Topic.id == prereq_id).first()
-        if prereq_topic is None:
-            return False
-        if not is_topic_ready_for_unlock(db, user_id=user_id, topic=prereq_topic):
-            return False
-    return True
+
+@dataclass(frozen=True)
+class ResolvedScope:
+    """Subject partition to run the engine on and the topics it may serve."""
+
+    graph: CurriculumGraph
+    topic_ids: frozenset[int] | None
 
 
 def _clamp(value: float, min_value: float, max_value: float) -> float:
@@ -53,137 +54,539 @@ def _clamp(value: float, min_value: float, max_value: float) -> float:
     return max(min_value, min(max_value, value))
 
 
-def _topic_priority(topic: Topic, mastery_map: dict[int, float]) -> tuple[float, float, int]:
-    """Base priority components from mastery gap and criticality."""
-    mastery = _clamp(float(mastery_map.get(topic.id, 0.0)), 0.0, 1.0)
-    criticality = max(1, int(getattr(topic, 'criticality_level', 1) or 1))
-    threshold = get_threshold(topic.subject, criticality)
-    weakness = max(0.0, threshold - mastery)
-    weighted_weakness = weakness * criticality
-    return weighted_weakness, weakness, criticality
-
-
-def _pick_exercise_for_topic(
-    db: Session,
-    topic: Topic,
+def _exercise_score(
+    difficulty: float,
+    exercise_id: int,
+    topic_mastery: float,
+    target_difficulty: float,
+    review_priority: float,
+) -> tuple[float, float, float, int]:
+    """Ordering key for an exercise: lower is better."""
+    if topic_mastery < 0.3:
+        # Early stage: prefer easier exercises first.
+        direction_penalty = max(0.0, difficulty - target_difficulty)
+        tie_breaker = difficulty
+    elif topic_mastery > 0.7:
+        # Advanced stage: prefer harder exercises first.
+        direction_penalty = max(0.0, target_difficulty - difficulty)
+        tie_breaker = -difficulty
+    else:
+        direction_penalty = 0.0
+        tie_breaker = abs(difficulty - target_difficulty)
+
+    # Higher review priority makes close-to-target items more urgent.
+    priority_weight = 1.0 / (1.0 + max(0.0, review_priority))
+    proximity = abs(difficulty - target_difficulty) * priority_weight
+
+    return (direction_penalty, proximity, tie_breaker, exercise_id)
+
+
+def _pick_exercise_id(
+    index: ExerciseIndex,
     mastery_score: float,
     review_priority: float,
-) -> Exercise | None:
-    """Select exercise around target difficulty with mastery-aware direction preference."""
-    topic_mastery = _clamp(float(mastery_score), 0.0, 1.0)
-    target_difficulty = _clamp(topic_mastery + TARGET_DIFFICULTY_GAP, MIN_DIFFICULTY, MAX_DIFFICULTY)
+) -> int | None:
+    """Bisect the topic's difficulty index for the best-scoring exercise id.
 
-    exercises = db.query(Exercise).filter(Exercise.topic_id == topic.id).all()
-    if not exercises:
+    Only the exercises adjacent to the target difficulty can minimize the
+    score, so at most two runs of equal difficulty are compared.
+    """
+    difficulties = index.difficulties
+    if not difficulties:
         return None
 
-    def score(exercise: Exercise) -> tuple[float, float, float, int]:
-        difficulty = _clamp(float(getattr(exercise, 'difficulty', 1.0) or 1.0), MIN_DIFFICULTY, MAX_DIFFICULTY)
-
-        if topic_mastery < 0.3:
-            # Early stage: prefer easier exercises first.
-            direction_penalty = max(0.0, difficulty - target_difficulty)
-            tie_breaker = difficulty
-        elif topic_mastery > 0.7:
-            # Advanced stage: prefer harder exercises first.
-            direction_penalty = max(0.0, target_difficulty - difficulty)
-            tie_breaker = -difficulty
-        else:
-            direction_penalty = 0.0
-            tie_breaker = abs(difficulty - target_difficulty)
-
-        # Higher review priority makes close-to-target items more urgent.
-        priority_weight = 1.0 / (1.0 + max(0.0, review_priority))
-        proximity = abs(difficulty - target_difficulty) * priority_weight
-
-        return (direction_penalty, proximity, tie_breaker, int(exercise.id))
+    topic_mastery = _clamp(float(mastery_score), 0.0, 1.0)
+    target_difficulty = _clamp(topic_mastery + TARGET_DIFFICULTY_GAP, MIN_DIFFICULTY, MAX_DIFFICULTY)
 
-    return min(exercises, key=score)
+    def run_start(position: int) -> int:
+        # Entries share a difficulty in id order, so the first of the run has the lowest id.
+        return bisect_left(difficulties, difficulties[position])
+
+    if topic_mastery < 0.3:
+        below = bisect_right(difficulties, target_difficulty)
+        candidates = [run_start(below - 1)] if below > 0 else [0]
+    elif topic_mastery > 0.7:
+        above = bisect_left(difficulties, target_difficulty)
+        candidates = [above] if above < len(difficulties) else [run_start(len(difficulties) - 1)]
+    else:
+        above = bisect_left(difficulties, target_difficulty)
+        candidates = []
+        if above < len(difficulties):
+            candidates.append(above)
+        if above > 0:
+            candidates.append(run_start(above - 1))
+
+    best = min(
+        candidates,
+        key=lambda position: _exercise_score(
+            difficulties[position],
+            index.exercise_ids[position],
+            topic_mastery,
+            target_difficulty,
+            review_priority,
+        ),
+    )
+    return index.exercise_ids[best]
 
 
 def _mandatory_reinforcement_topics(
-    db: Session,
-    user_id: int,
-    topics: list[Topic],
-    mastery_map: dict[int, float],
-) -> list[Topic]:
+    state: UserLearningState,
+    topics: list[TopicNode],
+) -> list[TopicNode]:
     """Return topics that must be reinforced before unlocking dependent topics.
 
     Reinforcement is mandatory for:
     - Topics in development range [0.5, threshold)
     - Topics that became stale and still need revalidation attempts
     """
-    reinforcement: list[Topic] = []
-    for topic in topics:
-        score = float(mastery_map.get(topic.id, 0.0))
-        in_development = is_topic_in_development(
-            subject=topic.subject,
-            criticality=int(topic.criticality_level),
-            mastery_score=score,
-        )
+    return [topic for topic in topics if state.needs_reinforcement(topic)]
 
-        stale_needs_revalidation = False
-        mastery = get_mastery_row(db, user_id=user_id, topic_id=topic.id)
-        if mastery is not None and is_inactive(mastery, now=datetime.utcnow()):
-            stale_needs_revalidation = not has_passed_revalidation(
-                db,
-                user_id=user_id,
-                topic_id=topic.id,
+
+class SelectionPolicy(Protocol):
+    """Chooses what to serve among a learner's unlocked topics.
+
+    The engine owns loading, unlock rules, scoping and the fallback; a
+    policy only maps (catalog, learner state, unlocked topics) to an
+    exercise id and may learn from the outcomes reported to `observe`.
+    Policies whose `observe` is a no-op set `observes_answers` to False so
+    submissions skip measuring the mastery gain.
+    """
+
+    name: str
+    observes_answers: bool
+
+    def choose_exercise_id(
+        self,
+        graph: CurriculumGraph,
+        state: UserLearningState,
+        unlocked_topics: list[TopicNode],
+        trace: SelectionTrace | None = None,
+    ) -> int | None: ...
+
+    def observe(self, user_id: int, topic_id: int, exercise_id: int, is_correct: bool, mastery_gain: float) -> None: ...
+
+
+class HeuristicPolicy:
+    """Mandatory reinforcement, then urgency ranking and the target-difficulty pick."""
+
+    name = POLICY_HEURISTIC
+    observes_answers = False
+
+    def choose_exercise_id(
+        self,
+        graph: CurriculumGraph,
+        state: UserLearningState,
+        unlocked_topics: list[TopicNode],
+        trace: SelectionTrace | None = None,
+    ) -> int | None:
+        with trace_stage(trace, 'reinforcement'):
+            reinforcement_topics = _mandatory_reinforcement_topics(state, topics=unlocked_topics)
+            candidate_topics = reinforcement_topics if reinforcement_topics else unlocked_topics
+            if trace is not None:
+                trace.reinforcement_topic_ids = [topic.id for topic in reinforcement_topics]
+
+        with trace_stage(trace, 'ranking'):
+            candidate_ids = [topic.id for topic in candidate_topics]
+            columns = np.array([graph.topic_positions[topic_id] for topic_id in candidate_ids], dtype=np.intp)
+            mastery, elapsed_days, stored = state.review_inputs(candidate_ids)
+            review = review_priorities(mastery, elapsed_days, stored)
+            order = rank_topics(
+                graph.topic_id_array[columns],
+                mastery,
+                graph.criticality_weights[columns],
+                graph.thresholds[columns],
+                review,
             )
+            if trace is not None:
+                trace.ranked_topics = _ranked_topic_details(graph, columns, mastery, review, order)
+
+        with trace_stage(trace, 'exercise_pick'):
+            for position in order:
+                index = graph.exercise_index.get(candidate_topics[position].id)
+                if index is None:
+                    continue
+                exercise_id = _pick_exercise_id(
+                    index,
+                    mastery_score=_clamp(float(mastery[position]), 0.0, 1.0),
+                    review_priority=float(review[position]),
+                )
+                if exercise_id is not None:
+                    return exercise_id
+        return None
+
+    def observe(self, user_id: int, topic_id: int, exercise_id: int, is_correct: bool, mastery_gain: float) -> None:
+        """The heuristic is stateless."""
+
+
+heuristic_policy = HeuristicPolicy()
+
+
+def observe_answer(user_id: int, topic_id: int, exercise_id: int, is_correct: bool, mastery_gain: float) -> None:
+    """Report a submitted answer to the configured policy so learning policies can update."""
+    _configured_policy().observe(user_id, topic_id, exercise_id, is_correct, mastery_gain)
 
-        if in_development or stale_needs_revalidation:
-            reinforcement.append(topic)
-    return reinforcement
 
+def mastery_before_answer(db: Session, user_id: int, topic_id: int, subject_id: int | None) -> float | None:
+    """Score the configured policy's reward is measured from, or None when it ignores answers.
 
-def select_next_exercise(db: Session, user_id: int) -> Exercise | None:
-    """Select next exercise using completion, review priority, and target difficulty."""
-    topics = db.query(Topic).all()
-    if not topics:
+    Read before the answer is applied; a topic without a row starts from its initial score.
+    """
+    if not _configured_policy().observes_answers:
         return None
+    score = (
+        db.query(UserMastery.mastery_score)
+        .filter(UserMastery.user_id == user_id, UserMastery.topic_id == topic_id)
+        .scalar()
+    )
+    return float(score) if score is not None else initial_mastery_score(subject_id, topic_id)
 
-    mastery_map = get_mastery_map(db, user_id)
-    deps = _dependency_map(db)
 
-    unlocked_topics = [
-        topic
-        for topic in topics
-        if _is_unlocked_with_thresholds(db, user_id=user_id, topic=topic, deps=deps)
-    ]
-    if not unlocked_topics:
-        unlocked_topics = topics
+def _configured_policy() -> SelectionPolicy:
+    # Imported here because the alternative policies build on this module.
+    from app.services.selection_policies import get_selection_policy
+
+    return get_selection_policy(settings.ADAPTIVE_SELECTION_POLICY)
+
+
+def resolve_scope(graph: CurriculumGraph, scope: AdaptiveScope | None) -> ResolvedScope:
+    """Map a requested scope onto a subject partition and its servable topics.
+
+    Pathway and module scopes still run on their whole subject, because
+    prerequisites may live in other modules of the same subject.
+    """
+    if scope is None or scope.is_global():
+        return ResolvedScope(graph=graph, topic_ids=None)
+
+    if scope.subject_id is not None and scope.subject_id not in graph.subjects:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Subject not found')
+    if scope.pathway_id is not None and scope.pathway_id not in graph.pathway_subjects:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Pathway not found')
+    if scope.module_id is not None and scope.module_id not in graph.module_pathways:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Module not found')
+
+    subject_id = scope.subject_id
+    topic_ids: frozenset[int] | None = None
+    if scope.subject_id is not None:
+        topic_ids = frozenset(graph.topics_by_subject.get(scope.subject_id, ()))
+    if scope.pathway_id is not None:
+        pathway_topics = frozenset(graph.topics_by_pathway.get(scope.pathway_id, ()))
+        topic_ids = pathway_topics if topic_ids is None else topic_ids & pathway_topics
+        if subject_id is None:
+            subject_id = graph.pathway_subjects[scope.pathway_id]
+    if scope.module_id is not None:
+        module_topics = frozenset(graph.topics_by_module.get(scope.module_id, ()))
+        topic_ids = module_topics if topic_ids is None else topic_ids & module_topics
+        if subject_id is None:
+            pathway_id = graph.module_pathways[scope.module_id]
+            if pathway_id is not None:
+                subject_id = graph.pathway_subjects.get(pathway_id)
+            elif module_topics:
+                subject_id = graph.topics[min(module_topics)].subject_id
+
+    if subject_id is None:
+        return ResolvedScope(graph=graph, topic_ids=frozenset())
+    return ResolvedScope(graph=graph.for_subject(subject_id), topic_ids=topic_ids)
+
+
+def select_next_exercise(db: Session, user_id: int, scope: AdaptiveScope | None = None) -> Exercise | None:
+    """Select next exercise using completion, review priority, and target difficulty.
+
+    The Python engine delegates the choice to the configured selection
+    policy; the SQL engine always implements the heuristic.
+    """
+    resolved = resolve_scope(get_curriculum_graph(db), scope)
+    if not resolved.graph.topic_ids:
+        return None
+    if settings.ADAPTIVE_ENGINE_MODE == ENGINE_MODE_SQL:
+        return _select_with_sql(db, user_id, resolved)
+    state = load_user_learning_state(db, user_id, subject_id=resolved.graph.subject_id)
+    return _select_from_state(
+        db,
+        resolved.graph,
+        state,
+        scope_topic_ids=resolved.topic_ids,
+        policy=_configured_policy(),
+    )
+
 
-    reinforcement_topics = _mandatory_reinforcement_topics(
+def recommend_next_exercise(db: Session, user_id: int, scope: AdaptiveScope | None = None) -> Exercise | None:
+    """Cached front door for `select_next_exercise` used by the API routes.
+
+    Unscoped requests are served from the user's precomputed daily plan
+    until their first submission of the day. In SQL engine mode every
+    call is already a single round trip, so the cache (whose validity needs
+    the loaded learning state) is bypassed.
+    """
+    resolved = resolve_scope(get_curriculum_graph(db), scope)
+    graph = resolved.graph
+    cache_scope = None if scope is None or scope.is_global() else scope
+    now = _utcnow()
+    if settings.ADAPTIVE_ENGINE_MODE == ENGINE_MODE_SQL:
+        planned = _planned_exercise(db, user_id, now) if cache_scope is None else None
+        if planned is not None:
+            return planned
+        return _select_with_sql(db, user_id, resolved) if graph.topic_ids else None
+
+    # Read before any state is loaded, so a write that lands meanwhile voids the `put` below.
+    generation = recommendation_cache.generation(user_id)
+    cached = recommendation_cache.get(user_id, graph_version=graph.version, now=now, scope=cache_scope)
+    if cached is not None:
+        exercise = db.get(Exercise, cached.exercise_id)
+        if exercise is not None:
+            return exercise
+
+    if cache_scope is None:
+        planned = _planned_exercise(db, user_id, now)
+        if planned is not None:
+            recommendation_cache.put(
+                user_id,
+                exercise_id=int(planned.id),
+                graph_version=graph.version,
+                generation=generation,
+                valid_until=datetime.combine(now.date() + timedelta(days=1), time.min),
+            )
+            return planned
+
+    if not graph.topic_ids:
+        return None
+    state = load_user_learning_state(db, user_id, now=now, subject_id=graph.subject_id)
+    exercise = _select_from_state(
         db,
-        user_id=user_id,
-        topics=unlocked_topics,
-        mastery_map=mastery_map,
+        graph,
+        state,
+        scope_topic_ids=resolved.topic_ids,
+        policy=_configured_policy(),
     )
-    candidate_topics = reinforcement_topics if reinforcement_topics else unlocked_topics
+    if exercise is not None:
+        recommendation_cache.put(
+            user_id,
+            exercise_id=int(exercise.id),
+            graph_version=graph.version,
+            generation=generation,
+            valid_until=state.next_transition_at(),
+            scope=cache_scope,
+        )
+    return exercise
 
-    ranked_topics: list[tuple[int, float, float, int, Topic]] = []
-    for topic in candidate_topics:
-        mastery_score = _clamp(float(mastery_map.get(topic.id, 0.0)), 0.0, 1.0)
-        weighted_weakness, weakness, criticality = _topic_priority(topic, mastery_map)
-        review_priority = get_topic_review_priority(db, user_id=user_id, topic_id=topic.id)
-        completion_rank = 1 if is_topic_completed(mastery_score) else 0
 
-        # Higher urgency first: incomplete topics, then weak+critical with spaced-repetition signal.
-        urgency = (weighted_weakness + weakness + review_priority) * (1.0 + criticality * 0.1)
-        ranked_topics.append((completion_rank, -urgency, -criticality, int(topic.id), topic))
+def recommend_practice_queue(
+    db: Session,
+    user_id: int,
+    size: int,
+    assume_correct: bool = True,
+    scope: AdaptiveScope | None = None,
+) -> list[Exercise]:
+    """Front door for `build_practice_queue` used by the API routes.
+
+    Unscoped all-correct queues are served from the user's precomputed
+    daily plan until their first submission of the day, when the plan is
+    long enough; the plan job builds it the same way.
+    """
+    if assume_correct and (scope is None or scope.is_global()):
+        plan = get_active_daily_plan(db, user_id, today=_utcnow().date())
+        if plan is not None and len(plan.exercise_ids) >= size:
+            planned_ids = [int(exercise_id) for exercise_id in plan.exercise_ids[:size]]
+            exercises = {
+                int(exercise.id): exercise for exercise in db.query(Exercise).filter(Exercise.id.in_(planned_ids))
+            }
+            if len(exercises) == len(set(planned_ids)):
+                return [exercises[exercise_id] for exercise_id in planned_ids]
+    return build_practice_queue(db, user_id, size=size, assume_correct=assume_correct, scope=scope)
+
+
+def _planned_exercise(db: Session, user_id: int, now: datetime) -> Exercise | None:
+    """First exercise of today's precomputed plan, if it is still valid."""
+    plan = get_active_daily_plan(db, user_id, today=now.date())
+    if plan is None or not plan.exercise_ids:
+        return None
+    return db.get(Exercise, int(plan.exercise_ids[0]))
+
+
+def explain_next_exercise(db: Session, user_id: int, scope: AdaptiveScope | None = None) -> SelectionTrace:
+    """Run the Python engine uncached and return what each stage did and cost."""
+    trace = SelectionTrace()
+    with trace.capture_statements(db):
+        with trace.stage('load'):
+            resolved = resolve_scope(get_curriculum_graph(db), scope)
+            state = load_user_learning_state(db, user_id, subject_id=resolved.graph.subject_id)
+        if resolved.graph.topic_ids:
+            # A private frontier so the unlock stage shows its full cost.
+            _select_from_state(
+                db,
+                resolved.graph,
+                state,
+                frontiers=UnlockFrontierCache(maxsize=1),
+                scope_topic_ids=resolved.topic_ids,
+                trace=trace,
+                policy=_configured_policy(),
+            )
+    return trace
+
+
+def _select_with_sql(db: Session, user_id: int, resolved: ResolvedScope) -> Exercise | None:
+    # Imported here because the SQL engine reuses this module's constants.
+    from app.services.sql_ranking import select_next_exercise_sql
+
+    return select_next_exercise_sql(
+        db,
+        user_id,
+        subject_id=resolved.graph.subject_id,
+        scope_topic_ids=resolved.topic_ids,
+    )
 
-    ranked_topics.sort(key=lambda item: (item[0], item[1], item[2], item[3]))
 
-    for _, _, _, _, topic in ranked_topics:
-        mastery_score = _clamp(float(mastery_map.get(topic.id, 0.0)), 0.0, 1.0)
-        review_priority = get_topic_review_priority(db, user_id=user_id, topic_id=topic.id)
-        exercise = _pick_exercise_for_topic(
+def build_practice_queue(
+    db: Session,
+    user_id: int,
+    size: int,
+    assume_correct: bool = True,
+    scope: AdaptiveScope | None = None,
+    policy: SelectionPolicy | None = None,
+) -> list[Exercise]:
+    """Return the next `size` exercises the engine would serve in a row.
+
+    Each pick is followed by a simulated answer (all correct or all wrong)
+    applied to an in-memory copy of the learner state, so clients can
+    prefetch a short session and re-sync after answering it. Picks come
+    from `policy`, by default the configured selection policy.
+    """
+    resolved = resolve_scope(get_curriculum_graph(db), scope)
+    graph = resolved.graph
+    if not graph.topic_ids:
+        return []
+    state = load_user_learning_state(db, user_id, subject_id=graph.subject_id).detached_copy()
+    # Simulated readiness must not leak into the shared per-user frontier.
+    frontiers = UnlockFrontierCache(maxsize=1)
+    policy = policy or _configured_policy()
+
+    queue: list[Exercise] = []
+    for _ in range(size):
+        exercise = _select_from_state(
             db,
-            topic=topic,
-            mastery_score=mastery_score,
-            review_priority=review_priority,
+            graph,
+            state,
+            frontiers=frontiers,
+            scope_topic_ids=resolved.topic_ids,
+            policy=policy,
         )
+        if exercise is None:
+            break
+        queue.append(exercise)
+        topic = graph.topics.get(int(exercise.topic_id))
+        if topic is None:
+            break
+        state.apply_answer(topic, is_correct=assume_correct, difficulty=float(exercise.difficulty), at=state.now)
+    return queue
+
+
+def _select_from_state(
+    db: Session,
+    graph: CurriculumGraph,
+    state: UserLearningState,
+    frontiers: UnlockFrontierCache = unlock_frontiers,
+    scope_topic_ids: frozenset[int] | None = None,
+    trace: SelectionTrace | None = None,
+    policy: SelectionPolicy | None = None,
+) -> Exercise | None:
+    """Run the unlock stage, then let the policy pick among the unlocked topics.
+
+    `scope_topic_ids` restricts the topics that may be served; unlock rules
+    are still evaluated over the whole graph. When a `trace` is given, each
+    stage and its intermediate results are recorded on it. Without a
+    `policy` the heuristic is used.
+    """
+    unlocked_topics = _unlocked_topics(graph, state, frontiers, scope_topic_ids, trace)
+    if not unlocked_topics:
+        return _fallback_exercise(db, graph, scope_topic_ids, trace)
+
+    exercise_id = (policy or heuristic_policy).choose_exercise_id(graph, state, unlocked_topics, trace=trace)
+    if exercise_id is not None:
+        with trace_stage(trace, 'exercise_load'):
+            exercise = db.get(Exercise, exercise_id)
         if exercise is not None:
+            if trace is not None:
+                trace.picked_exercise_id = int(exercise.id)
             return exercise
 
-    return db.query(Exercise).order_by(Exercise.id).first()
+    return _fallback_exercise(db, graph, scope_topic_ids, trace)
+
+
+def _unlocked_topics(
+    graph: CurriculumGraph,
+    state: UserLearningState,
+    frontiers: UnlockFrontierCache,
+    scope_topic_ids: frozenset[int] | None = None,
+    trace: SelectionTrace | None = None,
+) -> list[TopicNode]:
+    """Servable unlocked topics in id order; nothing unlocked opens every topic."""
+    topics = graph.topic_list()
+    with trace_stage(trace, 'unlock'):
+        unlocked_ids = frontiers.unlocked_topic_ids(graph, state)
+        unlocked_topics = [topic for topic in topics if topic.id in unlocked_ids]
+        if not unlocked_topics:
+            unlocked_topics = topics
+        if scope_topic_ids is not None:
+            unlocked_topics = [topic for topic in unlocked_topics if topic.id in scope_topic_ids]
+        if trace is not None:
+            trace.unlocked_topic_ids = [topic.id for topic in unlocked_topics]
+    return unlocked_topics
+
+
+def _ranked_topic_details(
+    graph: CurriculumGraph,
+    columns: np.ndarray,
+    mastery: np.ndarray,
+    review: np.ndarray,
+    order: np.ndarray,
+) -> list[RankedTopic]:
+    """Expand the kernel inputs of the ranked candidates for the explain output."""
+    weights = graph.criticality_weights[columns]
+    thresholds = graph.thresholds[columns]
+    urgency, completion_rank = topic_urgency(mastery, weights, thresholds, review)
+    weakness = np.maximum(0.0, thresholds - np.clip(mastery, 0.0, 1.0))
+    return [
+        RankedTopic(
+            topic_id=int(graph.topic_id_array[columns[position]]),
+            mastery_score=float(mastery[position]),
+            threshold=float(thresholds[position]),
+            criticality_weight=float(weights[position]),
+            weakness=float(weakness[position]),
+            review_priority=float(review[position]),
+            urgency=float(urgency[position]),
+            completed=bool(completion_rank[position]),
+        )
+        for position in order
+    ]
+
+
+def _fallback_exercise(
+    db: Session,
+    graph: CurriculumGraph,
+    scope_topic_ids: frozenset[int] | None,
+    trace: SelectionTrace | None,
+) -> Exercise | None:
+    """Lowest-id exercise (within the scope) when no candidate topic has one."""
+    with trace_stage(trace, 'fallback'):
+        if scope_topic_ids is not None:
+            exercise = _first_exercise_in_scope(db, graph, scope_topic_ids)
+        else:
+            exercise = db.query(Exercise).order_by(Exercise.id).first()
+        if trace is not None:
+            trace.used_fallback = True
+            trace.picked_exercise_id = int(exercise.id) if exercise is not None else None
+    return exercise
+
+
+def _first_scope_exercise_id(graph: CurriculumGraph, scope_topic_ids: frozenset[int]) -> int | None:
+    """Lowest exercise id inside the scope, the scoped counterpart of the global fallback."""
+    exercise_ids = [
+        exercise_id
+        for topic_id in scope_topic_ids
+        for exercise_id in graph.exercise_ids.get(topic_id, ())[:1]
+    ]
+    return min(exercise_ids) if exercise_ids else None
+
+
+def _first_exercise_in_scope(db: Session, graph: CurriculumGraph, scope_topic_ids: frozenset[int]) -> Exercise | None:
+    exercise_id = _first_scope_exercise_id(graph, scope_topic_ids)
+    return db.get(Exercise, exercise_id) if exercise_id is not None else None
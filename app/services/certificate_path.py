@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.services.curriculum_graph import CurriculumGraph, get_curriculum_graph
+from app.services.learning_state import UserLearningState, load_user_learning_state
+from app.services.mastery_engine import _utcnow
+
+REASON_THRESHOLD = 'threshold'
+REASON_REVALIDATION = 'revalidation'
+REASON_AVERAGE = 'average'
+
+# Weighted-average shortfalls below this are rounding noise, not missing mastery.
+_AVERAGE_TOLERANCE = 1e-9
+
+
+@dataclass(frozen=True)
+class PlannedTopic:
+    """One topic the learner still has to work on, with the score to reach."""
+
+    topic_id: int
+    current_score: float
+    target_score: float
+    reason: str
+    depth: int
+    prerequisite_ids: tuple[int, ...]
+
+
+@dataclass(frozen=True)
+class CertificatePath:
+    """Remaining work between a learner and a subject certificate."""
+
+    subject_id: int
+    completed: bool
+    weighted_average: float
+    projected_average: float
+    certificate_threshold: float
+    steps: list[PlannedTopic]
+
+
+def _normalized_criticality(raw: int) -> int:
+    """Same weight as the certificate rules: criticality clamped to [1, 3]."""
+    return max(1, min(3, int(raw)))
+
+
+def _pending_reason(graph: CurriculumGraph, state: UserLearningState, topic_id: int) -> str | None:
+    """Why a topic blocks `is_subject_completed`, or None when it is already done."""
+    if topic_id not in state.mastery_rows or state.mastery_score(topic_id) < graph.topics[topic_id].threshold:
+        return REASON_THRESHOLD
+    if state.is_stale(topic_id) and not state.has_passed_revalidation(topic_id):
+        return REASON_REVALIDATION
+    return None
+
+
+def _raise_average(
+    targets: dict[int, float],
+    weights: dict[int, int],
+    certificate_threshold: float,
+) -> set[int]:
+    """Raise the fewest topics needed for the weighted average to reach the threshold.
+
+    Each topic can add at most `(1 - target) * weight`, so taking the largest
+    gains first minimizes how many topics have to move. Returns the raised ids.
+    """
+    total_weight = sum(weights.values())
+    missing = certificate_threshold * total_weight - sum(targets[topic_id] * weights[topic_id] for topic_id in targets)
+    raised: set[int] = set()
+    if missing <= _AVERAGE_TOLERANCE * total_weight:
+        return raised
+
+    gains = sorted(
+        (((1.0 - score) * weights[topic_id], topic_id) for topic_id, score in targets.items()),
+        key=lambda item: (-item[0], item[1]),
+    )
+    for gain, topic_id in gains:
+        if gain <= 0.0:
+            break
+        step = min(gain, missing)
+        targets[topic_id] += step / weights[topic_id]
+        raised.add(topic_id)
+        missing -= step
+        if missing <= _AVERAGE_TOLERANCE * total_weight:
+            break
+    return raised
+
+
+def _pending_depths(graph: CurriculumGraph, pending: set[int]) -> dict[int, int]:
+    """Longest chain of pending prerequisites under each pending topic.
+
+    Memoized post-order walk over the cached prerequisite edges; done topics
+    contribute nothing, and a cycle (which validation prevents) is cut where
+    it is re-entered.
+    """
+    depths: dict[int, int] = {}
+    visiting: set[int] = set()
+    for root in sorted(pending):
+        if root in depths:
+            continue
+        stack: list[tuple[int, bool]] = [(root, False)]
+        while stack:
+            topic_id, expanded = stack.pop()
+            prerequisites = [prereq for prereq in graph.prerequisites.get(topic_id, ()) if prereq in pending]
+            if expanded:
+                visiting.discard(topic_id)
+                depths[topic_id] = 1 + max((depths.get(prereq, -1) for prereq in prerequisites), default=-1)
+                continue
+            if topic_id in depths or topic_id in visiting:
+                continue
+            visiting.add(topic_id)
+            stack.append((topic_id, True))
+            stack.extend((prereq, False) for prereq in prerequisites if prereq not in depths)
+    return depths
+
+
+def plan_certificate_path(
+    db: Session,
+    user_id: int,
+    subject_id: int,
+    now: datetime | None = None,
+) -> CertificatePath:
+    """Minimal ordered set of topics to master before the subject certificate is earned.
+
+    Every topic must reach its criticality threshold (and be revalidated when
+    stale) exactly as `is_subject_completed` checks it; if the weighted
+    average at those targets is still below `certificate_threshold`, the
+    fewest extra topics are raised further. Steps come in prerequisite order.
+    The catalog comes from the cached graph, so the user state is the only
+    thing read from the database.
+    """
+    full_graph = get_curriculum_graph(db)
+    if subject_id not in full_graph.subjects:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Subject not found')
+    graph = full_graph.for_subject(subject_id)
+    certificate_threshold = graph.subjects[subject_id].certificate_threshold
+    if not graph.topic_ids:
+        return CertificatePath(
+            subject_id=subject_id,
+            completed=False,
+            weighted_average=0.0,
+            projected_average=0.0,
+            certificate_threshold=certificate_threshold,
+            steps=[],
+        )
+
+    state = load_user_learning_state(db, user_id, now=now or _utcnow(), subject_id=subject_id)
+    weights = {topic_id: _normalized_criticality(graph.topics[topic_id].criticality_level) for topic_id in graph.topic_ids}
+    total_weight = sum(weights.values())
+    current = {topic_id: state.mastery_score(topic_id) for topic_id in graph.topic_ids}
+    weighted_average = sum(current[topic_id] * weights[topic_id] for topic_id in graph.topic_ids) / total_weight
+
+    reasons: dict[int, str] = {}
+    targets = dict(current)
+    for topic_id in graph.topic_ids:
+        reason = _pending_reason(graph, state, topic_id)
+        if reason is not None:
+            reasons[topic_id] = reason
+            targets[topic_id] = max(current[topic_id], graph.topics[topic_id].threshold)
+    for topic_id in _raise_average(targets, weights, certificate_threshold):
+        reasons.setdefault(topic_id, REASON_AVERAGE)
+    projected_average = sum(targets[topic_id] * weights[topic_id] for topic_id in graph.topic_ids) / total_weight
+
+    pending = set(reasons)
+    depths = _pending_depths(graph, pending)
+    steps = [
+        PlannedTopic(
+            topic_id=topic_id,
+            current_score=current[topic_id],
+            target_score=min(1.0, targets[topic_id]),
+            reason=reasons[topic_id],
+            depth=depths[topic_id],
+            prerequisite_ids=tuple(prereq for prereq in graph.prerequisites.get(topic_id, ()) if prereq in pending),
+        )
+        for topic_id in pending
+    ]
+    steps.sort(key=lambda step: (step.depth, -weights[step.topic_id], step.topic_id))
+    return CertificatePath(
+        subject_id=subject_id,
+        completed=not steps,
+        weighted_average=weighted_average,
+        projected_average=projected_average,
+        certificate_threshold=certificate_threshold,
+        steps=steps,
+    )
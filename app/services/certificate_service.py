@@ -10,8 +10,8 @@ from app.models.topic import Topic
 from app.models.user_mastery import UserMastery
 from app.services.mastery_engine import (
     get_threshold,
-    has_passed_revalidation,
     is_inactive,
+    is_revalidated,
 )
 
 
@@ -100,11 +100,7 @@ def is_subject_completed(db: Session, user_id: int, subject: Subject) -> tuple[b
 
         if mastery_row is None:
             return False, 0.0
-        if is_inactive(mastery_row) and not has_passed_revalidation(
-            db,
-            user_id=user_id,
-            topic_id=topic.id,
-        ):
+        if is_inactive(mastery_row) and not is_revalidated(mastery_row):
             return False, 0.0
 
         weighted_sum += score * criticality
@@ -119,8 +115,17 @@ def is_subject_completed(db: Session, user_id: int, subject: Subject) -> tuple[b
     return True, weighted_average
 
 
-def ensure_subject_certificate(db: Session, user_id: int, subject_id: int) -> Certificate | None:
-    """Issue a certificate when a subject is completed and no valid one exists."""
+def ensure_subject_certificate(
+    db: Session,
+    user_id: int,
+    subject_id: int,
+    commit: bool = True,
+) -> Certificate | None:
+    """Issue a certificate when a subject is completed and no valid one exists.
+
+    With `commit=False` a new certificate is only flushed and joins the
+    caller's transaction.
+    """
     subject = db.query(Subject).filter(Subject.id == subject_id).first()
     if subject is None:
         return None
@@ -149,6 +154,9 @@ def ensure_subject_certificate(db: Session, user_id: int, subject_id: int) -> Ce
         status='valid',
     )
     db.add(certificate)
+    if not commit:
+        db.flush()
+        return certificate
     db.commit()
     db.refresh(certificate)
     return certificate
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models.exercise import Exercise
+from app.services.adaptation_engine import (
+    AdaptiveScope,
+    HeuristicPolicy,
+    _configured_policy,
+    _first_scope_exercise_id,
+    _pick_exercise_id,
+    _select_from_state,
+    resolve_scope,
+)
+from app.services.curriculum_graph import CurriculumGraph, get_curriculum_graph
+from app.services.learning_state import UserLearningState, load_cohort_learning_states
+from app.services.mastery_engine import IN_DEVELOPMENT_MIN, _utcnow
+from app.services.scoring_kernel import rank_topics, review_priorities
+
+
+def _state_matrices(
+    graph: CurriculumGraph,
+    user_ids: list[int],
+    states: dict[int, UserLearningState],
+) -> dict[str, np.ndarray]:
+    """Lay out per-user state as users x topics arrays aligned with `graph.topic_ids`."""
+    shape = (len(user_ids), len(graph.topic_ids))
+    score = np.zeros(shape)
+    elapsed_days = np.full(shape, np.nan)
+    stored = np.full(shape, np.nan)
+    has_row = np.zeros(shape, dtype=bool)
+    stale_unrevalidated = np.zeros(shape, dtype=bool)
+
+    for row_index, user_id in enumerate(user_ids):
+        state = states[user_id]
+        for topic_id, mastery in state.mastery_rows.items():
+            position = graph.topic_positions.get(topic_id)
+            if position is None:
+                continue
+            score[row_index, position], elapsed_days[row_index, position], stored[row_index, position] = (
+                state.row_inputs(mastery)
+            )
+            has_row[row_index, position] = True
+            stale_unrevalidated[row_index, position] = (
+                state.is_stale(topic_id) and not state.has_passed_revalidation(topic_id)
+            )
+
+    return {
+        'score': score,
+        'has_row': has_row,
+        'stale_unrevalidated': stale_unrevalidated,
+        'review': review_priorities(score, elapsed_days, stored),
+    }
+
+
+def _prerequisite_edges(graph: CurriculumGraph) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return (topic, prerequisite) column pairs and topics with missing prerequisites."""
+    column = {topic_id: position for position, topic_id in enumerate(graph.topic_ids)}
+    topic_positions: list[int] = []
+    prereq_positions: list[int] = []
+    missing = np.zeros(len(graph.topic_ids), dtype=bool)
+    for position, topic_id in enumerate(graph.topic_ids):
+        for prereq_id in graph.prerequisites.get(topic_id, ()):
+            prereq_position = column.get(prereq_id)
+            if prereq_position is None:
+                missing[position] = True
+            else:
+                topic_positions.append(position)
+                prereq_positions.append(prereq_position)
+    return (
+        np.array(topic_positions, dtype=np.intp),
+        np.array(prereq_positions, dtype=np.intp),
+        missing,
+    )
+
+
+def rank_cohort_topics(
+    graph: CurriculumGraph,
+    user_ids: list[int],
+    states: dict[int, UserLearningState],
+    scope_topic_ids: frozenset[int] | None = None,
+) -> tuple[np.ndarray, np.ndarray, dict[str, np.ndarray]]:
+    """Score every topic for every user at once.
+
+    Returns the per-user topic order (best first), a mask of topics that may
+    be served (candidate and with exercises), and the state matrices.
+    """
+    matrices = _state_matrices(graph, user_ids, states)
+    score = matrices['score']
+    threshold = graph.thresholds
+    has_exercises = np.array([topic_id in graph.exercise_index for topic_id in graph.topic_ids], dtype=bool)
+
+    in_development = (score >= IN_DEVELOPMENT_MIN) & (score < threshold)
+    ready = (
+        matrices['has_row']
+        & (score >= threshold)
+        & ~in_development
+        & ~matrices['stale_unrevalidated']
+    )
+
+    topic_positions, prereq_positions, missing = _prerequisite_edges(graph)
+    # Count not-ready prerequisites per (user, topic) by scattering over the edge list.
+    blocked = np.zeros(score.shape[::-1], dtype=np.int32)
+    np.add.at(blocked, topic_positions, (~ready).T[prereq_positions])
+    unlocked = (blocked.T == 0) & ~missing
+    # Nothing unlocked means every topic is open.
+    unlocked[~unlocked.any(axis=1)] = True
+    if scope_topic_ids is not None:
+        unlocked &= np.array([topic_id in scope_topic_ids for topic_id in graph.topic_ids], dtype=bool)
+
+    reinforcement = unlocked & (in_development | matrices['stale_unrevalidated'])
+    candidates = np.where(reinforcement.any(axis=1, keepdims=True), reinforcement, unlocked)
+
+    order = rank_topics(
+        graph.topic_id_array,
+        score,
+        graph.criticality_weights,
+        threshold,
+        matrices['review'],
+        excluded=~candidates,
+    )
+    return order, candidates & has_exercises, matrices
+
+
+def select_next_exercises_for_users(
+    db: Session,
+    user_ids: list[int],
+    scope: AdaptiveScope | None = None,
+) -> dict[int, Exercise | None]:
+    """Batch equivalent of `select_next_exercise` for a cohort of users.
+
+    The catalog snapshot, all mastery rows and the revalidation counts are
+    loaded once for the whole cohort and topics are scored as arrays. The
+    array path implements the heuristic; under any other configured policy
+    each user's choice is delegated to that policy over the shared state.
+    """
+    unique_ids = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+    resolved = resolve_scope(get_curriculum_graph(db), scope)
+    graph = resolved.graph
+    if not graph.topic_ids or not unique_ids:
+        return {user_id: None for user_id in unique_ids}
+
+    now = _utcnow()
+    states = load_cohort_learning_states(db, unique_ids, now=now, subject_id=graph.subject_id)
+    policy = _configured_policy()
+    if not isinstance(policy, HeuristicPolicy):
+        return {
+            user_id: _select_from_state(db, graph, states[user_id], scope_topic_ids=resolved.topic_ids, policy=policy)
+            for user_id in unique_ids
+        }
+
+    order, servable, matrices = rank_cohort_topics(graph, unique_ids, states, scope_topic_ids=resolved.topic_ids)
+
+    # Candidates sort first, so the first servable topic in order is the one to serve.
+    servable_in_order = np.take_along_axis(servable, order, axis=1)
+    first = servable_in_order.argmax(axis=1)
+    rows = np.arange(len(unique_ids))
+    best_position = order[rows, first]
+    has_choice = servable_in_order[rows, first]
+
+    if resolved.topic_ids is not None:
+        fallback_id = _first_scope_exercise_id(graph, resolved.topic_ids)
+    else:
+        all_exercise_ids = [exercise_id for ids in graph.exercise_ids.values() for exercise_id in ids]
+        fallback_id = min(all_exercise_ids) if all_exercise_ids else None
+
+    picked: dict[int, int | None] = {}
+    for row_index, user_id in enumerate(unique_ids):
+        if not has_choice[row_index]:
+            picked[user_id] = fallback_id
+            continue
+        position = int(best_position[row_index])
+        picked[user_id] = _pick_exercise_id(
+            graph.exercise_index[graph.topic_ids[position]],
+            mastery_score=float(np.clip(matrices['score'][row_index, position], 0.0, 1.0)),
+            review_priority=float(matrices['review'][row_index, position]),
+        )
+
+    wanted = {exercise_id for exercise_id in picked.values() if exercise_id is not None}
+    exercises: dict[int, Exercise] = {}
+    if wanted:
+        exercises = {
+            int(exercise.id): exercise
+            for exercise in db.query(Exercise).filter(Exercise.id.in_(wanted))
+        }
+    return {
+        user_id: exercises.get(exercise_id) if exercise_id is not None else None
+        for user_id, exercise_id in picked.items()
+    }
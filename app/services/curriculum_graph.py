@@ -0,0 +1,444 @@
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+import weakref
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+import numpy as np
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.exercise import Exercise
+from app.models.module import Module
+from app.models.pathway import Pathway
+from app.models.subject import Subject
+from app.models.topic import Topic
+from app.models.topic_dependency import TopicDependency
+from app.services.mastery_engine import MAX_DIFFICULTY, MIN_DIFFICULTY, get_threshold
+
+# Writes to any of these tables make the cached snapshot stale.
+CATALOG_MODELS = (Subject, Pathway, Module, Topic, TopicDependency, Exercise)
+_CATALOG_CHANGED_KEY = 'curriculum_graph_changed'
+
+
+@dataclass(frozen=True)
+class SubjectNode:
+    """Immutable copy of the subject fields used by the adaptive engine."""
+
+    id: int
+    threshold_c1: float
+    threshold_c2: float
+    threshold_c3: float
+    certificate_threshold: float
+
+
+@dataclass(frozen=True)
+class TopicNode:
+    """Immutable copy of a topic with its resolved subject and threshold."""
+
+    id: int
+    subject_id: int
+    module_id: int
+    difficulty_level: float
+    criticality_level: int
+    subject: SubjectNode
+    threshold: float
+
+
+@dataclass(frozen=True)
+class ExerciseIndex:
+    """Exercises of one topic sorted by (clamped difficulty, id) for bisect lookups.
+
+    Built with the snapshot, so exercise additions and edits reach it whenever
+    the snapshot is rebuilt, including after writes from other processes.
+    """
+
+    difficulties: tuple[float, ...]
+    exercise_ids: tuple[int, ...]
+
+    def __len__(self) -> int:
+        return len(self.exercise_ids)
+
+
+@dataclass(frozen=True)
+class CurriculumGraph:
+    """Read-only snapshot of the catalog shared by every request in the process.
+
+    The full snapshot has `subject_id=None`; `for_subject` returns a partition
+    restricted to one subject that shares the version and scope indexes.
+    """
+
+    version: int
+    subject_id: int | None
+    topic_ids: tuple[int, ...]
+    topics: Mapping[int, TopicNode]
+    subjects: Mapping[int, SubjectNode]
+    prerequisites: Mapping[int, tuple[int, ...]]
+    dependents: Mapping[int, tuple[int, ...]]
+    exercise_ids: Mapping[int, tuple[int, ...]]
+    exercise_index: Mapping[int, ExerciseIndex]
+    ancestors: Mapping[int, frozenset[int]]
+    descendants: Mapping[int, frozenset[int]]
+    # Read-only arrays aligned with `topic_ids` for the vectorized scoring kernel.
+    topic_positions: Mapping[int, int]
+    topic_id_array: np.ndarray
+    criticality_weights: np.ndarray
+    thresholds: np.ndarray
+    # Topic ids per catalog scope, always taken from the full snapshot.
+    topics_by_subject: Mapping[int, tuple[int, ...]]
+    topics_by_pathway: Mapping[int, tuple[int, ...]]
+    topics_by_module: Mapping[int, tuple[int, ...]]
+    pathway_subjects: Mapping[int, int]
+    module_pathways: Mapping[int, int | None]
+    _partitions: dict[int, CurriculumGraph] = field(default_factory=dict, compare=False, repr=False)
+
+    def topic_list(self) -> list[TopicNode]:
+        """Return topics ordered by id."""
+        return [self.topics[topic_id] for topic_id in self.topic_ids]
+
+    def all_prerequisites(self, topic_id: int) -> frozenset[int]:
+        """Every direct and indirect prerequisite of a topic."""
+        return self.ancestors.get(topic_id, frozenset())
+
+    def all_dependents(self, topic_id: int) -> frozenset[int]:
+        """Every topic that directly or indirectly requires this one."""
+        return self.descendants.get(topic_id, frozenset())
+
+    def for_subject(self, subject_id: int) -> CurriculumGraph:
+        """Partition holding only one subject's topics, built once per snapshot.
+
+        Prerequisites never cross subjects, so unlock and ranking over the
+        partition match the full snapshot restricted to that subject.
+        """
+        if self.subject_id == subject_id:
+            return self
+        partition = self._partitions.get(subject_id)
+        if partition is None:
+            partition = self._partitions.setdefault(subject_id, _partition_graph(self, subject_id))
+        return partition
+
+
+_lock = threading.Lock()
+_version_counter = itertools.count(1)
+# Keyed by engine so isolated databases (tests, scripts) never share a snapshot.
+_graphs: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_generations: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+# Catalog fingerprint each published snapshot was built from, and when it was last probed.
+_fingerprints: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_checked_at: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _engine_key(db_or_bind):
+    """Resolve the engine behind a session, connection, or engine."""
+    bind = db_or_bind.get_bind() if isinstance(db_or_bind, Session) else db_or_bind
+    return getattr(bind, 'engine', bind)
+
+
+def _index_difficulty(raw: float | None) -> float:
+    """Difficulty as the engine scores it: missing/zero means 1.0, then clamped."""
+    return max(MIN_DIFFICULTY, min(MAX_DIFFICULTY, float(raw or 1.0)))
+
+
+def _frozen_array(values: list, dtype) -> np.ndarray:
+    """Build an array that cannot be modified through the shared snapshot."""
+    array = np.array(values, dtype=dtype)
+    array.flags.writeable = False
+    return array
+
+
+def _transitive_closure(
+    nodes: tuple[int, ...],
+    edges: dict[int, tuple[int, ...]],
+) -> dict[int, frozenset[int]]:
+    """Reachable set per node, memoized along a topological order.
+
+    Nodes caught in a cycle (which validation should prevent) fall back to a
+    plain graph walk so legacy data still yields a usable index.
+    """
+    remaining = {node: len(edges.get(node, ())) for node in nodes}
+    reverse: dict[int, list[int]] = {}
+    for node in nodes:
+        for target in edges.get(node, ()):
+            reverse.setdefault(target, []).append(node)
+
+    closure: dict[int, frozenset[int]] = {}
+    queue = [node for node, count in remaining.items() if count == 0]
+    while queue:
+        node = queue.pop()
+        reachable: set[int] = set()
+        for target in edges.get(node, ()):
+            reachable.add(target)
+            reachable |= closure.get(target, frozenset())
+        closure[node] = frozenset(reachable)
+        for source in reverse.get(node, ()):
+            remaining[source] -= 1
+            if remaining[source] == 0:
+                queue.append(source)
+
+    for node in nodes:
+        if node in closure:
+            continue
+        reachable = set()
+        stack = list(edges.get(node, ()))
+        while stack:
+            target = stack.pop()
+            if target in reachable:
+                continue
+            reachable.add(target)
+            stack.extend(edges.get(target, ()))
+        closure[node] = frozenset(reachable)
+    return closure
+
+
+def _build_curriculum_graph(db: Session, version: int) -> CurriculumGraph:
+    """Load the whole catalog with one query per table."""
+    subjects = {
+        int(row.id): SubjectNode(
+            id=int(row.id),
+            threshold_c1=float(row.threshold_c1),
+            threshold_c2=float(row.threshold_c2),
+            threshold_c3=float(row.threshold_c3),
+            certificate_threshold=float(row.certificate_threshold),
+        )
+        for row in db.query(
+            Subject.id,
+            Subject.threshold_c1,
+            Subject.threshold_c2,
+            Subject.threshold_c3,
+            Subject.certificate_threshold,
+        )
+    }
+
+    topics: dict[int, TopicNode] = {}
+    topic_rows = db.query(
+        Topic.id,
+        Topic.subject_id,
+        Topic.module_id,
+        Topic.difficulty_level,
+        Topic.criticality_level,
+    ).order_by(Topic.id)
+    for row in topic_rows:
+        subject = subjects.get(int(row.subject_id))
+        if subject is None:
+            continue
+        criticality = int(row.criticality_level)
+        topics[int(row.id)] = TopicNode(
+            id=int(row.id),
+            subject_id=int(row.subject_id),
+            module_id=int(row.module_id),
+            difficulty_level=float(row.difficulty_level),
+            criticality_level=criticality,
+            subject=subject,
+            threshold=get_threshold(subject, criticality),
+        )
+
+    prerequisites: dict[int, list[int]] = {}
+    dependents: dict[int, list[int]] = {}
+    for row in db.query(TopicDependency.topic_id, TopicDependency.depends_on_id).order_by(TopicDependency.id):
+        prerequisites.setdefault(int(row.topic_id), []).append(int(row.depends_on_id))
+        dependents.setdefault(int(row.depends_on_id), []).append(int(row.topic_id))
+
+    exercise_ids: dict[int, list[int]] = {}
+    indexed: dict[int, list[tuple[float, int]]] = {}
+    for row in db.query(Exercise.id, Exercise.topic_id, Exercise.difficulty).order_by(Exercise.id):
+        topic_id = int(row.topic_id)
+        exercise_ids.setdefault(topic_id, []).append(int(row.id))
+        indexed.setdefault(topic_id, []).append((_index_difficulty(row.difficulty), int(row.id)))
+
+    exercise_index: dict[int, ExerciseIndex] = {}
+    for topic_id, entries in indexed.items():
+        entries.sort()
+        exercise_index[topic_id] = ExerciseIndex(
+            difficulties=tuple(difficulty for difficulty, _ in entries),
+            exercise_ids=tuple(exercise_id for _, exercise_id in entries),
+        )
+
+    module_pathways = {
+        int(row.id): int(row.pathway_id) if row.pathway_id is not None else None
+        for row in db.query(Module.id, Module.pathway_id)
+    }
+    pathway_subjects = {int(row.id): int(row.subject_id) for row in db.query(Pathway.id, Pathway.subject_id)}
+    topics_by_subject: dict[int, list[int]] = {}
+    topics_by_pathway: dict[int, list[int]] = {}
+    topics_by_module: dict[int, list[int]] = {}
+    for topic in topics.values():
+        topics_by_subject.setdefault(topic.subject_id, []).append(topic.id)
+        topics_by_module.setdefault(topic.module_id, []).append(topic.id)
+        pathway_id = module_pathways.get(topic.module_id)
+        if pathway_id is not None:
+            topics_by_pathway.setdefault(pathway_id, []).append(topic.id)
+
+    prerequisite_edges = {key: tuple(value) for key, value in prerequisites.items()}
+    dependent_edges = {key: tuple(value) for key, value in dependents.items()}
+    topic_ids = tuple(topics)
+
+    return _assemble_graph(
+        version=version,
+        subject_id=None,
+        topics=topics,
+        subjects=subjects,
+        prerequisites=prerequisite_edges,
+        dependents=dependent_edges,
+        exercise_ids={key: tuple(value) for key, value in exercise_ids.items()},
+        exercise_index=exercise_index,
+        ancestors=_transitive_closure(topic_ids, prerequisite_edges),
+        descendants=_transitive_closure(topic_ids, dependent_edges),
+        topics_by_subject=MappingProxyType({key: tuple(value) for key, value in topics_by_subject.items()}),
+        topics_by_pathway=MappingProxyType({key: tuple(value) for key, value in topics_by_pathway.items()}),
+        topics_by_module=MappingProxyType({key: tuple(value) for key, value in topics_by_module.items()}),
+        pathway_subjects=MappingProxyType(pathway_subjects),
+        module_pathways=MappingProxyType(module_pathways),
+    )
+
+
+def _partition_graph(graph: CurriculumGraph, subject_id: int) -> CurriculumGraph:
+    """Slice one subject out of a full snapshot without touching the database."""
+    topic_ids = graph.topics_by_subject.get(subject_id, ())
+
+    def _restrict(mapping: Mapping[int, object]) -> dict:
+        return {topic_id: mapping[topic_id] for topic_id in topic_ids if topic_id in mapping}
+
+    return _assemble_graph(
+        version=graph.version,
+        subject_id=subject_id,
+        topics={topic_id: graph.topics[topic_id] for topic_id in topic_ids},
+        subjects={subject_id: graph.subjects[subject_id]} if subject_id in graph.subjects else {},
+        prerequisites=_restrict(graph.prerequisites),
+        dependents=_restrict(graph.dependents),
+        exercise_ids=_restrict(graph.exercise_ids),
+        exercise_index=_restrict(graph.exercise_index),
+        ancestors=_restrict(graph.ancestors),
+        descendants=_restrict(graph.descendants),
+        topics_by_subject=graph.topics_by_subject,
+        topics_by_pathway=graph.topics_by_pathway,
+        topics_by_module=graph.topics_by_module,
+        pathway_subjects=graph.pathway_subjects,
+        module_pathways=graph.module_pathways,
+    )
+
+
+def _assemble_graph(
+    *,
+    version: int,
+    subject_id: int | None,
+    topics: dict[int, TopicNode],
+    subjects: dict[int, SubjectNode],
+    prerequisites: dict[int, tuple[int, ...]],
+    dependents: dict[int, tuple[int, ...]],
+    exercise_ids: dict[int, tuple[int, ...]],
+    exercise_index: dict[int, ExerciseIndex],
+    ancestors: dict[int, frozenset[int]],
+    descendants: dict[int, frozenset[int]],
+    topics_by_subject: Mapping[int, tuple[int, ...]],
+    topics_by_pathway: Mapping[int, tuple[int, ...]],
+    topics_by_module: Mapping[int, tuple[int, ...]],
+    pathway_subjects: Mapping[int, int],
+    module_pathways: Mapping[int, int | None],
+) -> CurriculumGraph:
+    """Freeze the loaded catalog pieces and derive the kernel arrays."""
+    topic_ids = tuple(topics)
+    return CurriculumGraph(
+        version=version,
+        subject_id=subject_id,
+        topic_ids=topic_ids,
+        topics=MappingProxyType(topics),
+        subjects=MappingProxyType(subjects),
+        prerequisites=MappingProxyType(prerequisites),
+        dependents=MappingProxyType(dependents),
+        exercise_ids=MappingProxyType(exercise_ids),
+        exercise_index=MappingProxyType(exercise_index),
+        ancestors=MappingProxyType(ancestors),
+        descendants=MappingProxyType(descendants),
+        topic_positions=MappingProxyType({topic_id: position for position, topic_id in enumerate(topic_ids)}),
+        topic_id_array=_frozen_array(list(topic_ids), np.int64),
+        criticality_weights=_frozen_array(
+            [max(1, topic.criticality_level or 1) for topic in topics.values()],
+            np.float64,
+        ),
+        thresholds=_frozen_array([topic.threshold for topic in topics.values()], np.float64),
+        topics_by_subject=topics_by_subject,
+        topics_by_pathway=topics_by_pathway,
+        topics_by_module=topics_by_module,
+        pathway_subjects=pathway_subjects,
+        module_pathways=module_pathways,
+    )
+
+
+def catalog_fingerprint(db: Session) -> tuple:
+    """Row count, highest id and latest edit of every catalog table, read in one round trip."""
+    columns = []
+    for model in CATALOG_MODELS:
+        columns.append(select(func.count()).select_from(model).scalar_subquery())
+        columns.append(select(func.max(model.id)).scalar_subquery())
+        if hasattr(model, 'updated_at'):
+            columns.append(select(func.max(model.updated_at)).scalar_subquery())
+    return tuple(db.execute(select(*columns)).one())
+
+
+def _changed_elsewhere(db: Session, key) -> bool:
+    """Whether another process changed the catalog, probed at most every `CURRICULUM_GRAPH_CHECK_SECONDS`.
+
+    Flush listeners only see this process's writes; seed scripts and other
+    workers write through their own engines.
+    """
+    now = time.monotonic()
+    checked_at = _checked_at.get(key)
+    if checked_at is not None and now - checked_at < settings.CURRICULUM_GRAPH_CHECK_SECONDS:
+        return False
+    _checked_at[key] = now
+    return catalog_fingerprint(db) != _fingerprints.get(key)
+
+
+def get_curriculum_graph(db: Session) -> CurriculumGraph:
+    """Return the cached catalog snapshot, rebuilding it after catalog writes from any process."""
+    key = _engine_key(db)
+    graph = _graphs.get(key)
+    if graph is not None:
+        if not _changed_elsewhere(db, key):
+            return graph
+        invalidate_curriculum_graph(key)
+
+    with _lock:
+        graph = _graphs.get(key)
+        if graph is not None:
+            return graph
+        generation = _generations.get(key, 0)
+        # Read before the catalog, so a write landing mid-load shows up on the next probe.
+        fingerprint = catalog_fingerprint(db)
+        graph = _build_curriculum_graph(db, version=next(_version_counter))
+        # Only publish if no catalog write landed while the snapshot was loading.
+        if _generations.get(key, 0) == generation:
+            _graphs[key] = graph
+            _fingerprints[key] = fingerprint
+            _checked_at[key] = time.monotonic()
+        return graph
+
+
+def invalidate_curriculum_graph(db_or_bind) -> None:
+    """Drop the snapshot for a database; the next reader rebuilds it."""
+    key = _engine_key(db_or_bind)
+    with _lock:
+        _generations[key] = _generations.get(key, 0) + 1
+        _graphs.pop(key, None)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_catalog_writes(session: Session, flush_context) -> None:
+    """Invalidate on flush so the writing session sees its own changes."""
+    changed = itertools.chain(session.new, session.dirty, session.deleted)
+    if any(isinstance(instance, CATALOG_MODELS) for instance in changed):
+        session.info[_CATALOG_CHANGED_KEY] = True
+        invalidate_curriculum_graph(session)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_soft_rollback')
+def _invalidate_after_transaction(session: Session, *args) -> None:
+    """Invalidate again once the write is visible (or undone) for other sessions."""
+    if session.info.pop(_CATALOG_CHANGED_KEY, False):
+        invalidate_curriculum_graph(session)
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, datetime
+
+from sqlalchemy import exists, func
+from sqlalchemy.orm import Session
+
+from app.models.attempt import Attempt
+from app.models.daily_plan import DailyPlan
+
+
+@dataclass(frozen=True)
+class PlannedPractice:
+    """Plan computed for one user, ready to be stored."""
+
+    user_id: int
+    last_attempt_id: int | None
+    topic_ids: list[int]
+    exercise_ids: list[int]
+
+
+def get_active_daily_plan(db: Session, user_id: int, today: date) -> DailyPlan | None:
+    """Return today's plan unless the user has submitted an attempt since it was generated.
+
+    The attempt check is part of the same query, so any submission path
+    (and any worker) invalidates the plan without extra bookkeeping.
+    """
+    submitted_since = exists().where(
+        Attempt.user_id == DailyPlan.user_id,
+        Attempt.id > func.coalesce(DailyPlan.last_attempt_id, 0),
+    )
+    return (
+        db.query(DailyPlan)
+        .filter(DailyPlan.user_id == user_id, DailyPlan.plan_date == today, ~submitted_since)
+        .first()
+    )
+
+
+def store_daily_plans(
+    db: Session,
+    plans: list[PlannedPractice],
+    plan_date: date,
+    generated_at: datetime,
+) -> int:
+    """Replace the plans of the given users with one delete and one bulk insert."""
+    if not plans:
+        return 0
+    user_ids = [plan.user_id for plan in plans]
+    db.query(DailyPlan).filter(DailyPlan.user_id.in_(user_ids)).delete(synchronize_session=False)
+    db.execute(
+        DailyPlan.__table__.insert(),
+        [
+            {
+                'user_id': plan.user_id,
+                'plan_date': plan_date,
+                'generated_at': generated_at,
+                'last_attempt_id': plan.last_attempt_id,
+                'topic_ids': plan.topic_ids,
+                'exercise_ids': plan.exercise_ids,
+            }
+            for plan in plans
+        ],
+    )
+    db.commit()
+    return len(plans)
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.attempt import Attempt
+from app.services.adaptation_engine import build_practice_queue
+from app.services.daily_plan import PlannedPractice, store_daily_plans
+from app.services.mastery_engine import _utcnow
+from app.services.selection_policies import get_selection_policy
+
+ACTIVE_USER_DAYS = 14
+DEFAULT_PLAN_SIZE = 10
+DEFAULT_CHUNK_SIZE = 500
+
+
+def active_user_ids(db: Session, now: datetime, days: int = ACTIVE_USER_DAYS) -> list[int]:
+    """Users with at least one attempt in the last `days` days."""
+    cutoff = now - timedelta(days=days)
+    rows = (
+        db.query(Attempt.user_id)
+        .filter(Attempt.created_at >= cutoff)
+        .distinct()
+        .order_by(Attempt.user_id)
+        .all()
+    )
+    return [int(user_id) for (user_id,) in rows]
+
+
+def compute_plan_chunk(
+    database_url: str,
+    user_ids: list[int],
+    plan_size: int,
+    policy_name: str,
+) -> list[PlannedPractice]:
+    """Build plans for one chunk of users; runs inside a pool worker with its own engine."""
+    policy = get_selection_policy(policy_name)
+    engine = create_engine(database_url)
+    try:
+        with Session(bind=engine) as db:
+            # Read the watermark first so attempts landing mid-computation void the plan.
+            last_attempt_ids = dict(
+                db.query(Attempt.user_id, func.max(Attempt.id))
+                .filter(Attempt.user_id.in_(user_ids))
+                .group_by(Attempt.user_id)
+                .all()
+            )
+            plans = []
+            for user_id in user_ids:
+                queue = build_practice_queue(db, user_id, size=plan_size, assume_correct=True, policy=policy)
+                plans.append(
+                    PlannedPractice(
+                        user_id=user_id,
+                        last_attempt_id=last_attempt_ids.get(user_id),
+                        topic_ids=[int(exercise.topic_id) for exercise in queue],
+                        exercise_ids=[int(exercise.id) for exercise in queue],
+                    )
+                )
+            return plans
+    finally:
+        engine.dispose()
+
+
+def run_daily_plan_job(
+    db: Session,
+    database_url: str,
+    plan_date: date | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = 1,
+    plan_size: int = DEFAULT_PLAN_SIZE,
+    policy_name: str | None = None,
+) -> int:
+    """Precompute today's plan for every active user and store it chunk by chunk.
+
+    Chunks are computed in a process pool when `workers > 1`; results are
+    written from this process as each chunk completes. Plans are picked by
+    `policy_name`, by default the configured selection policy, so they
+    match what live selection serves. Returns the number of plans stored.
+    """
+    policy_name = policy_name or settings.ADAPTIVE_SELECTION_POLICY
+    generated_at = _utcnow()
+    plan_date = plan_date or generated_at.date()
+    user_ids = active_user_ids(db, now=generated_at)
+    chunks = [user_ids[start:start + chunk_size] for start in range(0, len(user_ids), max(1, chunk_size))]
+
+    stored = 0
+    if workers <= 1:
+        for chunk in chunks:
+            plans = compute_plan_chunk(database_url, chunk, plan_size, policy_name)
+            stored += store_daily_plans(db, plans, plan_date=plan_date, generated_at=generated_at)
+        return stored
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(compute_plan_chunk, database_url, chunk, plan_size, policy_name) for chunk in chunks]
+        for future in futures:
+            stored += store_daily_plans(db, future.result(), plan_date=plan_date, generated_at=generated_at)
+    return stored
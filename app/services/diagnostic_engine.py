@@ -2,19 +2,44 @@ from __future__ import annotations
 
 from sqlalchemy.orm import Session
 
-from app.models.topic import Topic
+from app.services.adaptation_engine import AdaptiveScope, resolve_scope
+from app.services.curriculum_graph import get_curriculum_graph
+from app.services.learning_state import load_user_learning_state
 from app.services.mastery_engine import get_mastery_map
 
 
-def calculate_branch_level(db: Session, user_id: int, topic_ids: list[int] | None = None) -> int:
-    """Compute a coarse level for a branch based on average mastery."""
+def resolve_branch_topic_ids(db: Session, scope: AdaptiveScope | None = None) -> list[int]:
+    """Topic ids of a scope (every topic when unscoped) from the cached catalog snapshot."""
+    resolved = resolve_scope(get_curriculum_graph(db), scope)
+    if resolved.topic_ids is None:
+        return list(resolved.graph.topic_ids)
+    return sorted(resolved.topic_ids)
+
+
+def calculate_branch_level(
+    db: Session,
+    user_id: int,
+    topic_ids: list[int] | None = None,
+    scope: AdaptiveScope | None = None,
+) -> int:
+    """Compute a coarse level for a branch based on average mastery.
+
+    Without explicit `topic_ids`, the branch is the given scope (or the whole
+    catalog) and only mastery rows of the scope's subject are read.
+    """
+    subject_id = None
     if topic_ids is None:
-        topic_ids = [topic.id for topic in db.query(Topic).all()]
+        resolved = resolve_scope(get_curriculum_graph(db), scope)
+        subject_id = resolved.graph.subject_id
+        topic_ids = list(resolved.graph.topic_ids) if resolved.topic_ids is None else sorted(resolved.topic_ids)
 
     if not topic_ids:
         return 0
 
-    mastery_map = get_mastery_map(db, user_id)
+    if subject_id is not None:
+        mastery_map = load_user_learning_state(db, user_id, subject_id=subject_id).mastery_map()
+    else:
+        mastery_map = get_mastery_map(db, user_id)
     average = sum(mastery_map.get(topic_id, 0.0) for topic_id in topic_ids) / len(topic_ids)
     epsilon = 1e-9
 
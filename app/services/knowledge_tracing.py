@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+BKT_SLIP_DEFAULT = 0.1
+BKT_GUESS_DEFAULT = 0.2
+BKT_LEARN_DEFAULT = 0.15
+BKT_INITIAL_DEFAULT = 0.1
+
+# (a, b, c, d) of the map p -> (a * p + b) / (c * p + d).
+Coefficients = tuple[float, float, float, float]
+
+
+@dataclass(frozen=True)
+class KnowledgeTracingParameters:
+    """Bayesian Knowledge Tracing parameters of one topic.
+
+    `slip` is P(wrong | mastered), `guess` is P(correct | not mastered),
+    `learn` is P(mastered after an answer | not mastered before it) and
+    `initial` is P(mastered) before the first answer.
+    """
+
+    slip: float = BKT_SLIP_DEFAULT
+    guess: float = BKT_GUESS_DEFAULT
+    learn: float = BKT_LEARN_DEFAULT
+    initial: float = BKT_INITIAL_DEFAULT
+
+    def __post_init__(self) -> None:
+        # A slip and guess summing to 1 make answers carry no information about mastery.
+        if not (0.0 < self.slip < 1.0 and 0.0 < self.guess < 1.0 and self.slip + self.guess < 1.0):
+            raise ValueError(f'Invalid slip/guess pair: {self.slip}, {self.guess}')
+        if not 0.0 <= self.learn <= 1.0:
+            raise ValueError(f'Invalid learn probability: {self.learn}')
+        if not 0.0 <= self.initial <= 1.0:
+            raise ValueError(f'Invalid initial probability: {self.initial}')
+
+    def to_dict(self) -> dict[str, float]:
+        return {'slip': self.slip, 'guess': self.guess, 'learn': self.learn, 'initial': self.initial}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> KnowledgeTracingParameters:
+        return cls(
+            slip=float(data['slip']),
+            guess=float(data['guess']),
+            learn=float(data['learn']),
+            initial=float(data.get('initial', BKT_INITIAL_DEFAULT)),
+        )
+
+
+@dataclass(frozen=True)
+class KnowledgeTracingModel:
+    """BKT update of one topic with its coefficients precomputed per outcome.
+
+    Conditioning the mastery probability p on the answer and then applying
+    the learning transition maps p to (a p + b) / (c p + d). The four
+    coefficients per outcome are computed once, so an update costs two
+    multiply-adds and a division, and a history of answers folds by
+    multiplying the 2x2 matrices [[a, b], [c, d]].
+    """
+
+    parameters: KnowledgeTracingParameters
+    correct: Coefficients
+    wrong: Coefficients
+
+    @classmethod
+    def from_parameters(cls, parameters: KnowledgeTracingParameters) -> KnowledgeTracingModel:
+        slip, guess, learn = parameters.slip, parameters.guess, parameters.learn
+        return cls(
+            parameters=parameters,
+            # Posterior p(1 - slip) / (p(1 - slip - guess) + guess), then p + (1 - p) learn.
+            correct=(1.0 - slip - learn * guess, learn * guess, 1.0 - slip - guess, guess),
+            # Posterior p slip / (p(slip + guess - 1) + 1 - guess), then p + (1 - p) learn.
+            wrong=(slip - learn * (1.0 - guess), learn * (1.0 - guess), slip + guess - 1.0, 1.0 - guess),
+        )
+
+    @property
+    def initial(self) -> float:
+        """Mastery probability a learner starts the topic with."""
+        return self.parameters.initial
+
+    def coefficients(self, is_correct: bool) -> Coefficients:
+        return self.correct if is_correct else self.wrong
+
+    def update(self, score: float, is_correct: bool) -> float:
+        """Mastery probability after one answer, starting from `score`."""
+        a, b, c, d = self.correct if is_correct else self.wrong
+        prior = min(1.0, max(0.0, float(score)))
+        updated = (a * prior + b) / (c * prior + d)
+        return min(1.0, max(0.0, updated))
+
+
+DEFAULT_KNOWLEDGE_TRACING_MODEL = KnowledgeTracingModel.from_parameters(KnowledgeTracingParameters())
+
+
+@dataclass(frozen=True)
+class KnowledgeTracingTable:
+    """Subjects scored with knowledge tracing and the models of their topics.
+
+    Topics without their own parameters use `default`; subjects not listed
+    keep the logistic-style update.
+    """
+
+    subjects: frozenset[int] = frozenset()
+    default: KnowledgeTracingModel = DEFAULT_KNOWLEDGE_TRACING_MODEL
+    by_topic: dict[int, KnowledgeTracingModel] = field(default_factory=dict)
+
+    def model_for(self, subject_id: int | None, topic_id: int | None) -> KnowledgeTracingModel | None:
+        """Model of one topic, or None when its subject uses the logistic-style update."""
+        if subject_id is None or subject_id not in self.subjects:
+            return None
+        return self.by_topic.get(topic_id, self.default) if topic_id is not None else self.default
+
+    def to_dict(self) -> dict:
+        return {
+            'subjects': sorted(self.subjects),
+            'default': self.default.parameters.to_dict(),
+            'topics': {str(key): model.parameters.to_dict() for key, model in sorted(self.by_topic.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> KnowledgeTracingTable:
+        default = data.get('default')
+        return cls(
+            subjects=frozenset(int(key) for key in data.get('subjects', [])),
+            default=(
+                KnowledgeTracingModel.from_parameters(KnowledgeTracingParameters.from_dict(default))
+                if default
+                else DEFAULT_KNOWLEDGE_TRACING_MODEL
+            ),
+            by_topic={
+                int(key): KnowledgeTracingModel.from_parameters(KnowledgeTracingParameters.from_dict(value))
+                for key, value in data.get('topics', {}).items()
+            },
+        )
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models.topic import Topic
+from app.models.user_mastery import UserMastery
+from app.services.curriculum_graph import TopicNode
+from app.services.mastery_engine import (
+    INACTIVITY_DAYS,
+    _normalized_last_seen,
+    _set_repetition_metadata,
+    _utcnow,
+    initial_mastery_score,
+    is_inactive,
+    is_revalidated,
+    is_score_ready_for_unlock,
+    is_topic_in_development,
+    next_mastery_score,
+    record_correct_attempt,
+    review_priority_for_row,
+    stored_review_priority,
+)
+
+
+@dataclass
+class UserLearningState:
+    """Everything the adaptive engine needs to know about one user, loaded up front."""
+
+    user_id: int
+    now: datetime
+    mastery_rows: dict[int, UserMastery] = field(default_factory=dict)
+
+    def mastery_score(self, topic_id: int) -> float:
+        """Return the stored mastery score, 0.0 when the topic was never practiced."""
+        row = self.mastery_rows.get(topic_id)
+        return float(row.mastery_score) if row is not None else 0.0
+
+    def mastery_map(self) -> dict[int, float]:
+        """Return a mapping of topic_id to mastery score."""
+        return {topic_id: float(row.mastery_score) for topic_id, row in self.mastery_rows.items()}
+
+    def is_stale(self, topic_id: int) -> bool:
+        """A practiced topic is stale after the inactivity window."""
+        row = self.mastery_rows.get(topic_id)
+        return row is not None and is_inactive(row, now=self.now)
+
+    def has_passed_revalidation(self, topic_id: int) -> bool:
+        """Same rule as `has_passed_revalidation`, answered from the loaded row."""
+        row = self.mastery_rows.get(topic_id)
+        return row is not None and is_revalidated(row, now=self.now)
+
+    def review_priority(self, topic_id: int) -> float:
+        """Spaced-repetition priority for a topic."""
+        return review_priority_for_row(self.mastery_rows.get(topic_id), now=self.now)
+
+    def row_inputs(self, row: UserMastery) -> tuple[float, float, float]:
+        """Mastery, days since last seen and stored priority of one row (NaN when missing)."""
+        last_seen = _normalized_last_seen(row)
+        elapsed_days = np.nan
+        if last_seen is not None:
+            elapsed_days = (self.now.replace(tzinfo=None) - last_seen).total_seconds() / 86400.0
+        priority = stored_review_priority(row)
+        return float(row.mastery_score), elapsed_days, np.nan if priority is None else priority
+
+    def review_inputs(self, topic_ids: list[int] | tuple[int, ...]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Aligned arrays of `row_inputs` for the scoring kernel.
+
+        Never-practiced topics get mastery 0 and NaN elapsed days, which the
+        kernel treats as full decay.
+        """
+        mastery = np.zeros(len(topic_ids))
+        elapsed_days = np.full(len(topic_ids), np.nan)
+        stored = np.full(len(topic_ids), np.nan)
+        for position, topic_id in enumerate(topic_ids):
+            row = self.mastery_rows.get(topic_id)
+            if row is not None:
+                mastery[position], elapsed_days[position], stored[position] = self.row_inputs(row)
+        return mastery, elapsed_days, stored
+
+    def is_ready_for_unlock(self, topic: TopicNode) -> bool:
+        """Mirror of `is_topic_ready_for_unlock` without per-topic queries."""
+        row = self.mastery_rows.get(topic.id)
+        if row is None:
+            return False
+        if not is_score_ready_for_unlock(topic, float(row.mastery_score)):
+            return False
+        return not (self.is_stale(topic.id) and not self.has_passed_revalidation(topic.id))
+
+    def next_transition_at(self) -> datetime | None:
+        """Earliest moment a stale/revalidation flag can flip without new writes.
+
+        A topic turns stale once its inactivity window elapses, and a passed
+        revalidation lapses at the row's `revalidated_until`.
+        """
+        boundaries: list[datetime] = []
+        reference = self.now.replace(tzinfo=None)
+        for topic_id, row in self.mastery_rows.items():
+            if not self.is_stale(topic_id):
+                last_seen = _normalized_last_seen(row)
+                if last_seen is not None:
+                    boundaries.append(last_seen + timedelta(days=INACTIVITY_DAYS + 1))
+            revalidated_until = row.revalidated_until
+            if revalidated_until is not None and revalidated_until.replace(tzinfo=None) >= reference:
+                boundaries.append(revalidated_until.replace(tzinfo=None))
+        return min(boundaries, default=None)
+
+    def detached_copy(self) -> UserLearningState:
+        """Copy the state onto plain objects so simulations never touch the session."""
+        rows = {
+            topic_id: SimpleNamespace(
+                user_id=row.user_id,
+                topic_id=row.topic_id,
+                mastery_score=float(row.mastery_score),
+                last_updated=row.last_updated,
+                last_seen_at=_normalized_last_seen(row),
+                review_priority=stored_review_priority(row),
+                is_completed=bool(row.is_completed),
+                recent_correct_at=list(row.recent_correct_at or []),
+                revalidated_until=row.revalidated_until,
+            )
+            for topic_id, row in self.mastery_rows.items()
+        }
+        return UserLearningState(user_id=self.user_id, now=self.now, mastery_rows=rows)
+
+    def apply_answer(self, topic: TopicNode, is_correct: bool, difficulty: float, at: datetime) -> float:
+        """Apply `update_mastery` arithmetic to a detached state and return the new score."""
+        row = self.mastery_rows.get(topic.id)
+        if row is None:
+            row = SimpleNamespace(
+                user_id=self.user_id,
+                topic_id=topic.id,
+                mastery_score=initial_mastery_score(topic.subject_id, topic.id),
+                last_updated=at,
+                last_seen_at=at,
+                review_priority=None,
+                is_completed=False,
+                recent_correct_at=[],
+                revalidated_until=None,
+            )
+            self.mastery_rows[topic.id] = row
+        row.mastery_score = next_mastery_score(
+            float(row.mastery_score),
+            is_correct,
+            difficulty=difficulty,
+            criticality=int(topic.criticality_level),
+            subject_id=topic.subject_id,
+            topic_id=topic.id,
+        )
+        _set_repetition_metadata(row, now=at)
+        if is_correct:
+            record_correct_attempt(row, at=at)
+        return float(row.mastery_score)
+
+    def needs_reinforcement(self, topic: TopicNode) -> bool:
+        """Topic is in development or stale without a passed revalidation."""
+        in_development = is_topic_in_development(
+            subject=topic.subject,
+            criticality=int(topic.criticality_level),
+            mastery_score=self.mastery_score(topic.id),
+        )
+        if in_development:
+            return True
+        return self.is_stale(topic.id) and not self.has_passed_revalidation(topic.id)
+
+
+def load_user_learning_state(
+    db: Session,
+    user_id: int,
+    now: datetime | None = None,
+    subject_id: int | None = None,
+) -> UserLearningState:
+    """Load mastery rows, revalidation counters included, with one query."""
+    return load_cohort_learning_states(db, [user_id], now=now, subject_id=subject_id)[user_id]
+
+
+def load_cohort_learning_states(
+    db: Session,
+    user_ids: list[int],
+    now: datetime | None = None,
+    subject_id: int | None = None,
+) -> dict[int, UserLearningState]:
+    """Load learning state for many users with the same single query as for one.
+
+    With `subject_id`, only rows of that subject's topics are read.
+    """
+    reference = now or _utcnow()
+    states = {user_id: UserLearningState(user_id=user_id, now=reference) for user_id in user_ids}
+    if not states:
+        return states
+
+    query = db.query(UserMastery).filter(UserMastery.user_id.in_(list(states)))
+    if subject_id is not None:
+        query = query.join(Topic, Topic.id == UserMastery.topic_id).filter(Topic.subject_id == subject_id)
+    for row in query.all():
+        states[int(row.user_id)].mastery_rows[int(row.topic_id)] = row
+    return states
@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import math
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models.attempt import Attempt
+from app.models.exercise import Exercise
+from app.models.topic import Topic
+from app.services.mastery_engine import (
+    BASE_DECAY_RATE_DEFAULT,
+    BASE_LEARNING_RATE_DEFAULT,
+    MAX_CRITICALITY,
+    MIN_CRITICALITY,
+)
+from app.services.mastery_rates import MasteryRates, MasteryRateTable
+from app.services.mastery_rebuild import effective_rates, segmented_affine_scan
+
+SCOPE_GLOBAL = 'global'
+SCOPE_SUBJECT = 'subject'
+SCOPE_CRITICALITY = 'criticality'
+SCOPES = (SCOPE_GLOBAL, SCOPE_SUBJECT, SCOPE_CRITICALITY)
+SEARCH_GRID = 'grid'
+SEARCH_COORDINATE = 'coordinate'
+DEFAULT_RATE_GRID = tuple(float(rate) for rate in np.geomspace(0.01, 1.0, 11))
+COORDINATE_ROUNDS = 4
+COORDINATE_POINTS = 5
+# Partitions with fewer scored answers keep the engine defaults.
+MIN_SCORED_ATTEMPTS = 100
+STREAM_BATCH_SIZE = 5000
+
+
+@dataclass(frozen=True)
+class AttemptHistory:
+    """Logged answers in (user, topic, time) order as parallel arrays."""
+
+    subject_ids: np.ndarray
+    criticality: np.ndarray
+    difficulty: np.ndarray
+    is_correct: np.ndarray
+    group_starts: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.is_correct)
+
+    def subset(self, mask: np.ndarray) -> AttemptHistory:
+        """Answers selected by a mask that keeps or drops whole (user, topic) groups."""
+        group_ids = np.repeat(np.arange(len(self.group_starts)), np.diff(np.append(self.group_starts, len(self))))
+        kept_groups = group_ids[mask]
+        starts = np.flatnonzero(np.diff(kept_groups, prepend=-1) != 0)
+        return AttemptHistory(
+            subject_ids=self.subject_ids[mask],
+            criticality=self.criticality[mask],
+            difficulty=self.difficulty[mask],
+            is_correct=self.is_correct[mask],
+            group_starts=starts,
+        )
+
+
+@dataclass(frozen=True)
+class FitQuality:
+    """Next-answer prediction quality of the mastery score used as P(correct)."""
+
+    attempts: int
+    brier: float
+    accuracy: float
+
+
+@dataclass(frozen=True)
+class PartitionFit:
+    """Best rates found for one partition, against the hand-picked defaults."""
+
+    scope: str
+    key: int | None
+    rates: MasteryRates
+    baseline: FitQuality
+    fitted: FitQuality
+
+
+@dataclass(frozen=True)
+class CalibrationReport:
+    fits: list[PartitionFit]
+    evaluations: int
+    elapsed_seconds: float
+
+    def rate_table(self) -> MasteryRateTable:
+        """Fitted rates in the layout `MASTERY_RATES_PATH` loads."""
+        global_rates = next((fit.rates for fit in self.fits if fit.scope == SCOPE_GLOBAL), None)
+        return MasteryRateTable(
+            global_rates=global_rates,
+            by_subject={fit.key: fit.rates for fit in self.fits if fit.scope == SCOPE_SUBJECT},
+            by_criticality={fit.key: fit.rates for fit in self.fits if fit.scope == SCOPE_CRITICALITY},
+        )
+
+
+def load_attempt_history(db: Session) -> AttemptHistory:
+    """Stream every logged answer with its exercise difficulty and topic criticality."""
+    user_ids, topic_ids = array('q'), array('q')
+    subject_ids, criticality, difficulty, is_correct = array('q'), array('q'), array('d'), array('b')
+    rows = (
+        db.query(
+            Attempt.user_id,
+            Exercise.topic_id,
+            Topic.subject_id,
+            Topic.criticality_level,
+            Exercise.difficulty,
+            Attempt.is_correct,
+        )
+        .join(Exercise, Exercise.id == Attempt.exercise_id)
+        .join(Topic, Topic.id == Exercise.topic_id)
+        .order_by(Attempt.user_id, Exercise.topic_id, Attempt.created_at, Attempt.id)
+        .yield_per(STREAM_BATCH_SIZE)
+    )
+    for row in rows:
+        user_ids.append(int(row.user_id))
+        topic_ids.append(int(row.topic_id))
+        subject_ids.append(int(row.subject_id))
+        criticality.append(int(row.criticality_level))
+        difficulty.append(float(row.difficulty) if row.difficulty is not None else 1.0)
+        is_correct.append(bool(row.is_correct))
+
+    users = np.frombuffer(user_ids, dtype=np.int64)
+    topics = np.frombuffer(topic_ids, dtype=np.int64)
+    boundary = np.flatnonzero((np.diff(users) != 0) | (np.diff(topics) != 0)) + 1
+    return AttemptHistory(
+        subject_ids=np.frombuffer(subject_ids, dtype=np.int64).copy(),
+        criticality=np.clip(np.frombuffer(criticality, dtype=np.int64), MIN_CRITICALITY, MAX_CRITICALITY),
+        difficulty=np.frombuffer(difficulty, dtype=np.float64).copy(),
+        is_correct=np.frombuffer(is_correct, dtype=np.int8).astype(bool),
+        group_starts=np.concatenate(([0], boundary)) if len(users) else np.zeros(0, dtype=np.int64),
+    )
+
+
+def evaluate_rates(history: AttemptHistory, learning_rate: float, decay_rate: float) -> FitQuality:
+    """Replay every group from 0 and score the mastery before each answer as its prediction.
+
+    The first answer of a group is always predicted at 0 whatever the
+    rates, so it is left out of the score.
+    """
+    alpha, beta = effective_rates(history.difficulty, history.criticality, learning_rate, decay_rate)
+    slope = np.where(history.is_correct, 1.0 - alpha, 1.0 - beta)
+    offset = np.where(history.is_correct, alpha, 0.0)
+    after = np.clip(segmented_affine_scan(slope, offset, history.group_starts), 0.0, 1.0)
+
+    scored = np.ones(len(history), dtype=bool)
+    scored[history.group_starts] = False
+    predicted = np.concatenate(([0.0], after[:-1]))[scored]
+    outcome = history.is_correct[scored]
+    if not len(outcome):
+        return FitQuality(attempts=0, brier=math.nan, accuracy=math.nan)
+    return FitQuality(
+        attempts=int(len(outcome)),
+        brier=float(np.mean((predicted - outcome) ** 2)),
+        accuracy=float(np.mean((predicted >= 0.5) == outcome)),
+    )
+
+
+def partition_masks(history: AttemptHistory, scope: str) -> dict[int | None, np.ndarray]:
+    """Answer masks per partition key of a scope; topics never straddle partitions."""
+    if scope == SCOPE_GLOBAL:
+        return {None: np.ones(len(history), dtype=bool)}
+    if scope == SCOPE_SUBJECT:
+        keys = history.subject_ids
+    elif scope == SCOPE_CRITICALITY:
+        keys = history.criticality
+    else:
+        raise ValueError(f'Unknown calibration scope {scope!r}; expected one of {list(SCOPES)}')
+    return {int(key): keys == key for key in np.unique(keys)}
+
+
+_worker_partitions: dict[tuple[str, int | None], AttemptHistory] = {}
+
+
+def _init_worker(partitions: dict[tuple[str, int | None], AttemptHistory]) -> None:
+    """Pool initializer: each worker receives the partitioned history once."""
+    _worker_partitions.clear()
+    _worker_partitions.update(partitions)
+
+
+def _evaluate_batch(
+    partition: tuple[str, int | None],
+    candidates: list[tuple[float, float]],
+) -> list[tuple[float, float, FitQuality]]:
+    history = _worker_partitions[partition]
+    return [
+        (learning_rate, decay_rate, evaluate_rates(history, learning_rate, decay_rate))
+        for learning_rate, decay_rate in candidates
+    ]
+
+
+class _Evaluator:
+    """Runs batches of (partition, candidate rates) inline or across a process pool."""
+
+    def __init__(self, partitions: dict[tuple[str, int | None], AttemptHistory], workers: int) -> None:
+        self.workers = max(1, workers)
+        self.evaluations = 0
+        self._pool = None
+        if self.workers > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(partitions,))
+        else:
+            _init_worker(partitions)
+
+    def best(
+        self,
+        candidates: dict[tuple[str, int | None], list[tuple[float, float]]],
+    ) -> dict[tuple[str, int | None], tuple[float, float, FitQuality]]:
+        """Lowest-Brier candidate of every partition."""
+        batches = []
+        for partition, rates in candidates.items():
+            size = max(1, math.ceil(len(rates) / self.workers))
+            batches.extend((partition, rates[start:start + size]) for start in range(0, len(rates), size))
+            self.evaluations += len(rates)
+
+        if self._pool is None:
+            results = [_evaluate_batch(partition, batch) for partition, batch in batches]
+        else:
+            futures = [self._pool.submit(_evaluate_batch, partition, batch) for partition, batch in batches]
+            results = [future.result() for future in futures]
+
+        best: dict[tuple[str, int | None], tuple[float, float, FitQuality]] = {}
+        for (partition, _), batch_results in zip(batches, results):
+            for learning_rate, decay_rate, quality in batch_results:
+                current = best.get(partition)
+                if current is None or quality.brier < current[2].brier:
+                    best[partition] = (learning_rate, decay_rate, quality)
+        return best
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+def _grid_search(evaluator: _Evaluator, partitions: list[tuple[str, int | None]], grid: tuple[float, ...]):
+    candidates = [(learning_rate, decay_rate) for learning_rate in grid for decay_rate in grid]
+    return evaluator.best({partition: candidates for partition in partitions})
+
+
+def _coordinate_search(evaluator: _Evaluator, partitions: list[tuple[str, int | None]], grid: tuple[float, ...]):
+    """Alternate one-dimensional line searches around the defaults, narrowing each round.
+
+    Lines of every partition are evaluated in the same fan-out, so the pool
+    stays busy with small partitions too.
+    """
+    best = {partition: (BASE_LEARNING_RATE_DEFAULT, BASE_DECAY_RATE_DEFAULT, None) for partition in partitions}
+    factor = math.sqrt(max(grid) / min(grid))
+    offsets = np.linspace(-1.0, 1.0, COORDINATE_POINTS)
+    for _ in range(COORDINATE_ROUNDS):
+        for axis in (0, 1):
+            candidates = {}
+            for partition, (learning_rate, decay_rate, _quality) in best.items():
+                center = (learning_rate, decay_rate)[axis]
+                line = sorted({min(1.0, center * factor**offset) for offset in offsets})
+                candidates[partition] = [
+                    (value, decay_rate) if axis == 0 else (learning_rate, value) for value in line
+                ]
+            best = evaluator.best(candidates)
+        factor = math.sqrt(factor)
+    return best
+
+
+def run_calibration(
+    db: Session,
+    scopes: list[str],
+    search: str = SEARCH_GRID,
+    workers: int = 1,
+    grid: tuple[float, ...] = DEFAULT_RATE_GRID,
+) -> CalibrationReport:
+    """Fit base learning/decay rates per scope partition on next-answer prediction.
+
+    Every group replays from an empty score with the candidate rates, and
+    the score before each answer is read as the probability of a correct
+    answer. Candidates are ranked by Brier score, a smooth proxy for
+    accuracy that grid and coordinate search both handle well; both
+    metrics are reported against the hand-picked defaults.
+    """
+    if search not in (SEARCH_GRID, SEARCH_COORDINATE):
+        raise ValueError(f'Unknown search {search!r}; expected {SEARCH_GRID!r} or {SEARCH_COORDINATE!r}')
+    started = time.perf_counter()
+    history = load_attempt_history(db)
+    partitions: dict[tuple[str, int | None], AttemptHistory] = {}
+    for scope in scopes:
+        for key, mask in partition_masks(history, scope).items():
+            subset = history.subset(mask)
+            if len(subset) - len(subset.group_starts) >= MIN_SCORED_ATTEMPTS:
+                partitions[(scope, key)] = subset
+
+    evaluator = _Evaluator(partitions, workers=workers)
+    try:
+        search_function = _grid_search if search == SEARCH_GRID else _coordinate_search
+        best = search_function(evaluator, list(partitions), grid) if partitions else {}
+    finally:
+        evaluator.close()
+
+    fits = [
+        PartitionFit(
+            scope=scope,
+            key=key,
+            rates=MasteryRates(learning_rate=learning_rate, decay_rate=decay_rate),
+            baseline=evaluate_rates(partitions[(scope, key)], BASE_LEARNING_RATE_DEFAULT, BASE_DECAY_RATE_DEFAULT),
+            fitted=quality,
+        )
+        for (scope, key), (learning_rate, decay_rate, quality) in best.items()
+    ]
+    return CalibrationReport(
+        fits=fits,
+        evaluations=evaluator.evaluations,
+        elapsed_seconds=time.perf_counter() - started,
+    )
@@ -1,15 +1,25 @@
 from __future__ import annotations
 
+import itertools
 import math
 from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
 
+from sqlalchemy import case, event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
 
 from app.models.attempt import Attempt
 from app.models.exercise import Exercise
 from app.models.subject import Subject
 from app.models.topic import Topic
 from app.models.user_mastery import UserMastery
+from app.services.knowledge_tracing import KnowledgeTracingModel
+from app.services.mastery_rates import get_mastery_rate_table
+
+if TYPE_CHECKING:
+    from app.services.curriculum_graph import TopicNode
 
 BASE_LEARNING_RATE_DEFAULT = 0.2
 BASE_DECAY_RATE_DEFAULT = 0.1
@@ -23,6 +33,8 @@ INACTIVITY_DAYS = 90
 REVALIDATION_CORRECT_REQUIRED = 3
 REVALIDATION_WINDOW_DAYS = 30
 REVIEW_DECAY_WINDOW_DAYS = 30.0
+# A row is due for review once its review priority reaches this value.
+REVIEW_DUE_PRIORITY = 1.0
 
 
 def _clamp(value: float, min_value: float, max_value: float) -> float:
@@ -36,8 +48,8 @@ def _utcnow() -> datetime:
 
 
 def _normalized_last_seen(mastery: UserMastery) -> datetime | None:
-    """Read last seen datetime with backward compatibility."""
-    last_seen = getattr(mastery, 'last_seen_at', None)
+    """Last answer time, falling back to `last_updated` for rows never answered since migration."""
+    last_seen = mastery.last_seen_at
     if last_seen is None:
         last_seen = mastery.last_updated
     if last_seen is None:
@@ -57,18 +69,43 @@ def calculate_learning_rate(
     return _clamp(rate, 0.001, 1.0)
 
 
-def calculate_effective_rates(topic_mastery: float, difficulty: float, criticality: int) -> tuple[float, float]:
+def base_rates(subject_id: int | None, criticality: int) -> tuple[float, float]:
+    """Base learning/decay rates from the calibrated rate table, or the defaults."""
+    rates = get_mastery_rate_table().rates_for(subject_id, criticality)
+    if rates is None:
+        return BASE_LEARNING_RATE_DEFAULT, BASE_DECAY_RATE_DEFAULT
+    return rates.learning_rate, rates.decay_rate
+
+
+def calculate_effective_rates(
+    topic_mastery: float,
+    difficulty: float,
+    criticality: int,
+    subject_id: int | None = None,
+) -> tuple[float, float]:
     """Compute weighted alpha/beta rates with difficulty and criticality factors."""
     _ = _clamp(float(topic_mastery), 0.0, 1.0)
     normalized_difficulty = _clamp(float(difficulty), MIN_DIFFICULTY, MAX_DIFFICULTY)
     normalized_criticality = int(_clamp(float(criticality), MIN_CRITICALITY, MAX_CRITICALITY))
     criticality_scale = math.log1p(normalized_criticality)
+    learning_rate, decay_rate = base_rates(subject_id, normalized_criticality)
 
-    effective_alpha = BASE_LEARNING_RATE_DEFAULT * normalized_difficulty * criticality_scale
-    effective_beta = BASE_DECAY_RATE_DEFAULT * (2.0 - normalized_difficulty) * criticality_scale
+    effective_alpha = learning_rate * normalized_difficulty * criticality_scale
+    effective_beta = decay_rate * (2.0 - normalized_difficulty) * criticality_scale
     return effective_alpha, effective_beta
 
 
+def knowledge_tracing_model(subject_id: int | None, topic_id: int | None) -> KnowledgeTracingModel | None:
+    """Knowledge-tracing model of a topic when its subject is configured for one, else None."""
+    return get_mastery_rate_table().knowledge_tracing.model_for(subject_id, topic_id)
+
+
+def initial_mastery_score(subject_id: int | None, topic_id: int | None) -> float:
+    """Score a topic's first answer starts from: the knowledge-tracing prior, or 0.0."""
+    model = knowledge_tracing_model(subject_id, topic_id)
+    return model.initial if model is not None else 0.0
+
+
 def get_threshold(subject: Subject, criticality: int) -> float:
     """Return mastery threshold by subject and criticality bucket."""
     if criticality >= 3:
@@ -126,26 +163,51 @@ def calculate_review_priority(
     return (1.0 - score) + decay_factor
 
 
-def has_passed_revalidation(
-    db: Session,
-    user_id: int,
-    topic_id: int,
-    required_correct: int = REVALIDATION_CORRECT_REQUIRED,
-) -> bool:
+def calculate_next_review_at(mastery_score: float, last_seen_at: datetime) -> datetime:
+    """Moment the review priority of a row reaches `REVIEW_DUE_PRIORITY`.
+
+    Priority grows linearly from (1 - score) with elapsed days, so stronger
+    topics come due later.
+    """
+    score = _clamp(float(mastery_score), 0.0, 1.0)
+    days_until_due = max(0.0, REVIEW_DUE_PRIORITY - (1.0 - score)) * REVIEW_DECAY_WINDOW_DAYS
+    return last_seen_at.replace(tzinfo=None) + timedelta(days=days_until_due)
+
+
+def has_passed_revalidation(db: Session, user_id: int, topic_id: int, now: datetime | None = None) -> bool:
     """Require a minimum number of recent correct attempts to revalidate a stale topic."""
-    cutoff = _utcnow() - timedelta(days=REVALIDATION_WINDOW_DAYS)
-    rows = (
-        db.query(Attempt)
-        .join(Exercise, Exercise.id == Attempt.exercise_id)
-        .filter(
-            Attempt.user_id == user_id,
-            Exercise.topic_id == topic_id,
-            Attempt.is_correct.is_(True),
-            Attempt.created_at >= cutoff,
-        )
-        .count()
+    mastery = get_mastery_row(db, user_id=user_id, topic_id=topic_id)
+    return mastery is not None and is_revalidated(mastery, now=now)
+
+
+def is_revalidated(mastery: UserMastery, now: datetime | None = None) -> bool:
+    """O(1) revalidation check from the counters kept on the mastery row.
+
+    True when `REVALIDATION_CORRECT_REQUIRED` correct attempts fall inside
+    the last `REVALIDATION_WINDOW_DAYS`.
+    """
+    revalidated_until = mastery.revalidated_until
+    if revalidated_until is None:
+        return False
+    return (now or _utcnow()).replace(tzinfo=None) <= revalidated_until.replace(tzinfo=None)
+
+
+def record_correct_attempt(mastery: UserMastery, at: datetime) -> None:
+    """Push a correct-attempt timestamp into the row's rolling revalidation window.
+
+    Only the latest `REVALIDATION_CORRECT_REQUIRED` timestamps matter: the
+    topic is revalidated while the oldest of them is inside the window.
+    Timestamps may arrive out of order (offline sync), so the list is kept sorted.
+    """
+    stamp = at.replace(tzinfo=None).isoformat(timespec='microseconds')
+    stamps = sorted([*(mastery.recent_correct_at or []), stamp])[-REVALIDATION_CORRECT_REQUIRED:]
+    # Assign a new list so the JSON column is seen as changed.
+    mastery.recent_correct_at = stamps
+    mastery.revalidated_until = (
+        datetime.fromisoformat(stamps[0]) + timedelta(days=REVALIDATION_WINDOW_DAYS)
+        if len(stamps) >= REVALIDATION_CORRECT_REQUIRED
+        else None
     )
-    return rows >= required_correct
 
 
 def calculate_mastery_score(old_score: float, is_correct: bool, alpha: float, beta: float) -> float:
@@ -160,27 +222,69 @@ def calculate_mastery_score(old_score: float, is_correct: bool, alpha: float, be
     return _clamp(score + delta, 0.0, 1.0)
 
 
-def _set_repetition_metadata(mastery: UserMastery, now: datetime) -> None:
-    """Update spaced-repetition tracking fields if available on the model."""
-    # Backward compatibility: legacy schema always has last_updated.
-    mastery.last_updated = now
+def next_mastery_score(
+    old_score: float,
+    is_correct: bool,
+    difficulty: float,
+    criticality: int,
+    subject_id: int | None = None,
+    topic_id: int | None = None,
+) -> float:
+    """Score after one answer under the subject's mastery model."""
+    model = knowledge_tracing_model(subject_id, topic_id)
+    if model is not None:
+        return model.update(old_score, is_correct)
+    alpha, beta = calculate_effective_rates(
+        topic_mastery=old_score,
+        difficulty=difficulty,
+        criticality=criticality,
+        subject_id=subject_id,
+    )
+    return calculate_mastery_score(old_score, is_correct, alpha, beta)
 
-    # Optional schema fields: only set when present in the mapped model.
-    if hasattr(mastery, 'last_seen_at'):
-        setattr(mastery, 'last_seen_at', now)
 
-    review_priority = calculate_review_priority(
+def _set_repetition_metadata(mastery: UserMastery, now: datetime) -> None:
+    """Update the spaced-repetition columns after an answer at `now`."""
+    mastery.last_updated = now
+    mastery.last_seen_at = now
+    mastery.next_review_at = calculate_next_review_at(float(mastery.mastery_score), now)
+    mastery.review_priority = calculate_review_priority(
         mastery_score=float(mastery.mastery_score),
         last_seen_at=now,
         now=now,
     )
-    if hasattr(mastery, 'review_priority'):
-        setattr(mastery, 'review_priority', review_priority)
-    else:
-        # Useful runtime attribute even before DB migration.
-        setattr(mastery, '_runtime_review_priority', review_priority)
+    mastery.is_completed = is_topic_completed(float(mastery.mastery_score))
+
+
+def _mastery_score_expr(is_correct: bool, alpha: float, beta: float):
+    """`calculate_mastery_score` over the stored score, as a SQL expression.
+
+    Same operations in the same order as the Python version, so both paths
+    round identically. The stored score needs no clamp: the table's CHECK
+    constraint keeps it in [0, 1].
+    """
+    score = UserMastery.mastery_score
+    increase_rate = _clamp(float(alpha), 0.0, 1.0)
+    decrease_rate = _clamp(float(beta), 0.0, 1.0)
+    updated = score + increase_rate * (1.0 - score) if is_correct else score + -decrease_rate * score
+    return case((updated < 0.0, 0.0), (updated > 1.0, 1.0), else_=updated)
 
-    setattr(mastery, 'is_completed', is_topic_completed(float(mastery.mastery_score)))
+
+def _knowledge_tracing_score_expr(model: KnowledgeTracingModel, is_correct: bool):
+    """`KnowledgeTracingModel.update` over the stored score, as a SQL expression."""
+    score = UserMastery.mastery_score
+    a, b, c, d = model.coefficients(is_correct)
+    updated = (a * score + b) / (c * score + d)
+    return case((updated < 0.0, 0.0), (updated > 1.0, 1.0), else_=updated)
+
+
+def _upsert_for(dialect_name: str):
+    """Dialect INSERT construct with ON CONFLICT support, or None when the dialect has none."""
+    if dialect_name == 'postgresql':
+        return postgresql.insert
+    if dialect_name == 'sqlite':
+        return sqlite.insert
+    return None
 
 
 def update_mastery(
@@ -192,38 +296,96 @@ def update_mastery(
     criticality_level: int = 1,
     alpha: float = BASE_LEARNING_RATE_DEFAULT,
     beta: float = BASE_DECAY_RATE_DEFAULT,
+    commit: bool = True,
+    subject_id: int | None = None,
 ) -> UserMastery:
-    """Create or update a mastery record for a user and topic."""
-    mastery = (
-        db.query(UserMastery)
-        .filter(UserMastery.user_id == user_id, UserMastery.topic_id == topic_id)
-        .first()
-    )
-
-    if mastery is None:
-        mastery = UserMastery(user_id=user_id, topic_id=topic_id, mastery_score=0.0)
-        db.add(mastery)
+    """Create or update a mastery record for a user and topic.
+
+    The score moves with a single INSERT .. ON CONFLICT DO UPDATE that
+    computes the new value from the stored one, so concurrent answers on
+    the same row never lose an update and a first answer cannot race the
+    unique constraint. The statement also locks the row for the rest of the
+    transaction, which keeps the follow-up repetition columns consistent.
+    Dialects without ON CONFLICT read the row with SELECT .. FOR UPDATE
+    and write it back instead, which still leaves first answers racing.
+
+    With `commit=False` the change is only flushed, so the caller can
+    commit it together with the attempt in one transaction. `subject_id`
+    selects per-subject calibrated rates when a rate table is configured,
+    or the knowledge-tracing model when the table lists the subject under
+    it; `alpha`/`beta` only apply to the logistic-style update.
+    """
+    model = knowledge_tracing_model(subject_id, topic_id)
+    if model is not None:
+        inserted_score = model.update(model.initial, is_correct)
+        updated_score = _knowledge_tracing_score_expr(model, is_correct)
+    else:
+        # Rates do not depend on the current score, which is what lets the update run in SQL.
+        effective_alpha, effective_beta = calculate_effective_rates(
+            topic_mastery=0.0,
+            difficulty=difficulty,
+            criticality=criticality_level,
+            subject_id=subject_id,
+        )
+        if alpha != BASE_LEARNING_RATE_DEFAULT:
+            effective_alpha = _clamp(float(alpha), 0.0, 1.0)
+        if beta != BASE_DECAY_RATE_DEFAULT:
+            effective_beta = _clamp(float(beta), 0.0, 1.0)
+        inserted_score = calculate_mastery_score(0.0, is_correct, effective_alpha, effective_beta)
+        updated_score = _mastery_score_expr(is_correct, effective_alpha, effective_beta)
+
+    now = _utcnow()
+    insert = _upsert_for(db.get_bind().dialect.name)
+    if insert is None:
+        with db.no_autoflush:
+            mastery = (
+                db.query(UserMastery)
+                .filter(UserMastery.user_id == user_id, UserMastery.topic_id == topic_id)
+                .with_for_update()
+                .populate_existing()
+                .first()
+            )
+        if mastery is None:
+            mastery = UserMastery(user_id=user_id, topic_id=topic_id, mastery_score=inserted_score)
+            db.add(mastery)
+        elif model is not None:
+            mastery.mastery_score = model.update(float(mastery.mastery_score), is_correct)
+        else:
+            mastery.mastery_score = calculate_mastery_score(
+                float(mastery.mastery_score),
+                is_correct,
+                effective_alpha,
+                effective_beta,
+            )
+        _set_repetition_metadata(mastery, now=now)
+    else:
+        statement = (
+            insert(UserMastery)
+            .values(
+                user_id=user_id,
+                topic_id=topic_id,
+                mastery_score=inserted_score,
+                last_updated=now,
+            )
+            .on_conflict_do_update(
+                index_elements=[UserMastery.user_id, UserMastery.topic_id],
+                set_={
+                    'mastery_score': updated_score,
+                    'last_updated': now,
+                },
+            )
+            .returning(UserMastery)
+        )
+        # Pending attempts flush afterwards, so the revalidation hook sees the updated row.
+        with db.no_autoflush:
+            mastery = db.scalars(statement, execution_options={'populate_existing': True}).one()
+        _set_repetition_metadata(mastery, now=now)
+        # The statement already stored `now`; keep it in the follow-up SET so its onupdate default does not fire.
+        flag_modified(mastery, 'last_updated')
+
+    if not commit:
         db.flush()
-
-    effective_alpha, effective_beta = calculate_effective_rates(
-        topic_mastery=float(mastery.mastery_score),
-        difficulty=difficulty,
-        criticality=criticality_level,
-    )
-    if alpha != BASE_LEARNING_RATE_DEFAULT:
-        effective_alpha = _clamp(float(alpha), 0.0, 1.0)
-    if beta != BASE_DECAY_RATE_DEFAULT:
-        effective_beta = _clamp(float(beta), 0.0, 1.0)
-
-    new_score = calculate_mastery_score(
-        mastery.mastery_score,
-        is_correct,
-        effective_alpha,
-        effective_beta,
-    )
-    mastery.mastery_score = _clamp(new_score, 0.0, 1.0)
-    _set_repetition_metadata(mastery, now=_utcnow())
-
+        return mastery
     db.commit()
     db.refresh(mastery)
     return mastery
@@ -248,38 +410,106 @@ def get_mastery_row(db: Session, user_id: int, topic_id: int) -> UserMastery | N
     )
 
 
+def get_due_reviews(
+    db: Session,
+    user_id: int,
+    limit: int = 20,
+    now: datetime | None = None,
+) -> list[UserMastery]:
+    """Most overdue topics first, read from the (user_id, next_review_at) index."""
+    reference = now or _utcnow()
+    return (
+        db.query(UserMastery)
+        .filter(UserMastery.user_id == user_id, UserMastery.next_review_at <= reference)
+        .order_by(UserMastery.next_review_at, UserMastery.topic_id)
+        .limit(limit)
+        .all()
+    )
+
+
 def get_topic_review_priority(db: Session, user_id: int, topic_id: int) -> float:
-    """Read review priority for a topic, with fallback if schema is not migrated yet."""
+    """Read the review priority of one topic."""
     mastery = get_mastery_row(db, user_id=user_id, topic_id=topic_id)
-    if mastery is None:
-        return calculate_review_priority(mastery_score=0.0, last_seen_at=None, now=_utcnow())
+    return review_priority_for_row(mastery, now=_utcnow())
+
 
-    persisted_priority = getattr(mastery, 'review_priority', None)
-    if persisted_priority is not None:
-        return float(persisted_priority)
+def review_priority_for_row(mastery: UserMastery | None, now: datetime) -> float:
+    """Resolve review priority from an already loaded mastery row.
 
-    runtime_priority = getattr(mastery, '_runtime_review_priority', None)
-    if runtime_priority is not None:
-        return float(runtime_priority)
+    The persisted priority is used as is; it is decayed by the review refresh
+    job. Rows without one (never answered since migration) are computed live.
+    """
+    if mastery is None:
+        return calculate_review_priority(mastery_score=0.0, last_seen_at=None, now=now)
+
+    stored_priority = stored_review_priority(mastery)
+    if stored_priority is not None:
+        return stored_priority
 
     return calculate_review_priority(
         mastery_score=float(mastery.mastery_score),
         last_seen_at=_normalized_last_seen(mastery),
-        now=_utcnow(),
+        now=now,
     )
 
 
-def is_topic_ready_for_unlock(db: Session, user_id: int, topic: Topic) -> bool:
+def stored_review_priority(mastery: UserMastery) -> float | None:
+    """Persisted review priority when one was written for the row."""
+    priority = mastery.review_priority
+    return float(priority) if priority is not None else None
+
+
+def is_topic_ready_for_unlock(db: Session, user_id: int, topic: Topic | TopicNode) -> bool:
     """Topic is ready when dominated, not in mandatory reinforcement, and revalidated if stale."""
     mastery = get_mastery_row(db, user_id, topic.id)
     if mastery is None:
         return False
 
-    score = float(mastery.mastery_score)
-    if not is_topic_dominated(topic.subject, int(topic.criticality_level), score):
+    if not is_score_ready_for_unlock(topic, float(mastery.mastery_score)):
         return False
-    if is_topic_in_development(topic.subject, int(topic.criticality_level), score):
-        return False
-    if is_inactive(mastery) and not has_passed_revalidation(db, user_id=user_id, topic_id=topic.id):
+    if is_inactive(mastery) and not is_revalidated(mastery):
         return False
     return True
+
+
+def is_score_ready_for_unlock(topic: Topic | TopicNode, mastery_score: float) -> bool:
+    """Score part of the unlock rule: dominated and out of the development range."""
+    criticality = int(topic.criticality_level)
+    if not is_topic_dominated(topic.subject, criticality, mastery_score):
+        return False
+    return not is_topic_in_development(topic.subject, criticality, mastery_score)
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_correct_attempts(session: Session, flush_context, instances) -> None:
+    """Keep the revalidation counters current for every correct attempt the ORM inserts.
+
+    The mastery row is looked up among the session's loaded objects first,
+    since the write paths add the attempt and update mastery in the same flush.
+    Attempts on topics without a mastery row are skipped: such a topic can
+    never be stale. Bulk inserts that bypass the ORM record their own.
+    """
+    attempts = [instance for instance in session.new if isinstance(instance, Attempt) and instance.is_correct]
+    if not attempts:
+        return
+    pending: dict[tuple[int, int], UserMastery] = {}
+    for instance in itertools.chain(session.identity_map.values(), session.new):
+        if not isinstance(instance, UserMastery):
+            continue
+        # Read loaded values only; touching an expired row would emit a SELECT.
+        loaded = inspect(instance).dict
+        if loaded.get('user_id') is not None and loaded.get('topic_id') is not None:
+            pending[(int(loaded['user_id']), int(loaded['topic_id']))] = instance
+    with session.no_autoflush:
+        for attempt in attempts:
+            exercise = session.get(Exercise, attempt.exercise_id)
+            if exercise is None or exercise.topic_id is None:
+                continue
+            key = (int(attempt.user_id), int(exercise.topic_id))
+            mastery = pending.get(key)
+            if mastery is None:
+                mastery = get_mastery_row(session, user_id=key[0], topic_id=key[1])
+            if mastery is None:
+                continue
+            pending[key] = mastery
+            record_correct_attempt(mastery, at=attempt.created_at or _utcnow())
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import json
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from app.core.config import settings
+from app.services.knowledge_tracing import KnowledgeTracingTable
+
+
+@dataclass(frozen=True)
+class MasteryRates:
+    """Base learning and decay rates before difficulty and criticality scaling."""
+
+    learning_rate: float
+    decay_rate: float
+
+    def to_dict(self) -> dict[str, float]:
+        return {'learning_rate': self.learning_rate, 'decay_rate': self.decay_rate}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> MasteryRates:
+        return cls(learning_rate=float(data['learning_rate']), decay_rate=float(data['decay_rate']))
+
+
+@dataclass(frozen=True)
+class MasteryRateTable:
+    """Calibrated base rates; the most specific entry wins: subject, then criticality, then global.
+
+    Subjects listed in `knowledge_tracing` are scored with that model instead.
+    """
+
+    global_rates: MasteryRates | None = None
+    by_subject: dict[int, MasteryRates] = field(default_factory=dict)
+    by_criticality: dict[int, MasteryRates] = field(default_factory=dict)
+    knowledge_tracing: KnowledgeTracingTable = field(default_factory=KnowledgeTracingTable)
+
+    def rates_for(self, subject_id: int | None, criticality: int) -> MasteryRates | None:
+        """Rates for one topic, or None when the engine defaults apply."""
+        if subject_id is not None and subject_id in self.by_subject:
+            return self.by_subject[subject_id]
+        return self.by_criticality.get(criticality, self.global_rates)
+
+    def to_dict(self) -> dict:
+        return {
+            'global': self.global_rates.to_dict() if self.global_rates is not None else None,
+            'subjects': {str(key): rates.to_dict() for key, rates in sorted(self.by_subject.items())},
+            'criticality': {str(key): rates.to_dict() for key, rates in sorted(self.by_criticality.items())},
+            'knowledge_tracing': self.knowledge_tracing.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> MasteryRateTable:
+        global_rates = data.get('global')
+        return cls(
+            global_rates=MasteryRates.from_dict(global_rates) if global_rates else None,
+            by_subject={int(key): MasteryRates.from_dict(value) for key, value in data.get('subjects', {}).items()},
+            by_criticality={
+                int(key): MasteryRates.from_dict(value) for key, value in data.get('criticality', {}).items()
+            },
+            knowledge_tracing=KnowledgeTracingTable.from_dict(data.get('knowledge_tracing', {})),
+        )
+
+
+def load_mastery_rate_table(path: str | Path) -> MasteryRateTable:
+    return MasteryRateTable.from_dict(json.loads(Path(path).read_text(encoding='utf-8')))
+
+
+def save_mastery_rate_table(table: MasteryRateTable, path: str | Path) -> None:
+    Path(path).write_text(json.dumps(table.to_dict(), indent=2) + '\n', encoding='utf-8')
+
+
+_EMPTY_TABLE = MasteryRateTable()
+_tables: dict[str, MasteryRateTable] = {}
+_tables_lock = threading.Lock()
+
+
+def get_mastery_rate_table() -> MasteryRateTable:
+    """Rate table named by `MASTERY_RATES_PATH`, read once per path; empty when unset."""
+    path = settings.MASTERY_RATES_PATH
+    if not path:
+        return _EMPTY_TABLE
+    table = _tables.get(path)
+    if table is None:
+        with _tables_lock:
+            table = _tables.get(path)
+            if table is None:
+                table = _tables.setdefault(path, load_mastery_rate_table(path))
+    return table
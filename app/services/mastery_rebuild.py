@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.models.attempt import Attempt
+from app.models.exercise import Exercise
+from app.models.topic import Topic
+from app.models.user_mastery import UserMastery
+from app.services.mastery_engine import (
+    BASE_DECAY_RATE_DEFAULT,
+    BASE_LEARNING_RATE_DEFAULT,
+    MAX_CRITICALITY,
+    MAX_DIFFICULTY,
+    MIN_CRITICALITY,
+    MIN_DIFFICULTY,
+    REVALIDATION_CORRECT_REQUIRED,
+    _utcnow,
+    base_rates,
+    calculate_next_review_at,
+    calculate_review_priority,
+    is_topic_completed,
+    knowledge_tracing_model,
+    record_correct_attempt,
+)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class RebuiltMastery:
+    """Final state of one (user, topic) group after replaying its attempts."""
+
+    user_id: int
+    topic_id: int
+    mastery_score: float
+    last_seen_at: datetime
+    recent_correct_at: list[datetime]
+
+
+def base_rate_arrays(subject_ids: np.ndarray, criticality: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Per-answer `base_rates`, looked up once per distinct (subject, criticality)."""
+    levels = np.clip(criticality, MIN_CRITICALITY, MAX_CRITICALITY).astype(np.int64)
+    pairs, inverse = np.unique(np.stack([subject_ids, levels], axis=1), axis=0, return_inverse=True)
+    rates = np.array([base_rates(int(subject_id), int(level)) for subject_id, level in pairs], dtype=np.float64)
+    inverse = inverse.reshape(-1)
+    return rates[inverse, 0], rates[inverse, 1]
+
+
+def knowledge_tracing_arrays(
+    subject_ids: np.ndarray,
+    topic_ids: np.ndarray,
+    is_correct: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray] | None:
+    """Per-answer knowledge-tracing mask, coefficients (a, b, c, d) and starting score.
+
+    Models are looked up once per distinct (subject, topic); None when no
+    answer belongs to a subject scored with knowledge tracing. Answers
+    outside the mask get the identity map and a starting score of 0.0.
+    """
+    pairs, inverse = np.unique(np.stack([subject_ids, topic_ids], axis=1), axis=0, return_inverse=True)
+    models = [knowledge_tracing_model(int(subject_id), int(topic_id)) for subject_id, topic_id in pairs]
+    if all(model is None for model in models):
+        return None
+    # Row k holds the wrong-answer coefficients of pair k, row k + len(pairs) the correct-answer ones.
+    table = np.array(
+        [model.wrong if model is not None else (1.0, 0.0, 0.0, 1.0) for model in models]
+        + [model.correct if model is not None else (1.0, 0.0, 0.0, 1.0) for model in models],
+        dtype=np.float64,
+    )
+    inverse = inverse.reshape(-1)
+    traced = np.array([model is not None for model in models], dtype=bool)[inverse]
+    initial = np.array([model.initial if model is not None else 0.0 for model in models], dtype=np.float64)[inverse]
+    return traced, table[inverse + len(pairs) * is_correct.astype(np.int64)], initial
+
+
+def effective_rates(
+    difficulty: np.ndarray,
+    criticality: np.ndarray,
+    learning_rate: np.ndarray | float = BASE_LEARNING_RATE_DEFAULT,
+    decay_rate: np.ndarray | float = BASE_DECAY_RATE_DEFAULT,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Vectorized `calculate_effective_rates`, clamped to [0, 1] like `calculate_mastery_score`."""
+    normalized_difficulty = np.clip(difficulty, MIN_DIFFICULTY, MAX_DIFFICULTY)
+    criticality_scale = np.log1p(np.clip(criticality, MIN_CRITICALITY, MAX_CRITICALITY).astype(np.int64))
+    alpha = learning_rate * normalized_difficulty * criticality_scale
+    beta = decay_rate * (2.0 - normalized_difficulty) * criticality_scale
+    return np.clip(alpha, 0.0, 1.0), np.clip(beta, 0.0, 1.0)
+
+
+def segmented_affine_scan(slope: np.ndarray, offset: np.ndarray, group_starts: np.ndarray) -> np.ndarray:
+    """Inclusive scan of `s -> slope * s + offset` within each group, applied to s = 0.
+
+    Uses log2(longest group) doubling steps over the whole array instead of
+    a Python loop per answer. `group_starts` holds the first index of every
+    group, in ascending order.
+    """
+    size = len(slope)
+    lengths = np.diff(np.append(group_starts, size))
+    first = np.repeat(group_starts, lengths)
+    positions = np.arange(size)
+    slope = slope.astype(np.float64, copy=True)
+    offset = offset.astype(np.float64, copy=True)
+    step = 1
+    longest = int(lengths.max(initial=0))
+    while step < longest:
+        current = positions[positions - step >= first]
+        previous = current - step
+        # Earlier maps first: s -> slope[i] * (slope[j] * s + offset[j]) + offset[i].
+        offset[current] = slope[current] * offset[previous] + offset[current]
+        slope[current] = slope[current] * slope[previous]
+        step *= 2
+    return offset
+
+
+def segmented_fractional_scan(
+    coefficients: np.ndarray,
+    group_starts: np.ndarray,
+    initial: np.ndarray | float = 0.0,
+) -> np.ndarray:
+    """Inclusive scan of `s -> (a s + b) / (c s + d)` within each group, applied to s = `initial`.
+
+    `coefficients` has one (a, b, c, d) row per answer. The maps compose as
+    2x2 matrices with the same doubling steps as `segmented_affine_scan`;
+    each product is rescaled by its `d`, which stays positive because every
+    map keeps [0, 1] in place, so long groups neither overflow nor underflow.
+    A per-answer `initial` must hold the same value across each group.
+    """
+    size = len(coefficients)
+    lengths = np.diff(np.append(group_starts, size))
+    first = np.repeat(group_starts, lengths)
+    positions = np.arange(size)
+    a, b, c, d = (coefficients[:, column].astype(np.float64, copy=True) for column in range(4))
+    step = 1
+    longest = int(lengths.max(initial=0))
+    while step < longest:
+        current = positions[positions - step >= first]
+        previous = current - step
+        # Earlier map first: [[a, b], [c, d]][current] @ [[a, b], [c, d]][previous].
+        a_new = a[current] * a[previous] + b[current] * c[previous]
+        b_new = a[current] * b[previous] + b[current] * d[previous]
+        c_new = c[current] * a[previous] + d[current] * c[previous]
+        d_new = c[current] * b[previous] + d[current] * d[previous]
+        a[current], b[current], c[current], d[current] = a_new / d_new, b_new / d_new, c_new / d_new, 1.0
+        step *= 2
+    return (a * initial + b) / (c * initial + d)
+
+
+def rebuild_groups(
+    user_ids: np.ndarray,
+    topic_ids: np.ndarray,
+    is_correct: np.ndarray,
+    difficulty: np.ndarray,
+    criticality: np.ndarray,
+    answered_at: list[datetime],
+    learning_rate: np.ndarray | float = BASE_LEARNING_RATE_DEFAULT,
+    decay_rate: np.ndarray | float = BASE_DECAY_RATE_DEFAULT,
+    knowledge_tracing: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None,
+) -> list[RebuiltMastery]:
+    """Replay attempts sorted by (user, topic, time) with the `update_mastery` arithmetic.
+
+    Rates do not depend on the running score, so every answer is an affine
+    map of the previous score (correct: s + alpha(1 - s), wrong: s - beta s)
+    and the whole history of a group folds with one segmented scan.
+    Answers flagged in `knowledge_tracing` (see `knowledge_tracing_arrays`)
+    use their linear-fractional map from the topic's starting score instead,
+    and the scan runs on 2x2 maps.
+    """
+    if len(user_ids) == 0:
+        return []
+    alpha, beta = effective_rates(difficulty, criticality, learning_rate, decay_rate)
+    slope = np.where(is_correct, 1.0 - alpha, 1.0 - beta)
+    offset = np.where(is_correct, alpha, 0.0)
+
+    boundary = np.flatnonzero((np.diff(user_ids) != 0) | (np.diff(topic_ids) != 0)) + 1
+    group_starts = np.concatenate(([0], boundary))
+    group_ends = np.append(boundary, len(user_ids)) - 1
+    if knowledge_tracing is None:
+        folded = segmented_affine_scan(slope, offset, group_starts)
+    else:
+        traced, coefficients, initial = knowledge_tracing
+        # An affine map is the linear-fractional map with c = 0 and d = 1.
+        affine = np.stack([slope, offset, np.zeros_like(slope), np.ones_like(slope)], axis=1)
+        folded = segmented_fractional_scan(np.where(traced[:, None], coefficients, affine), group_starts, initial)
+    scores = np.clip(folded[group_ends], 0.0, 1.0)
+
+    # Latest correct answers per group, as many as revalidation looks at.
+    group_of = np.repeat(np.arange(len(group_starts)), np.diff(np.append(group_starts, len(user_ids))))
+    correct_rows = np.flatnonzero(is_correct)
+    correct_groups = group_of[correct_rows]
+    from_end = np.searchsorted(correct_groups, correct_groups, side='right') - 1 - np.arange(len(correct_rows))
+    kept_rows = correct_rows[from_end < REVALIDATION_CORRECT_REQUIRED]
+    kept_bounds = np.searchsorted(group_of[kept_rows], np.arange(len(group_starts) + 1))
+
+    return [
+        RebuiltMastery(
+            user_id=int(user_ids[end]),
+            topic_id=int(topic_ids[end]),
+            mastery_score=float(scores[group]),
+            last_seen_at=answered_at[end],
+            recent_correct_at=[answered_at[row] for row in kept_rows[kept_bounds[group]:kept_bounds[group + 1]]],
+        )
+        for group, end in enumerate(group_ends.tolist())
+    ]
+
+
+def _mastery_values(rebuilt: RebuiltMastery, now: datetime) -> dict:
+    """Column values `update_mastery` would have left after the group's last answer."""
+    row = SimpleNamespace(recent_correct_at=None, revalidated_until=None)
+    for at in rebuilt.recent_correct_at:
+        record_correct_attempt(row, at=at)
+    last_seen = rebuilt.last_seen_at
+    return {
+        'user_id': rebuilt.user_id,
+        'topic_id': rebuilt.topic_id,
+        'mastery_score': rebuilt.mastery_score,
+        'last_updated': last_seen,
+        'last_seen_at': last_seen,
+        'next_review_at': calculate_next_review_at(rebuilt.mastery_score, last_seen),
+        # Decayed to the rebuild time, as the review refresh job would leave it.
+        'review_priority': calculate_review_priority(rebuilt.mastery_score, last_seen, now=now),
+        'is_completed': is_topic_completed(rebuilt.mastery_score),
+        'recent_correct_at': row.recent_correct_at,
+        'revalidated_until': row.revalidated_until,
+    }
+
+
+def rebuild_user_ids(db: Session, start_user_id: int | None = None, end_user_id: int | None = None) -> list[int]:
+    """Users with logged attempts in the inclusive id range."""
+    query = db.query(Attempt.user_id).distinct()
+    if start_user_id is not None:
+        query = query.filter(Attempt.user_id >= start_user_id)
+    if end_user_id is not None:
+        query = query.filter(Attempt.user_id <= end_user_id)
+    return [int(user_id) for (user_id,) in query.order_by(Attempt.user_id).all()]
+
+
+def _load_chunk(db: Session, user_ids: list[int]) -> list[RebuiltMastery]:
+    """Attempts of one user chunk with difficulty, criticality and mastery model, folded into final rows."""
+    rows = db.execute(
+        select(
+            Attempt.user_id,
+            Exercise.topic_id,
+            Attempt.is_correct,
+            func.coalesce(Exercise.difficulty, 1.0),
+            Topic.criticality_level,
+            Topic.subject_id,
+            Attempt.created_at,
+        )
+        .join(Exercise, Exercise.id == Attempt.exercise_id)
+        .join(Topic, Topic.id == Exercise.topic_id)
+        .where(Attempt.user_id.in_(user_ids))
+        .order_by(Attempt.user_id, Exercise.topic_id, Attempt.created_at, Attempt.id)
+    ).all()
+    if not rows:
+        return []
+    users, topics, correct, difficulty, criticality_levels, subjects, times = zip(*rows)
+    criticality = np.fromiter(criticality_levels, dtype=np.float64, count=len(rows))
+    subject_ids = np.fromiter(subjects, dtype=np.int64, count=len(rows))
+    topic_ids = np.fromiter(topics, dtype=np.int64, count=len(rows))
+    is_correct = np.fromiter(correct, dtype=bool, count=len(rows))
+    learning_rate, decay_rate = base_rate_arrays(subject_ids, criticality)
+    return rebuild_groups(
+        user_ids=np.fromiter(users, dtype=np.int64, count=len(rows)),
+        topic_ids=topic_ids,
+        is_correct=is_correct,
+        difficulty=np.fromiter(difficulty, dtype=np.float64, count=len(rows)),
+        criticality=criticality,
+        answered_at=[at.replace(tzinfo=None) for at in times],
+        learning_rate=learning_rate,
+        decay_rate=decay_rate,
+        knowledge_tracing=knowledge_tracing_arrays(subject_ids, topic_ids, is_correct),
+    )
+
+
+def _write_chunk(db: Session, user_ids: list[int], rebuilt: list[RebuiltMastery], now: datetime) -> None:
+    """Update existing rows by primary key and insert the missing ones with two bulk statements."""
+    existing = {
+        (int(user_id), int(topic_id)): int(row_id)
+        for row_id, user_id, topic_id in db.query(UserMastery.id, UserMastery.user_id, UserMastery.topic_id).filter(
+            UserMastery.user_id.in_(user_ids)
+        )
+    }
+    updates: list[dict] = []
+    inserts: list[dict] = []
+    for group in rebuilt:
+        values = _mastery_values(group, now)
+        row_id = existing.get((group.user_id, group.topic_id))
+        if row_id is None:
+            inserts.append(values)
+        else:
+            updates.append({'id': row_id, **values})
+    if updates:
+        db.execute(update(UserMastery), updates)
+    if inserts:
+        db.execute(insert(UserMastery), inserts)
+
+
+def rebuild_mastery(
+    db: Session,
+    start_user_id: int | None = None,
+    end_user_id: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    on_chunk: Callable[[int, int], None] | None = None,
+) -> int:
+    """Recompute `user_mastery` from the attempts of every user in the id range.
+
+    Users are processed in ascending id order, `chunk_size` at a time, with
+    one commit per chunk; `on_chunk(last_user_id, rows)` is called after
+    each commit, so an interrupted run resumes from the next user id. Rows
+    of topics without attempts are left untouched. Returns the number of
+    mastery rows written.
+
+    The writes are bulk statements from this process, so a running server
+    keeps serving its cached suggestions until they expire after
+    `RECOMMENDATION_CACHE_TTL_SECONDS`.
+    """
+    now = _utcnow()
+    user_ids = rebuild_user_ids(db, start_user_id=start_user_id, end_user_id=end_user_id)
+    step = max(1, chunk_size)
+    written = 0
+    for start in range(0, len(user_ids), step):
+        chunk = user_ids[start:start + step]
+        rebuilt = _load_chunk(db, chunk)
+        _write_chunk(db, chunk, rebuilt, now)
+        db.commit()
+        written += len(rebuilt)
+        if on_chunk is not None:
+            on_chunk(chunk[-1], len(rebuilt))
+    return written
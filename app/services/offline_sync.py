@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from fastapi import HTTPException, status
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models.attempt import Attempt
+from app.models.exercise import Exercise
+from app.models.user import User
+from app.models.user_mastery import UserMastery
+from app.services.adaptation_engine import observe_answer
+from app.services.curriculum_graph import get_curriculum_graph
+from app.services.mastery_engine import (
+    _clamp,
+    _set_repetition_metadata,
+    _upsert_for,
+    _utcnow,
+    initial_mastery_score,
+    next_mastery_score,
+    record_correct_attempt,
+)
+
+
+def normalize_answer(value: str) -> str:
+    """Case- and whitespace-insensitive form used to grade free-text answers."""
+    return ' '.join(value.strip().lower().split())
+
+
+def _as_naive_utc(value: datetime) -> datetime:
+    """Client timestamps may carry an offset; the engine clock is naive UTC."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@dataclass(frozen=True)
+class OfflineAnswer:
+    """One answer recorded by a client while offline."""
+
+    exercise_id: int
+    answer: str
+    answered_at: datetime | None = None
+
+
+@dataclass(frozen=True)
+class GradedAnswer:
+    """Outcome of one synced answer, with the topic mastery right after it."""
+
+    exercise_id: int
+    correct: bool
+    correct_answer: str
+    mastery_score: float
+
+
+def submit_offline_answers(db: Session, user_id: int, answers: list[OfflineAnswer]) -> list[GradedAnswer]:
+    """Grade an ordered batch of answers and persist it in one transaction.
+
+    Exercises and the touched mastery rows are loaded with one query each
+    and topics come from the cached catalog. Missing mastery rows are
+    created up front and the rows are read under lock, so answers submitted
+    concurrently are neither lost nor rejected. Mastery updates are applied
+    in submission order in memory, then every attempt and the final
+    mastery rows are written by a single commit. Client timestamps in the
+    future are clamped to the server clock.
+    """
+    if db.query(User.id).filter(User.id == user_id).first() is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
+
+    exercise_ids = {answer.exercise_id for answer in answers}
+    exercises = {int(exercise.id): exercise for exercise in db.query(Exercise).filter(Exercise.id.in_(exercise_ids))}
+    if len(exercises) != len(exercise_ids):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Exercise not found')
+    if any(exercise.topic_id is None for exercise in exercises.values()):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Exercise has no topic assigned',
+        )
+    graph = get_curriculum_graph(db)
+    topic_ids = {int(exercise.topic_id) for exercise in exercises.values()}
+    if any(topic_id not in graph.topics for topic_id in topic_ids):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Topic not found')
+
+    insert_missing = _upsert_for(db.get_bind().dialect.name)
+    if insert_missing is not None:
+        # Every touched row exists from here on, so a concurrent first answer cannot hit the unique
+        # constraint. The write also starts this transaction, which on SQLite holds off every other
+        # writer until the commit.
+        missing = [
+            {
+                'user_id': user_id,
+                'topic_id': topic_id,
+                'mastery_score': initial_mastery_score(graph.topics[topic_id].subject_id, topic_id),
+            }
+            for topic_id in sorted(topic_ids)
+        ]
+        db.execute(
+            insert_missing(UserMastery)
+            .values(missing)
+            .on_conflict_do_nothing(index_elements=[UserMastery.user_id, UserMastery.topic_id])
+        )
+    # Locked and re-read inside the write transaction, so concurrent submits queue behind this batch.
+    rows = {
+        int(row.topic_id): row
+        for row in db.query(UserMastery)
+        .filter(UserMastery.user_id == user_id, UserMastery.topic_id.in_(topic_ids))
+        .order_by(UserMastery.topic_id)
+        .with_for_update()
+        .populate_existing()
+    }
+
+    now = _utcnow()
+    graded: list[GradedAnswer] = []
+    observations: list[tuple[int, int, bool, float]] = []
+    attempt_rows: list[dict] = []
+    for answer in answers:
+        exercise = exercises[answer.exercise_id]
+        topic = graph.topics[int(exercise.topic_id)]
+        answered_at = min(_as_naive_utc(answer.answered_at), now) if answer.answered_at is not None else now
+        is_correct = normalize_answer(answer.answer) == normalize_answer(exercise.answer)
+        attempt_rows.append(
+            {'user_id': user_id, 'exercise_id': int(exercise.id), 'is_correct': is_correct, 'created_at': answered_at}
+        )
+
+        row = rows.get(topic.id)
+        if row is None:
+            row = UserMastery(
+                user_id=user_id,
+                topic_id=topic.id,
+                mastery_score=initial_mastery_score(topic.subject_id, topic.id),
+            )
+            db.add(row)
+            rows[topic.id] = row
+        previous = float(row.mastery_score)
+        row.mastery_score = _clamp(
+            next_mastery_score(
+                previous,
+                is_correct,
+                difficulty=float(exercise.difficulty),
+                criticality=int(topic.criticality_level),
+                subject_id=topic.subject_id,
+                topic_id=topic.id,
+            ),
+            0.0,
+            1.0,
+        )
+        _set_repetition_metadata(row, now=answered_at)
+        if is_correct:
+            # The bulk attempt insert bypasses the ORM hook that maintains these counters.
+            record_correct_attempt(row, at=answered_at)
+
+        graded.append(
+            GradedAnswer(
+                exercise_id=int(exercise.id),
+                correct=is_correct,
+                correct_answer=exercise.answer,
+                mastery_score=float(row.mastery_score),
+            )
+        )
+        observations.append((topic.id, int(exercise.id), is_correct, float(row.mastery_score) - previous))
+
+    # Attempts are never read back here, so they go in as one executemany.
+    db.execute(insert(Attempt), attempt_rows)
+    db.commit()
+    for topic_id, exercise_id, is_correct, gain in observations:
+        observe_answer(user_id, topic_id=topic_id, exercise_id=exercise_id, is_correct=is_correct, mastery_gain=gain)
+    return graded
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import time
+from array import array
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import groupby
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.models.attempt import Attempt
+from app.models.exercise import Exercise
+from app.services.adaptation_engine import SelectionPolicy, _unlocked_topics
+from app.services.curriculum_graph import CurriculumGraph, get_curriculum_graph
+from app.services.learning_state import UserLearningState
+from app.services.selection_policies import create_selection_policy
+from app.services.unlock_frontier import UnlockFrontierCache
+
+DEFAULT_CHUNK_SIZE = 500
+STREAM_BATCH_SIZE = 5000
+
+
+@dataclass
+class ReplayMetrics:
+    """Agreement with the logged decisions and per-decision cost of one policy.
+
+    Following the replay method, outcomes are only credited to the policy on
+    decisions where its choice matches the logged one.
+    """
+
+    policy: str
+    users: int = 0
+    decisions: int = 0
+    exercise_matches: int = 0
+    topic_matches: int = 0
+    matched_correct: int = 0
+    matched_mastery_gain: float = 0.0
+    latencies_ms: array = field(default_factory=lambda: array('d'))
+
+    def merge(self, other: ReplayMetrics) -> None:
+        self.users += other.users
+        self.decisions += other.decisions
+        self.exercise_matches += other.exercise_matches
+        self.topic_matches += other.topic_matches
+        self.matched_correct += other.matched_correct
+        self.matched_mastery_gain += other.matched_mastery_gain
+        self.latencies_ms.extend(other.latencies_ms)
+
+    @property
+    def topic_match_rate(self) -> float:
+        return self.topic_matches / self.decisions if self.decisions else 0.0
+
+    @property
+    def exercise_match_rate(self) -> float:
+        return self.exercise_matches / self.decisions if self.decisions else 0.0
+
+    @property
+    def matched_accuracy(self) -> float:
+        """Share of correct answers on decisions where the policy chose the logged topic."""
+        return self.matched_correct / self.topic_matches if self.topic_matches else 0.0
+
+    @property
+    def matched_mean_gain(self) -> float:
+        """Mean mastery gain on decisions where the policy chose the logged topic."""
+        return self.matched_mastery_gain / self.topic_matches if self.topic_matches else 0.0
+
+    def latency_percentile(self, percentile: float) -> float:
+        if not self.latencies_ms:
+            return 0.0
+        return float(np.percentile(np.frombuffer(self.latencies_ms, dtype=np.float64), percentile))
+
+
+def replay_user_ids(db: Session) -> list[int]:
+    """Every user with at least one logged attempt."""
+    rows = db.query(Attempt.user_id).distinct().order_by(Attempt.user_id).all()
+    return [int(user_id) for (user_id,) in rows]
+
+
+def _stream_attempts(db: Session, user_ids: list[int]) -> Iterator:
+    """Logged attempts of the given users in user, time order, fetched in batches."""
+    return (
+        db.query(
+            Attempt.user_id,
+            Attempt.exercise_id,
+            Attempt.is_correct,
+            Attempt.created_at,
+            Exercise.topic_id,
+            Exercise.difficulty,
+        )
+        .join(Exercise, Exercise.id == Attempt.exercise_id)
+        .filter(Attempt.user_id.in_(user_ids))
+        .order_by(Attempt.user_id, Attempt.created_at, Attempt.id)
+        .yield_per(STREAM_BATCH_SIZE)
+    )
+
+
+def replay_attempts(
+    db: Session,
+    graph: CurriculumGraph,
+    policy: SelectionPolicy,
+    user_ids: list[int],
+) -> ReplayMetrics:
+    """Replay the logged attempts of `user_ids` against one policy.
+
+    Each learner starts from an empty state that is rebuilt from their own
+    answers with the live mastery arithmetic. Before every logged answer the
+    policy makes its decision on the state as it was at that moment.
+    """
+    metrics = ReplayMetrics(policy=policy.name)
+    exercise_topics = {
+        exercise_id: topic_id for topic_id, exercise_ids in graph.exercise_ids.items() for exercise_id in exercise_ids
+    }
+    frontiers = UnlockFrontierCache(maxsize=1)
+
+    for user_id, rows in groupby(_stream_attempts(db, user_ids), key=lambda row: int(row.user_id)):
+        metrics.users += 1
+        state: UserLearningState | None = None
+        for row in rows:
+            at = row.created_at.replace(tzinfo=None)
+            if state is None:
+                state = UserLearningState(user_id=user_id, now=at)
+            state.now = at
+
+            started = time.perf_counter()
+            unlocked_topics = _unlocked_topics(graph, state, frontiers)
+            chosen_id = policy.choose_exercise_id(graph, state, unlocked_topics) if unlocked_topics else None
+            metrics.latencies_ms.append((time.perf_counter() - started) * 1000.0)
+            metrics.decisions += 1
+
+            metrics.exercise_matches += int(chosen_id == int(row.exercise_id))
+            topic = graph.topics.get(int(row.topic_id))
+            if topic is None:
+                continue
+            topic_matched = chosen_id is not None and exercise_topics.get(chosen_id) == topic.id
+
+            before = state.mastery_score(topic.id)
+            after = state.apply_answer(topic, is_correct=bool(row.is_correct), difficulty=float(row.difficulty), at=at)
+            gain = after - before
+            policy.observe(user_id, topic.id, int(row.exercise_id), bool(row.is_correct), gain)
+            if topic_matched:
+                metrics.topic_matches += 1
+                metrics.matched_correct += int(bool(row.is_correct))
+                metrics.matched_mastery_gain += gain
+    return metrics
+
+
+def replay_chunk(database_url: str, policy_name: str, user_ids: list[int]) -> ReplayMetrics:
+    """Replay one chunk of users; runs inside a pool worker with its own engine and policy."""
+    engine = create_engine(database_url)
+    try:
+        with Session(bind=engine) as db:
+            return replay_attempts(db, get_curriculum_graph(db), create_selection_policy(policy_name), user_ids)
+    finally:
+        engine.dispose()
+
+
+def run_policy_replay(
+    db: Session,
+    database_url: str,
+    policy_names: list[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = 1,
+) -> dict[str, ReplayMetrics]:
+    """Replay every logged attempt against each policy and merge the per-chunk metrics.
+
+    Users are split into chunks that run in a process pool when
+    `workers > 1`. Every chunk gets a fresh policy, so learning policies
+    learn from the users of their own chunk only.
+    """
+    # Fail on an unknown policy name before any chunk is scheduled.
+    for name in policy_names:
+        create_selection_policy(name)
+    user_ids = replay_user_ids(db)
+    chunks = [user_ids[start:start + chunk_size] for start in range(0, len(user_ids), max(1, chunk_size))]
+    results = {name: ReplayMetrics(policy=name) for name in policy_names}
+
+    if workers <= 1:
+        for name in policy_names:
+            for chunk in chunks:
+                results[name].merge(replay_chunk(database_url, name, chunk))
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            (name, pool.submit(replay_chunk, database_url, name, chunk))
+            for name in policy_names
+            for chunk in chunks
+        ]
+        for name, future in futures:
+            results[name].merge(future.result())
+    return results
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import threading
+from collections.abc import Hashable
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.exercise import Exercise
+from app.services.adaptation_engine import AdaptiveScope, ResolvedScope, recommend_next_exercise, resolve_scope
+from app.services.curriculum_graph import get_curriculum_graph
+from app.services.mastery_engine import _utcnow
+from app.services.recommendation_cache import recommendation_cache
+
+_BACKGROUND_WORKERS = 4
+
+_executor = ThreadPoolExecutor(max_workers=_BACKGROUND_WORKERS, thread_name_prefix='adaptive-refresh')
+_inflight: dict[tuple[int, Hashable], Future] = {}
+_inflight_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class BudgetedRecommendation:
+    """Suggestion served under a latency budget; `fallback` marks a degraded answer."""
+
+    exercise: Exercise | None
+    fallback: bool = False
+
+
+def _compute_in_background(bind, user_id: int, scope: AdaptiveScope | None) -> int | None:
+    """Full selection on a private session; storing the result refreshes the cache."""
+    with Session(bind=bind) as worker_db:
+        exercise = recommend_next_exercise(worker_db, user_id, scope=scope)
+        return int(exercise.id) if exercise is not None else None
+
+
+def _submit_refresh(db: Session, user_id: int, scope: AdaptiveScope | None) -> Future:
+    """Start (or join) the background selection for a user and scope."""
+    key = (user_id, scope)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is None:
+            future = _executor.submit(_compute_in_background, db.get_bind(), user_id, scope)
+            _inflight[key] = future
+            future.add_done_callback(lambda done: _forget_inflight(key, done))
+        return future
+
+
+def _forget_inflight(key: tuple[int, Hashable], future: Future) -> None:
+    with _inflight_lock:
+        if _inflight.get(key) is future:
+            del _inflight[key]
+
+
+def _default_exercise_id(resolved: ResolvedScope) -> int | None:
+    """Easiest exercise of the first servable entry topic, from the cached snapshot.
+
+    Entry topics have no prerequisites, so they are a safe default for a
+    learner whose state could not be evaluated in time.
+    """
+    graph = resolved.graph
+    servable = [
+        topic_id
+        for topic_id in graph.topic_ids
+        if topic_id in graph.exercise_index and (resolved.topic_ids is None or topic_id in resolved.topic_ids)
+    ]
+    for topic_id in servable:
+        if not graph.prerequisites.get(topic_id):
+            return graph.exercise_index[topic_id].exercise_ids[0]
+    if servable:
+        return graph.exercise_index[servable[0]].exercise_ids[0]
+    return None
+
+
+def recommend_within_budget(
+    db: Session,
+    user_id: int,
+    scope: AdaptiveScope | None = None,
+    budget_ms: int | None = None,
+) -> BudgetedRecommendation:
+    """Serve `recommend_next_exercise` within a latency budget.
+
+    A fresh cache hit is served directly. Otherwise selection runs on a
+    worker thread; if it misses the budget, the user's last known suggestion
+    (or a default entry exercise) is returned with `fallback=True` while the
+    worker finishes and refreshes the cache. A budget of 0 disables this.
+    """
+    budget = settings.ADAPTIVE_LATENCY_BUDGET_MS if budget_ms is None else budget_ms
+    if budget <= 0:
+        return BudgetedRecommendation(exercise=recommend_next_exercise(db, user_id, scope=scope))
+
+    graph = get_curriculum_graph(db)
+    cache_scope = None if scope is None or scope.is_global() else scope
+    resolved = resolve_scope(graph, scope)
+    cached = recommendation_cache.get(user_id, graph_version=resolved.graph.version, now=_utcnow(), scope=cache_scope)
+    if cached is not None:
+        exercise = db.get(Exercise, cached.exercise_id)
+        if exercise is not None:
+            return BudgetedRecommendation(exercise=exercise)
+
+    future = _submit_refresh(db, user_id, cache_scope)
+    try:
+        exercise_id = future.result(timeout=budget / 1000.0)
+    except FutureTimeoutError:
+        fallback_id = recommendation_cache.last_known(user_id, scope=cache_scope)
+        if fallback_id is None:
+            fallback_id = _default_exercise_id(resolved)
+        exercise = db.get(Exercise, fallback_id) if fallback_id is not None else None
+        return BudgetedRecommendation(exercise=exercise, fallback=True)
+
+    return BudgetedRecommendation(exercise=db.get(Exercise, exercise_id) if exercise_id is not None else None)
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.attempt import Attempt
+from app.models.user_mastery import UserMastery
+
+_CHANGED_USERS_KEY = 'recommendation_cache_changed_users'
+
+
+@dataclass(frozen=True)
+class CachedRecommendation:
+    """Last computed suggestion for a user and the conditions it depends on."""
+
+    exercise_id: int
+    graph_version: int
+    expires_at: float
+    valid_until: datetime | None
+
+
+class RecommendationCache:
+    """Bounded LRU of next-exercise suggestions keyed by user id and scope.
+
+    Entries are dropped when the user writes an attempt or mastery row, and
+    ignored when the catalog snapshot version changed, the TTL elapsed, or
+    the spaced-repetition clock crossed a stale/revalidation boundary. The
+    TTL also bounds drift from the continuous review-priority decay.
+
+    The last suggestion per user and scope is also remembered beyond
+    invalidation, as a degraded answer when selection runs over budget.
+
+    Every invalidation bumps the user's generation. Callers read
+    `generation` before loading the learner state and hand it to `put`,
+    which drops suggestions computed from state a write has since replaced.
+
+    The cache lives in one process and only sees writes flushed through its
+    sessions. The API runs as a single uvicorn worker (see render.yaml);
+    with several workers, or after CLI jobs write mastery rows, a learner may
+    be served a suggestion up to `RECOMMENDATION_CACHE_TTL_SECONDS` old.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float) -> None:
+        self.maxsize = max(0, int(maxsize))
+        self.ttl_seconds = float(ttl_seconds)
+        # user id -> scope -> entry, so a user's writes drop every scope at once.
+        self._entries: OrderedDict[int, dict[Hashable, CachedRecommendation]] = OrderedDict()
+        self._last_known: OrderedDict[int, dict[Hashable, int]] = OrderedDict()
+        # user id -> generation, bounded like the entries.
+        self._generations: OrderedDict[int, int] = OrderedDict()
+        self._counter = itertools.count(1)
+        # Generation of every user not tracked individually: raised by `clear` and by evictions.
+        self._generation_floor = 0
+        self._lock = threading.Lock()
+
+    def generation(self, user_id: int) -> int:
+        """Current generation of a user; changes whenever the user is invalidated."""
+        with self._lock:
+            # Tracked from now on, so evicting other users cannot move it before the `put`.
+            generation = self._generations.setdefault(user_id, self._generation_floor)
+            self._track_generation(user_id)
+            return generation
+
+    def _track_generation(self, user_id: int) -> None:
+        self._generations.move_to_end(user_id)
+        while len(self._generations) > max(1, self.maxsize):
+            # Evicted users fall back to the floor, which at worst drops an in-flight write.
+            _, evicted = self._generations.popitem(last=False)
+            self._generation_floor = max(self._generation_floor, evicted)
+
+    def get(
+        self,
+        user_id: int,
+        graph_version: int,
+        now: datetime,
+        scope: Hashable = None,
+    ) -> CachedRecommendation | None:
+        """Return a still-valid entry, evicting it otherwise."""
+        with self._lock:
+            scoped = self._entries.get(user_id)
+            entry = scoped.get(scope) if scoped is not None else None
+            if entry is None:
+                return None
+            expired = (
+                entry.graph_version != graph_version
+                or entry.expires_at <= time.monotonic()
+                or (entry.valid_until is not None and now >= entry.valid_until)
+            )
+            if expired:
+                del scoped[scope]
+                if not scoped:
+                    del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry
+
+    def put(
+        self,
+        user_id: int,
+        exercise_id: int,
+        graph_version: int,
+        generation: int,
+        valid_until: datetime | None = None,
+        scope: Hashable = None,
+    ) -> None:
+        """Store a suggestion, evicting the least recently used user when full.
+
+        The write is dropped when the user was invalidated after `generation`
+        was read, since the suggestion was computed from outdated state.
+        """
+        if self.maxsize == 0:
+            return
+        entry = CachedRecommendation(
+            exercise_id=exercise_id,
+            graph_version=graph_version,
+            expires_at=time.monotonic() + self.ttl_seconds,
+            valid_until=valid_until,
+        )
+        with self._lock:
+            if self._generations.get(user_id, self._generation_floor) != generation:
+                return
+            self._entries.setdefault(user_id, {})[scope] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._last_known.setdefault(user_id, {})[scope] = exercise_id
+            self._last_known.move_to_end(user_id)
+            while len(self._last_known) > self.maxsize:
+                self._last_known.popitem(last=False)
+
+    def last_known(self, user_id: int, scope: Hashable = None) -> int | None:
+        """Exercise id of the last suggestion stored for a user, even if since invalidated."""
+        with self._lock:
+            return self._last_known.get(user_id, {}).get(scope)
+
+    def invalidate(self, user_id: int) -> None:
+        """Forget every suggestion for one user and start a new generation."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._generations[user_id] = next(self._counter)
+            self._track_generation(user_id)
+
+    def clear(self) -> None:
+        """Forget every suggestion and start a new generation for every user."""
+        with self._lock:
+            self._entries.clear()
+            self._last_known.clear()
+            self._generations.clear()
+            self._generation_floor = next(self._counter)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+recommendation_cache = RecommendationCache(
+    maxsize=settings.RECOMMENDATION_CACHE_SIZE,
+    ttl_seconds=settings.RECOMMENDATION_CACHE_TTL_SECONDS,
+)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_learning_writes(session: Session, flush_context) -> None:
+    """Invalidate users whose attempts or mastery rows were written."""
+    changed_users = {
+        int(instance.user_id)
+        for instance in itertools.chain(session.new, session.dirty, session.deleted)
+        if isinstance(instance, (Attempt, UserMastery)) and instance.user_id is not None
+    }
+    if not changed_users:
+        return
+    session.info.setdefault(_CHANGED_USERS_KEY, set()).update(changed_users)
+    for user_id in changed_users:
+        recommendation_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_soft_rollback')
+def _invalidate_after_transaction(session: Session, *args) -> None:
+    """Invalidate again so suggestions computed mid-transaction are not kept."""
+    for user_id in session.info.pop(_CHANGED_USERS_KEY, ()):
+        recommendation_cache.invalidate(user_id)
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import ContextManager
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+@dataclass
+class StageTiming:
+    """Wall time and SQL statements spent in one selection stage."""
+
+    name: str
+    elapsed_ms: float
+    statements: int
+
+
+@dataclass
+class RankedTopic:
+    """Urgency components of one candidate topic, in ranking order."""
+
+    topic_id: int
+    mastery_score: float
+    threshold: float
+    criticality_weight: float
+    weakness: float
+    review_priority: float
+    urgency: float
+    completed: bool
+
+
+@dataclass
+class SelectionTrace:
+    """Intermediate sets, ranking and per-stage cost of one `select_next_exercise` run."""
+
+    stages: list[StageTiming] = field(default_factory=list)
+    unlocked_topic_ids: list[int] = field(default_factory=list)
+    reinforcement_topic_ids: list[int] = field(default_factory=list)
+    ranked_topics: list[RankedTopic] = field(default_factory=list)
+    picked_exercise_id: int | None = None
+    used_fallback: bool = False
+    statements: int = 0
+
+    def _count_statement(self, *args) -> None:
+        self.statements += 1
+
+    @contextmanager
+    def capture_statements(self, db: Session) -> Iterator[None]:
+        """Count statements sent on the session's connection while the block runs."""
+        connection = db.connection()
+        event.listen(connection, 'before_cursor_execute', self._count_statement)
+        try:
+            yield
+        finally:
+            event.remove(connection, 'before_cursor_execute', self._count_statement)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Record the wall time and statement count of a block under `name`."""
+        started = time.perf_counter()
+        statements_before = self.statements
+        try:
+            yield
+        finally:
+            self.stages.append(
+                StageTiming(
+                    name=name,
+                    elapsed_ms=(time.perf_counter() - started) * 1000.0,
+                    statements=self.statements - statements_before,
+                )
+            )
+
+
+def trace_stage(trace: SelectionTrace | None, name: str) -> ContextManager[None]:
+    """`trace.stage(name)` when tracing, a no-op otherwise."""
+    return trace.stage(name) if trace is not None else nullcontext()
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, bindparam, case, func, update
+from sqlalchemy.orm import Session
+
+from app.models.user_mastery import UserMastery
+from app.services.mastery_engine import REVIEW_DECAY_WINDOW_DAYS, TOPIC_COMPLETION_THRESHOLD, _utcnow
+from app.services.sql_ranking import _clamp_expr, _elapsed_days
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def decayed_review_priority(dialect_name: str, now):
+    """`calculate_review_priority` of every row as a SQL expression."""
+    last_seen = func.coalesce(UserMastery.last_seen_at, UserMastery.last_updated)
+    decay = case(
+        (last_seen.is_(None), 1.0),
+        else_=_clamp_expr(_elapsed_days(dialect_name, now, last_seen) / REVIEW_DECAY_WINDOW_DAYS, 0.0, 1.0),
+    )
+    return (1.0 - _clamp_expr(UserMastery.mastery_score, 0.0, 1.0)) + decay
+
+
+def refresh_review_priorities(
+    db: Session,
+    now: datetime | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """Recompute the decayed review priority and completion flag of every mastery row.
+
+    Rows are updated in primary-key ranges of `chunk_size`, one set-based
+    UPDATE and commit per range, so each transaction stays short on a live
+    database. Returns the number of rows updated.
+
+    The engine ranks with the stored priorities until the next run, so the
+    job is meant to be scheduled (see the README). The server's cached
+    suggestions live in its own process and pick up the new priorities when
+    they expire after `RECOMMENDATION_CACHE_TTL_SECONDS`.
+    """
+    reference = now or _utcnow()
+    low, high = db.query(func.min(UserMastery.id), func.max(UserMastery.id)).one()
+    if low is None:
+        return 0
+
+    now_param = bindparam('now', reference, type_=DateTime())
+    step = max(1, chunk_size)
+    statement = (
+        update(UserMastery)
+        .where(UserMastery.id >= bindparam('low'), UserMastery.id < bindparam('high'))
+        .values(
+            review_priority=decayed_review_priority(db.get_bind().dialect.name, now_param),
+            is_completed=UserMastery.mastery_score >= TOPIC_COMPLETION_THRESHOLD,
+            # Written back as is: the column's onupdate would mark every row as just practiced.
+            last_updated=UserMastery.last_updated,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    updated = 0
+    for start in range(int(low), int(high) + 1, step):
+        result = db.execute(statement, {'low': start, 'high': start + step})
+        updated += result.rowcount
+        db.commit()
+    return updated
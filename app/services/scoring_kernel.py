@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import numpy as np
+
+from app.services.mastery_engine import REVIEW_DECAY_WINDOW_DAYS, TOPIC_COMPLETION_THRESHOLD
+
+
+def review_priorities(
+    mastery: np.ndarray,
+    elapsed_days: np.ndarray,
+    stored: np.ndarray | None = None,
+) -> np.ndarray:
+    """Vectorized `calculate_review_priority`.
+
+    `elapsed_days` is NaN for topics never seen (full decay), and finite
+    values in `stored` override the computed priority like persisted ones do.
+    """
+    score = np.clip(mastery, 0.0, 1.0)
+    decay = np.where(
+        np.isnan(elapsed_days),
+        1.0,
+        np.clip(np.maximum(0.0, np.nan_to_num(elapsed_days)) / REVIEW_DECAY_WINDOW_DAYS, 0.0, 1.0),
+    )
+    priority = (1.0 - score) + decay
+    if stored is None:
+        return priority
+    return np.where(np.isnan(stored), priority, stored)
+
+
+def topic_urgency(
+    mastery: np.ndarray,
+    criticality: np.ndarray,
+    thresholds: np.ndarray,
+    review_priority: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return (urgency, completion rank) with the same arithmetic as the scalar engine."""
+    score = np.clip(mastery, 0.0, 1.0)
+    weight = np.maximum(1.0, criticality)
+    weakness = np.maximum(0.0, thresholds - score)
+    urgency = (weakness * weight + weakness + review_priority) * (1.0 + weight * 0.1)
+    completion_rank = (score >= TOPIC_COMPLETION_THRESHOLD).astype(np.int8)
+    return urgency, completion_rank
+
+
+def rank_topics(
+    topic_ids: np.ndarray,
+    mastery: np.ndarray,
+    criticality: np.ndarray,
+    thresholds: np.ndarray,
+    review_priority: np.ndarray,
+    excluded: np.ndarray | None = None,
+) -> np.ndarray:
+    """Order topics along the last axis: incomplete first, then urgency, criticality, id.
+
+    Inputs broadcast, so a 1-D call ranks one user's topics and a 2-D
+    (users x topics) call ranks a whole cohort. Entries flagged in
+    `excluded` are pushed to the end.
+    """
+    urgency, completion_rank = topic_urgency(mastery, criticality, thresholds, review_priority)
+    shape = np.broadcast_shapes(np.shape(urgency), np.shape(topic_ids))
+    keys = [
+        np.broadcast_to(topic_ids, shape),
+        np.broadcast_to(-np.maximum(1.0, criticality), shape),
+        np.broadcast_to(-urgency, shape),
+        np.broadcast_to(completion_rank, shape),
+    ]
+    if excluded is not None:
+        keys.append(np.broadcast_to(excluded, shape))
+    return np.lexsort(keys, axis=-1)
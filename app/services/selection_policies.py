@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import math
+import threading
+from collections.abc import Callable
+
+from app.services.adaptation_engine import (
+    POLICY_HEURISTIC,
+    HeuristicPolicy,
+    SelectionPolicy,
+    _clamp,
+    _pick_exercise_id,
+    heuristic_policy,
+)
+from app.services.curriculum_graph import CurriculumGraph, TopicNode
+from app.services.learning_state import UserLearningState
+from app.services.recommendation_trace import SelectionTrace, trace_stage
+
+POLICY_BANDIT = 'bandit'
+POLICY_REVIEW_FIRST = 'review_first'
+DEFAULT_EXPLORATION = 0.5
+
+
+def _servable(graph: CurriculumGraph, unlocked_topics: list[TopicNode]) -> list[TopicNode]:
+    return [topic for topic in unlocked_topics if topic.id in graph.exercise_index]
+
+
+def _pick_for_topic(graph: CurriculumGraph, state: UserLearningState, topic_id: int) -> int | None:
+    """Target-difficulty pick inside one topic, shared with the heuristic."""
+    return _pick_exercise_id(
+        graph.exercise_index[topic_id],
+        mastery_score=_clamp(state.mastery_score(topic_id), 0.0, 1.0),
+        review_priority=state.review_priority(topic_id),
+    )
+
+
+class BanditPolicy:
+    """UCB1 over the unlocked topics, rewarded by the mastery gain of each answer.
+
+    Statistics are per topic and shared by every learner served by this
+    instance; `observe` is a constant-time update.
+
+    Experimental: the statistics live only in this process's memory. They
+    start empty on every restart and are not shared between workers or with
+    CLI jobs, so each worker explores on its own. Compare it offline with
+    `replay_policies.py` before configuring it in production.
+    """
+
+    name = POLICY_BANDIT
+    observes_answers = True
+
+    def __init__(self, exploration: float = DEFAULT_EXPLORATION) -> None:
+        self.exploration = float(exploration)
+        self._pulls: dict[int, int] = {}
+        self._reward_sums: dict[int, float] = {}
+        self._total_pulls = 0
+        self._lock = threading.Lock()
+
+    def _upper_bound(self, topic_id: int, log_total: float) -> float:
+        pulls = self._pulls.get(topic_id, 0)
+        if pulls == 0:
+            return math.inf
+        return self._reward_sums[topic_id] / pulls + self.exploration * math.sqrt(log_total / pulls)
+
+    def choose_exercise_id(
+        self,
+        graph: CurriculumGraph,
+        state: UserLearningState,
+        unlocked_topics: list[TopicNode],
+        trace: SelectionTrace | None = None,
+    ) -> int | None:
+        with trace_stage(trace, 'bandit'):
+            servable = _servable(graph, unlocked_topics)
+            if not servable:
+                return None
+            with self._lock:
+                log_total = math.log(self._total_pulls + 1)
+                best = max(servable, key=lambda topic: (self._upper_bound(topic.id, log_total), -topic.id))
+            return _pick_for_topic(graph, state, best.id)
+
+    def observe(self, user_id: int, topic_id: int, exercise_id: int, is_correct: bool, mastery_gain: float) -> None:
+        with self._lock:
+            self._pulls[topic_id] = self._pulls.get(topic_id, 0) + 1
+            self._reward_sums[topic_id] = self._reward_sums.get(topic_id, 0.0) + float(mastery_gain)
+            self._total_pulls += 1
+
+
+class ReviewFirstPolicy:
+    """Serve the unlocked topic with the highest review priority, weakest first on ties."""
+
+    name = POLICY_REVIEW_FIRST
+    observes_answers = False
+
+    def choose_exercise_id(
+        self,
+        graph: CurriculumGraph,
+        state: UserLearningState,
+        unlocked_topics: list[TopicNode],
+        trace: SelectionTrace | None = None,
+    ) -> int | None:
+        with trace_stage(trace, 'review_first'):
+            servable = _servable(graph, unlocked_topics)
+            if not servable:
+                return None
+            best = min(
+                servable,
+                key=lambda topic: (-state.review_priority(topic.id), state.mastery_score(topic.id), topic.id),
+            )
+            return _pick_for_topic(graph, state, best.id)
+
+    def observe(self, user_id: int, topic_id: int, exercise_id: int, is_correct: bool, mastery_gain: float) -> None:
+        """Review order depends only on the learner state."""
+
+
+POLICY_FACTORIES: dict[str, Callable[[], SelectionPolicy]] = {
+    POLICY_HEURISTIC: HeuristicPolicy,
+    POLICY_BANDIT: BanditPolicy,
+    POLICY_REVIEW_FIRST: ReviewFirstPolicy,
+}
+
+_policies: dict[str, SelectionPolicy] = {POLICY_HEURISTIC: heuristic_policy}
+_policies_lock = threading.Lock()
+
+
+def create_selection_policy(name: str) -> SelectionPolicy:
+    """Build a fresh policy instance (no learned statistics) by name."""
+    factory = POLICY_FACTORIES.get(name)
+    if factory is None:
+        raise ValueError(f'Unknown selection policy {name!r}; expected one of {sorted(POLICY_FACTORIES)}')
+    return factory()
+
+
+def get_selection_policy(name: str) -> SelectionPolicy:
+    """Process-wide policy instance, so learning policies keep their statistics."""
+    policy = _policies.get(name)
+    if policy is None:
+        with _policies_lock:
+            policy = _policies.get(name)
+            if policy is None:
+                policy = _policies.setdefault(name, create_selection_policy(name))
+    return policy
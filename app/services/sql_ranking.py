@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+from collections.abc import Collection
+from datetime import datetime
+
+from sqlalchemy import DateTime, Float, Select, and_, bindparam, case, cast, extract, func, literal, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from app.models.exercise import Exercise
+from app.models.subject import Subject
+from app.models.topic import Topic
+from app.models.topic_dependency import TopicDependency
+from app.models.user_mastery import UserMastery
+from app.services.adaptation_engine import TARGET_DIFFICULTY_GAP
+from app.services.mastery_engine import (
+    IN_DEVELOPMENT_MIN,
+    INACTIVITY_DAYS,
+    MAX_DIFFICULTY,
+    MIN_DIFFICULTY,
+    REVIEW_DECAY_WINDOW_DAYS,
+    TOPIC_COMPLETION_THRESHOLD,
+    _utcnow,
+)
+
+
+def _clamp_expr(value, low: float, high: float):
+    """Portable clamp (SQLite has no GREATEST/LEAST)."""
+    return case((value < low, low), (value > high, high), else_=value)
+
+
+def _positive_part(value):
+    return case((value > 0.0, value), else_=0.0)
+
+
+def _elapsed_days(dialect_name: str, now, column):
+    """Fractional days between `column` and `now` in the dialect's date arithmetic."""
+    if dialect_name == 'sqlite':
+        return func.julianday(now) - func.julianday(column)
+    return cast(extract('epoch', now - column), Float) / 86400.0
+
+
+def build_next_exercise_query(
+    dialect_name: str,
+    user_id: int,
+    now: datetime,
+    subject_id: int | None = None,
+    scope_topic_ids: Collection[int] | None = None,
+) -> Select:
+    """Build the single statement that ranks topics and picks an exercise for one user.
+
+    The CTE chain mirrors the Python engine step by step: topic state with
+    the materialized revalidation window, prerequisite blocking, the "nothing unlocked opens
+    everything" rule, mandatory reinforcement, the urgency ranking and the
+    per-topic exercise choice. The result is at most one `Exercise` row.
+    """
+    now_param = bindparam('now', now, type_=DateTime())
+
+    last_seen = func.coalesce(UserMastery.last_seen_at, UserMastery.last_updated)
+    elapsed_days = _elapsed_days(dialect_name, now_param, last_seen)
+    has_row = UserMastery.id.is_not(None)
+    # `timedelta.days > INACTIVITY_DAYS` holds exactly when a full extra day has elapsed.
+    is_stale = and_(
+        has_row,
+        or_(last_seen.is_(None), elapsed_days >= INACTIVITY_DAYS + 1),
+    )
+    unrevalidated = or_(UserMastery.revalidated_until.is_(None), UserMastery.revalidated_until < now_param)
+    threshold = case(
+        (Topic.criticality_level >= 3, Subject.threshold_c3),
+        (Topic.criticality_level == 2, Subject.threshold_c2),
+        else_=Subject.threshold_c1,
+    )
+    in_scope = literal(1) if scope_topic_ids is None else case((Topic.id.in_(list(scope_topic_ids)), 1), else_=0)
+    topic_state_query = (
+        select(
+            Topic.id.label('topic_id'),
+            case((Topic.criticality_level > 1, Topic.criticality_level), else_=1).label('weight'),
+            threshold.label('threshold'),
+            func.coalesce(UserMastery.mastery_score, 0.0).label('score'),
+            case((has_row, 1), else_=0).label('has_row'),
+            case((has_row, elapsed_days), else_=None).label('elapsed_days'),
+            UserMastery.review_priority.label('stored_priority'),
+            case(
+                (and_(is_stale, unrevalidated), 1),
+                else_=0,
+            ).label('stale_unrevalidated'),
+            in_scope.label('in_scope'),
+        )
+        .join(Subject, Subject.id == Topic.subject_id)
+        .outerjoin(UserMastery, and_(UserMastery.topic_id == Topic.id, UserMastery.user_id == user_id))
+    )
+    if subject_id is not None:
+        topic_state_query = topic_state_query.where(Topic.subject_id == subject_id)
+    topic_state = topic_state_query.cte('topic_state')
+
+    ready = case(
+        (
+            and_(
+                topic_state.c.has_row == 1,
+                topic_state.c.score >= topic_state.c.threshold,
+                topic_state.c.stale_unrevalidated == 0,
+            ),
+            1,
+        ),
+        else_=0,
+    )
+    readiness = select(topic_state.c.topic_id, ready.label('ready')).cte('readiness')
+
+    # Prerequisites outside the scoped catalog have no readiness row and block.
+    blocked = (
+        select(
+            TopicDependency.topic_id.label('topic_id'),
+            func.sum(case((readiness.c.ready == 1, 0), else_=1)).label('blocked'),
+        )
+        .outerjoin(readiness, readiness.c.topic_id == TopicDependency.depends_on_id)
+        .group_by(TopicDependency.topic_id)
+        .cte('blocked')
+    )
+
+    unlocked = case((func.coalesce(blocked.c.blocked, 0) == 0, 1), else_=0)
+    unlock_state = (
+        select(
+            topic_state,
+            unlocked.label('unlocked'),
+            func.max(unlocked).over().label('any_unlocked'),
+        )
+        .outerjoin(blocked, blocked.c.topic_id == topic_state.c.topic_id)
+        .cte('unlock_state')
+    )
+
+    is_base = and_(
+        or_(unlock_state.c.unlocked == 1, unlock_state.c.any_unlocked == 0),
+        unlock_state.c.in_scope == 1,
+    )
+    needs_reinforcement = or_(
+        and_(unlock_state.c.score >= IN_DEVELOPMENT_MIN, unlock_state.c.score < unlock_state.c.threshold),
+        unlock_state.c.stale_unrevalidated == 1,
+    )
+    reinforcement = case((and_(is_base, needs_reinforcement), 1), else_=0)
+    base_state = (
+        select(
+            unlock_state,
+            case((is_base, 1), else_=0).label('is_base'),
+            reinforcement.label('reinforcement'),
+            func.max(reinforcement).over().label('any_reinforcement'),
+        )
+        .cte('base_state')
+    )
+
+    score = _clamp_expr(base_state.c.score, 0.0, 1.0)
+    elapsed = _positive_part(base_state.c.elapsed_days)
+    decay = case(
+        (base_state.c.has_row == 1, _clamp_expr(elapsed / REVIEW_DECAY_WINDOW_DAYS, 0.0, 1.0)),
+        else_=1.0,
+    )
+    # A persisted priority wins over the live formula, as in `review_priority_for_row`.
+    review = func.coalesce(base_state.c.stored_priority, (1.0 - score) + decay)
+    weakness = _positive_part(base_state.c.threshold - score)
+    urgency = (weakness * base_state.c.weight + weakness + review) * (1.0 + base_state.c.weight * 0.1)
+    candidates = (
+        select(
+            base_state.c.topic_id,
+            base_state.c.weight,
+            score.label('score'),
+            review.label('review'),
+            urgency.label('urgency'),
+            case((score >= TOPIC_COMPLETION_THRESHOLD, 1), else_=0).label('completed'),
+        )
+        .where(
+            base_state.c.is_base == 1,
+            or_(base_state.c.reinforcement == 1, base_state.c.any_reinforcement == 0),
+        )
+        .cte('candidates')
+    )
+
+    difficulty = _clamp_expr(
+        case(
+            (or_(Exercise.difficulty.is_(None), Exercise.difficulty == 0), 1.0),
+            else_=Exercise.difficulty,
+        ),
+        MIN_DIFFICULTY,
+        MAX_DIFFICULTY,
+    )
+    mastery = candidates.c.score
+    target = _clamp_expr(mastery + TARGET_DIFFICULTY_GAP, MIN_DIFFICULTY, MAX_DIFFICULTY)
+    direction_penalty = case(
+        (mastery < 0.3, _positive_part(difficulty - target)),
+        (mastery > 0.7, _positive_part(target - difficulty)),
+        else_=0.0,
+    )
+    proximity = func.abs(difficulty - target) * (1.0 / (1.0 + _positive_part(candidates.c.review)))
+    tie_breaker = case(
+        (mastery < 0.3, difficulty),
+        (mastery > 0.7, -difficulty),
+        else_=func.abs(difficulty - target),
+    )
+    exercise_rank = (
+        select(
+            Exercise.id.label('exercise_id'),
+            candidates.c.topic_id,
+            candidates.c.weight,
+            candidates.c.urgency,
+            candidates.c.completed,
+            func.row_number()
+            .over(
+                partition_by=candidates.c.topic_id,
+                order_by=(direction_penalty, proximity, tie_breaker, Exercise.id),
+            )
+            .label('pick'),
+        )
+        .join(candidates, candidates.c.topic_id == Exercise.topic_id)
+        .cte('exercise_rank')
+    )
+
+    fallback = select(func.min(Exercise.id))
+    if scope_topic_ids is not None:
+        fallback = fallback.where(Exercise.topic_id.in_(list(scope_topic_ids)))
+    choices = union_all(
+        select(
+            exercise_rank.c.exercise_id,
+            literal(0).label('tier'),
+            exercise_rank.c.completed,
+            exercise_rank.c.urgency,
+            exercise_rank.c.weight,
+            exercise_rank.c.topic_id,
+        ).where(exercise_rank.c.pick == 1),
+        select(
+            fallback.scalar_subquery().label('exercise_id'),
+            literal(1).label('tier'),
+            literal(0).label('completed'),
+            literal(0.0).label('urgency'),
+            literal(0).label('weight'),
+            literal(0).label('topic_id'),
+        ),
+    ).subquery('choices')
+
+    return (
+        select(Exercise)
+        .join(choices, choices.c.exercise_id == Exercise.id)
+        .order_by(
+            choices.c.tier,
+            choices.c.completed,
+            choices.c.urgency.desc(),
+            choices.c.weight.desc(),
+            choices.c.topic_id,
+        )
+        .limit(1)
+    )
+
+
+def select_next_exercise_sql(
+    db: Session,
+    user_id: int,
+    subject_id: int | None = None,
+    scope_topic_ids: Collection[int] | None = None,
+    now: datetime | None = None,
+) -> Exercise | None:
+    """Run the whole selection as one SQL statement (one database round trip)."""
+    statement = build_next_exercise_query(
+        db.get_bind().dialect.name,
+        user_id=user_id,
+        now=now or _utcnow(),
+        subject_id=subject_id,
+        scope_topic_ids=scope_topic_ids,
+    )
+    return db.execute(statement).scalars().first()
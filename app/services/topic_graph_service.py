@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.models.topic import Topic
+from app.models.topic_dependency import TopicDependency
+from app.schemas.topic import TopicDependencyBulkResult, TopicDependencyIn
+from app.services.curriculum_graph import get_curriculum_graph, invalidate_curriculum_graph
+
+
+def _find_cycle_nodes(edges: set[tuple[int, int]]) -> set[int]:
+    """Return topics left over by Kahn's algorithm, i.e. those on or behind a cycle."""
+    pending: dict[int, int] = {}
+    dependents: dict[int, list[int]] = {}
+    for topic_id, depends_on_id in edges:
+        pending[topic_id] = pending.get(topic_id, 0) + 1
+        pending.setdefault(depends_on_id, 0)
+        dependents.setdefault(depends_on_id, []).append(topic_id)
+
+    queue = [node for node, count in pending.items() if count == 0]
+    while queue:
+        node = queue.pop()
+        for dependent_id in dependents.get(node, ()):
+            pending[dependent_id] -= 1
+            if pending[dependent_id] == 0:
+                queue.append(dependent_id)
+    return {node for node, count in pending.items() if count > 0}
+
+
+def validate_dependency_edges(
+    db: Session,
+    edges: list[TopicDependencyIn],
+) -> tuple[set[tuple[int, int]], list[str]]:
+    """Validate a batch of edges in memory against the stored graph.
+
+    Returns the edges that are new and the list of validation errors. Topic
+    subjects and the existing edges of the affected subjects are read with
+    one query each.
+    """
+    requested = {(int(edge.topic_id), int(edge.depends_on_id)) for edge in edges}
+    topic_ids = {topic_id for pair in requested for topic_id in pair}
+    subject_by_topic = {
+        int(topic_id): int(subject_id)
+        for topic_id, subject_id in db.query(Topic.id, Topic.subject_id).filter(Topic.id.in_(topic_ids))
+    }
+
+    errors: list[str] = []
+    for topic_id, depends_on_id in sorted(requested):
+        if topic_id == depends_on_id:
+            errors.append(f'Topic {topic_id} cannot depend on itself')
+        elif topic_id not in subject_by_topic or depends_on_id not in subject_by_topic:
+            errors.append(f'Dependency {topic_id} -> {depends_on_id} references non-existent topics')
+        elif subject_by_topic[topic_id] != subject_by_topic[depends_on_id]:
+            errors.append(f'Dependency {topic_id} -> {depends_on_id} must connect topics from the same subject')
+    if errors:
+        return set(), errors
+
+    # Edges never cross subjects, so only the affected subjects can form a cycle.
+    subject_ids = set(subject_by_topic.values())
+    existing = {
+        (int(topic_id), int(depends_on_id))
+        for topic_id, depends_on_id in db.query(TopicDependency.topic_id, TopicDependency.depends_on_id)
+        .join(Topic, Topic.id == TopicDependency.topic_id)
+        .filter(Topic.subject_id.in_(subject_ids))
+    }
+    cycle_nodes = _find_cycle_nodes(existing | requested)
+    if cycle_nodes:
+        errors.append(f'Dependencies would create a prerequisite cycle through topics {sorted(cycle_nodes)}')
+    return requested - existing, errors
+
+
+def import_topic_dependencies(db: Session, edges: list[TopicDependencyIn]) -> TopicDependencyBulkResult:
+    """Validate and insert a whole batch of dependency edges in one statement."""
+    new_edges, errors = validate_dependency_edges(db, edges)
+    if errors:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=errors,
+        )
+
+    if new_edges:
+        # Core insert: the batch is already validated, so skip the per-row listener queries.
+        db.execute(
+            TopicDependency.__table__.insert(),
+            [
+                {'topic_id': topic_id, 'depends_on_id': depends_on_id}
+                for topic_id, depends_on_id in sorted(new_edges)
+            ],
+        )
+        db.commit()
+        invalidate_curriculum_graph(db)
+
+    return TopicDependencyBulkResult(
+        created=len(new_edges),
+        skipped=len({(edge.topic_id, edge.depends_on_id) for edge in edges}) - len(new_edges),
+    )
+
+
+def get_all_prerequisites(db: Session, topic_id: int) -> list[int]:
+    """Return every direct and indirect prerequisite of a topic from the cached closure."""
+    graph = get_curriculum_graph(db)
+    if topic_id not in graph.topics:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Topic not found',
+        )
+    return sorted(graph.all_prerequisites(topic_id))
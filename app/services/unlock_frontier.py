@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from app.core.config import settings
+from app.services.curriculum_graph import CurriculumGraph
+from app.services.learning_state import UserLearningState
+
+
+@dataclass
+class UnlockFrontier:
+    """Ready and unlocked topic ids of one user for one catalog snapshot."""
+
+    graph_version: int
+    ready: set[int] = field(default_factory=set)
+    unlocked: set[int] = field(default_factory=set)
+
+
+def _is_unlocked(graph: CurriculumGraph, topic_id: int, ready: set[int]) -> bool:
+    """A topic is unlocked when every prerequisite exists and is ready."""
+    return all(
+        prereq_id in graph.topics and prereq_id in ready
+        for prereq_id in graph.prerequisites.get(topic_id, ())
+    )
+
+
+def _ready_topics(graph: CurriculumGraph, state: UserLearningState) -> set[int]:
+    """Readiness only depends on the topic's own row, so unpracticed topics are skipped."""
+    return {
+        topic_id
+        for topic_id in state.mastery_rows
+        if topic_id in graph.topics and state.is_ready_for_unlock(graph.topics[topic_id])
+    }
+
+
+class UnlockFrontierCache:
+    """Per-user unlock frontier kept up to date by diffing readiness.
+
+    Readiness is re-evaluated from the freshly loaded learning state on every
+    call, which also catches stale/revalidation transitions as time passes
+    and writes made by other workers. Only dependents of topics whose
+    readiness flipped are re-checked against their prerequisites. Frontiers
+    are kept per user and subject partition.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = max(0, int(maxsize))
+        self._frontiers: OrderedDict[tuple[int, int | None], UnlockFrontier] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def unlocked_topic_ids(self, graph: CurriculumGraph, state: UserLearningState) -> set[int]:
+        """Return the user's unlocked topic ids, updating the cached frontier."""
+        ready = _ready_topics(graph, state)
+        key = (state.user_id, graph.subject_id)
+        with self._lock:
+            frontier = self._frontiers.get(key)
+            if frontier is None or frontier.graph_version != graph.version:
+                frontier = UnlockFrontier(
+                    graph_version=graph.version,
+                    ready=ready,
+                    unlocked={topic_id for topic_id in graph.topic_ids if _is_unlocked(graph, topic_id, ready)},
+                )
+            else:
+                flipped = frontier.ready ^ ready
+                frontier.ready = ready
+                for topic_id in flipped:
+                    for dependent_id in graph.dependents.get(topic_id, ()):
+                        if dependent_id not in graph.topics:
+                            continue
+                        if _is_unlocked(graph, dependent_id, ready):
+                            frontier.unlocked.add(dependent_id)
+                        else:
+                            frontier.unlocked.discard(dependent_id)
+
+            if self.maxsize:
+                self._frontiers[key] = frontier
+                self._frontiers.move_to_end(key)
+                while len(self._frontiers) > self.maxsize:
+                    self._frontiers.popitem(last=False)
+            return set(frontier.unlocked)
+
+    def invalidate(self, user_id: int) -> None:
+        """Drop every frontier of one user."""
+        with self._lock:
+            for key in [key for key in self._frontiers if key[0] == user_id]:
+                del self._frontiers[key]
+
+    def clear(self) -> None:
+        """Drop every frontier."""
+        with self._lock:
+            self._frontiers.clear()
+
+
+unlock_frontiers = UnlockFrontierCache(maxsize=settings.RECOMMENDATION_CACHE_SIZE)
@@ -0,0 +1,33 @@
+import argparse
+
+from app.core.database import SessionLocal
+from app.core.db import DATABASE_URL
+from app.services.daily_plan_job import DEFAULT_CHUNK_SIZE, DEFAULT_PLAN_SIZE, run_daily_plan_job
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Precompute daily practice plans for active users.')
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes (1 runs inline).')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Users per worker task.')
+    parser.add_argument('--plan-size', type=int, default=DEFAULT_PLAN_SIZE, help='Exercises per plan.')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    db = SessionLocal()
+    try:
+        stored = run_daily_plan_job(
+            db,
+            database_url=DATABASE_URL,
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+            plan_size=args.plan_size,
+        )
+    finally:
+        db.close()
+    print(f'Stored {stored} daily plans.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import argparse
+import dataclasses
+from pathlib import Path
+
+from app.core.database import SessionLocal
+from app.services.mastery_calibration import SCOPES, SEARCH_COORDINATE, SEARCH_GRID, run_calibration
+from app.services.mastery_rates import load_mastery_rate_table, save_mastery_rate_table
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Fit mastery learning/decay rates on logged attempts.')
+    parser.add_argument(
+        '--scope',
+        action='append',
+        choices=SCOPES,
+        help='Partitioning to fit; repeat to fit several (default: all).',
+    )
+    parser.add_argument('--search', choices=(SEARCH_GRID, SEARCH_COORDINATE), default=SEARCH_GRID)
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes (1 runs inline).')
+    parser.add_argument('--output', default='mastery_rates.json', help='Rate table to write.')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    db = SessionLocal()
+    try:
+        report = run_calibration(db, scopes=args.scope or list(SCOPES), search=args.search, workers=args.workers)
+    finally:
+        db.close()
+
+    print(f"{'scope':<13}{'key':>6}{'answers':>10}{'alpha':>9}{'beta':>9}{'brier':>16}{'accuracy':>18}")
+    for fit in report.fits:
+        key = '-' if fit.key is None else str(fit.key)
+        print(
+            f'{fit.scope:<13}{key:>6}{fit.fitted.attempts:>10}'
+            f'{fit.rates.learning_rate:>9.4f}{fit.rates.decay_rate:>9.4f}'
+            f'{fit.baseline.brier:>8.4f}->{fit.fitted.brier:<6.4f}'
+            f'{fit.baseline.accuracy:>10.3f}->{fit.fitted.accuracy:<6.3f}'
+        )
+    print(f'{report.evaluations} evaluations in {report.elapsed_seconds:.1f}s.')
+
+    table = report.rate_table()
+    if Path(args.output).exists():
+        # Only the logistic-style rates are fitted; keep the knowledge-tracing setup already in the file.
+        table = dataclasses.replace(table, knowledge_tracing=load_mastery_rate_table(args.output).knowledge_tracing)
+    save_mastery_rate_table(table, args.output)
+    print(f'Wrote {args.output}; set MASTERY_RATES_PATH={args.output} to load it.')
+
+
+if __name__ == '__main__':
+    main()
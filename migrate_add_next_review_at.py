@@ -0,0 +1,46 @@
+import sqlite3
+from pathlib import Path
+
+DB_PATH = Path('mathlingo.db')
+# Keep in sync with REVIEW_DECAY_WINDOW_DAYS / REVIEW_DUE_PRIORITY in app/services/mastery_engine.py.
+REVIEW_DECAY_WINDOW_DAYS = 30.0
+REVIEW_DUE_PRIORITY = 1.0
+
+if not DB_PATH.exists():
+    raise SystemExit('mathlingo.db not found. Start app or create tables first.')
+
+conn = sqlite3.connect(DB_PATH)
+cur = conn.cursor()
+
+cur.execute('PRAGMA table_info(user_mastery)')
+columns = {row[1] for row in cur.fetchall()}
+
+if 'next_review_at' not in columns:
+    cur.execute('ALTER TABLE user_mastery ADD COLUMN next_review_at DATETIME')
+    print('Added user_mastery.next_review_at column.')
+else:
+    print('user_mastery.next_review_at already exists.')
+
+# Backfill rows written before the column existed: due once priority reaches REVIEW_DUE_PRIORITY.
+cur.execute(
+    """
+    UPDATE user_mastery
+    SET next_review_at = strftime(
+        '%Y-%m-%d %H:%M:%f',
+        last_updated,
+        '+' || (MAX(0.0, ? - (1.0 - MIN(MAX(mastery_score, 0.0), 1.0))) * ? * 86400.0) || ' seconds'
+    )
+    WHERE next_review_at IS NULL
+    """,
+    (REVIEW_DUE_PRIORITY, REVIEW_DECAY_WINDOW_DAYS),
+)
+print(f'Backfilled next_review_at for {cur.rowcount} rows.')
+
+cur.execute(
+    'CREATE INDEX IF NOT EXISTS ix_user_mastery_user_next_review '
+    'ON user_mastery (user_id, next_review_at)'
+)
+conn.commit()
+print('Ensured index ix_user_mastery_user_next_review.')
+
+conn.close()
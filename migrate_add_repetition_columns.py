@@ -0,0 +1,54 @@
+import sqlite3
+from pathlib import Path
+
+DB_PATH = Path('mathlingo.db')
+# Keep in sync with REVIEW_DECAY_WINDOW_DAYS / TOPIC_COMPLETION_THRESHOLD in app/services/mastery_engine.py.
+REVIEW_DECAY_WINDOW_DAYS = 30.0
+TOPIC_COMPLETION_THRESHOLD = 0.8
+
+if not DB_PATH.exists():
+    raise SystemExit('mathlingo.db not found. Start app or create tables first.')
+
+conn = sqlite3.connect(DB_PATH)
+cur = conn.cursor()
+
+cur.execute('PRAGMA table_info(user_mastery)')
+columns = {row[1] for row in cur.fetchall()}
+
+for name, ddl in (
+    ('last_seen_at', 'DATETIME'),
+    ('review_priority', 'FLOAT'),
+    ('is_completed', 'BOOLEAN NOT NULL DEFAULT 0'),
+):
+    if name not in columns:
+        cur.execute(f'ALTER TABLE user_mastery ADD COLUMN {name} {ddl}')
+        print(f'Added user_mastery.{name} column.')
+    else:
+        print(f'user_mastery.{name} already exists.')
+
+# Backfill: rows written before the columns existed were last seen when last updated.
+cur.execute(
+    """
+    UPDATE user_mastery
+    SET
+        last_seen_at = COALESCE(last_seen_at, last_updated),
+        review_priority = (1.0 - MIN(MAX(mastery_score, 0.0), 1.0))
+            + MIN(MAX((julianday('now') - julianday(COALESCE(last_seen_at, last_updated))) / ?, 0.0), 1.0),
+        is_completed = mastery_score >= ?
+    """,
+    (REVIEW_DECAY_WINDOW_DAYS, TOPIC_COMPLETION_THRESHOLD),
+)
+print(f'Backfilled repetition columns for {cur.rowcount} rows.')
+
+cur.execute(
+    'CREATE INDEX IF NOT EXISTS ix_user_mastery_user_review_priority '
+    'ON user_mastery (user_id, review_priority)'
+)
+cur.execute(
+    'CREATE INDEX IF NOT EXISTS ix_user_mastery_user_completed '
+    'ON user_mastery (user_id, is_completed)'
+)
+conn.commit()
+print('Ensured indexes ix_user_mastery_user_review_priority and ix_user_mastery_user_completed.')
+
+conn.close()
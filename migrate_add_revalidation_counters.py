@@ -0,0 +1,75 @@
+import sqlite3
+from pathlib import Path
+
+DB_PATH = Path('mathlingo.db')
+# Keep in sync with REVALIDATION_CORRECT_REQUIRED / REVALIDATION_WINDOW_DAYS in app/services/mastery_engine.py.
+REVALIDATION_CORRECT_REQUIRED = 3
+REVALIDATION_WINDOW_DAYS = 30
+
+if not DB_PATH.exists():
+    raise SystemExit('mathlingo.db not found. Start app or create tables first.')
+
+conn = sqlite3.connect(DB_PATH)
+cur = conn.cursor()
+
+cur.execute('PRAGMA table_info(user_mastery)')
+columns = {row[1] for row in cur.fetchall()}
+
+if 'recent_correct_at' not in columns:
+    cur.execute('ALTER TABLE user_mastery ADD COLUMN recent_correct_at JSON')
+    print('Added user_mastery.recent_correct_at column.')
+else:
+    print('user_mastery.recent_correct_at already exists.')
+
+if 'revalidated_until' not in columns:
+    cur.execute('ALTER TABLE user_mastery ADD COLUMN revalidated_until DATETIME')
+    print('Added user_mastery.revalidated_until column.')
+else:
+    print('user_mastery.revalidated_until already exists.')
+
+changes_before = conn.total_changes
+# Backfill from the last correct attempts of each (user, topic); the window opens at the oldest of them.
+# Stored timestamps keep their microseconds, matching what record_correct_attempt writes.
+cur.execute(
+    """
+    WITH ranked AS (
+        SELECT
+            a.user_id AS user_id,
+            e.topic_id AS topic_id,
+            replace(a.created_at, ' ', 'T') AS answered_at,
+            ROW_NUMBER() OVER (
+                PARTITION BY a.user_id, e.topic_id ORDER BY a.created_at DESC, a.id DESC
+            ) AS position
+        FROM attempts a
+        JOIN exercises e ON e.id = a.exercise_id
+        WHERE a.is_correct = 1
+    ),
+    recent AS (
+        SELECT
+            user_id,
+            topic_id,
+            json_group_array(answered_at) AS stamps,
+            MIN(answered_at) AS oldest,
+            COUNT(*) AS correct_count
+        FROM (SELECT * FROM ranked WHERE position <= ? ORDER BY answered_at)
+        GROUP BY user_id, topic_id
+    )
+    UPDATE user_mastery
+    SET
+        recent_correct_at = recent.stamps,
+        revalidated_until = CASE
+            WHEN recent.correct_count >= ?
+            THEN strftime('%Y-%m-%d %H:%M:%S', recent.oldest, '+' || ? || ' days') || substr(recent.oldest, 20)
+        END
+    FROM recent
+    WHERE recent.user_id = user_mastery.user_id
+      AND recent.topic_id = user_mastery.topic_id
+      AND user_mastery.recent_correct_at IS NULL
+    """,
+    (REVALIDATION_CORRECT_REQUIRED, REVALIDATION_CORRECT_REQUIRED, REVALIDATION_WINDOW_DAYS),
+)
+# sqlite3 reports rowcount -1 for statements that start with WITH.
+print(f'Backfilled revalidation counters for {conn.total_changes - changes_before} rows.')
+
+conn.commit()
+conn.close()
@@ -0,0 +1,36 @@
+import argparse
+
+from app.core.database import SessionLocal
+from app.services.mastery_rebuild import DEFAULT_CHUNK_SIZE, rebuild_mastery
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Recompute user_mastery from the attempts table.')
+    parser.add_argument('--start-user-id', type=int, default=None, help='First user id to rebuild (inclusive).')
+    parser.add_argument('--end-user-id', type=int, default=None, help='Last user id to rebuild (inclusive).')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Users per commit.')
+    return parser.parse_args()
+
+
+def report(last_user_id: int, rows: int) -> None:
+    print(f'Rebuilt {rows} mastery rows up to user {last_user_id}; resume with --start-user-id {last_user_id + 1}.')
+
+
+def main() -> None:
+    args = parse_args()
+    db = SessionLocal()
+    try:
+        written = rebuild_mastery(
+            db,
+            start_user_id=args.start_user_id,
+            end_user_id=args.end_user_id,
+            chunk_size=args.chunk_size,
+            on_chunk=report,
+        )
+    finally:
+        db.close()
+    print(f'Rebuilt {written} mastery rows.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+import argparse
+
+from app.core.database import SessionLocal
+from app.services.review_refresh_job import DEFAULT_CHUNK_SIZE, refresh_review_priorities
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Recompute decayed review priorities for every mastery row.')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows per UPDATE and commit.')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    db = SessionLocal()
+    try:
+        updated = refresh_review_priorities(db, chunk_size=args.chunk_size)
+    finally:
+        db.close()
+    print(f'Refreshed {updated} mastery rows.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+import argparse
+
+from app.core.database import SessionLocal
+from app.core.db import DATABASE_URL
+from app.services.policy_replay import DEFAULT_CHUNK_SIZE, run_policy_replay
+from app.services.selection_policies import POLICY_FACTORIES
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Replay logged attempts against exercise-selection policies.')
+    parser.add_argument(
+        '--policy',
+        action='append',
+        choices=sorted(POLICY_FACTORIES),
+        help='Policy to evaluate; repeat to compare several (default: all).',
+    )
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes (1 runs inline).')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Users per worker task.')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    db = SessionLocal()
+    try:
+        results = run_policy_replay(
+            db,
+            database_url=DATABASE_URL,
+            policy_names=args.policy or sorted(POLICY_FACTORIES),
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+        )
+    finally:
+        db.close()
+
+    print(f"{'policy':<14}{'decisions':>11}{'topic match':>13}{'exercise match':>16}{'accuracy':>10}{'gain':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    for name, metrics in results.items():
+        print(
+            f'{name:<14}{metrics.decisions:>11}{metrics.topic_match_rate:>13.3f}{metrics.exercise_match_rate:>16.3f}'
+            f'{metrics.matched_accuracy:>10.3f}{metrics.matched_mean_gain:>9.4f}'
+            f'{metrics.latency_percentile(50):>9.3f}{metrics.latency_percentile(95):>9.3f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
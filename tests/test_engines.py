@@ -1,13 +1,19 @@
 from __future__ import annotations
 
 import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
+import numpy as np
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
+from app.core.config import settings
 from app.core.database import Base
 from app.models.attempt import Attempt
 from app.models.exercise import Exercise
@@ -18,13 +24,65 @@ from app.models.topic import Topic
 from app.models.topic_dependency import TopicDependency
 from app.models.user import User
 from app.models.user_mastery import UserMastery
-from app.services.adaptation_engine import select_next_exercise
-from app.services.certificate_service import ensure_subject_certificate, verify_certificate_hash
+from app.schemas.topic import TopicDependencyIn
+from app.services.adaptation_engine import (
+    AdaptiveScope,
+    _exercise_score,
+    _pick_exercise_id,
+    build_practice_queue,
+    explain_next_exercise,
+    recommend_next_exercise,
+    recommend_practice_queue,
+    select_next_exercise,
+)
+from app.services.certificate_path import REASON_AVERAGE, REASON_REVALIDATION, REASON_THRESHOLD, plan_certificate_path
+from app.services.certificate_service import ensure_subject_certificate, is_subject_completed, verify_certificate_hash
+from app.services.cohort_engine import select_next_exercises_for_users
+from app.services.curriculum_graph import ExerciseIndex, get_curriculum_graph
+from app.services.daily_plan import get_active_daily_plan
+from app.services.daily_plan_job import active_user_ids, run_daily_plan_job
+from app.services.diagnostic_engine import calculate_branch_level
+from app.services.knowledge_tracing import KnowledgeTracingModel, KnowledgeTracingParameters, KnowledgeTracingTable
+from app.services.learning_state import load_user_learning_state
+from app.services.mastery_calibration import (
+    SCOPE_GLOBAL,
+    SCOPES,
+    SEARCH_COORDINATE,
+    evaluate_rates,
+    load_attempt_history,
+    run_calibration,
+)
+from app.services.mastery_rates import MasteryRateTable, load_mastery_rate_table, save_mastery_rate_table
+from app.services.mastery_rebuild import rebuild_mastery
+from app.services.offline_sync import OfflineAnswer, submit_offline_answers
+from app.services.policy_replay import run_policy_replay
 from app.services.mastery_engine import (
+    BASE_DECAY_RATE_DEFAULT,
+    BASE_LEARNING_RATE_DEFAULT,
+    REVALIDATION_CORRECT_REQUIRED,
+    REVALIDATION_WINDOW_DAYS,
+    _normalized_last_seen,
     calculate_effective_rates,
+    calculate_mastery_score,
+    calculate_next_review_at,
+    calculate_review_priority,
+    get_due_reviews,
     get_threshold,
+    is_revalidated,
+    is_topic_completed,
+    next_mastery_score,
+    record_correct_attempt,
     update_mastery,
 )
+from app.services import adaptation_engine, mastery_calibration, mastery_engine, recommendation_budget
+from app.services.recommendation_budget import recommend_within_budget
+from app.services.recommendation_cache import RecommendationCache, recommendation_cache
+from app.services.review_refresh_job import refresh_review_priorities
+from app.services.scoring_kernel import rank_topics, review_priorities
+from app.services.selection_policies import POLICY_FACTORIES, BanditPolicy, get_selection_policy
+from app.services.sql_ranking import select_next_exercise_sql
+from app.services.topic_graph_service import import_topic_dependencies, validate_dependency_edges
+from app.services.unlock_frontier import UnlockFrontierCache
 
 
 def _session(tmp_path):
@@ -69,6 +127,66 @@ def _create_learning_structure(
     return subject, pathway, module
 
 
+def _random_corpus(db, seed: int, topic_count: int = 10, user_count: int = 8) -> list[int]:
+    """Build a random curriculum and learner histories; return the user ids."""
+    rng = random.Random(seed)
+    subject, _, module = _create_learning_structure(db)
+    topics = [
+        Topic(
+            subject_id=subject.id,
+            module_id=module.id,
+            name=f'Random {index}',
+            description=None,
+            difficulty_level=rng.uniform(0.1, 1.0),
+            criticality_level=rng.randint(1, 3),
+        )
+        for index in range(topic_count)
+    ]
+    users = [
+        User(email=f'random{seed}-{index}@example.com', hashed_password='hash', role='user')
+        for index in range(user_count)
+    ]
+    db.add_all(topics + users)
+    db.commit()
+
+    for index, topic in enumerate(topics):
+        for prereq in rng.sample(topics[:index], min(index, rng.randint(0, 2))):
+            db.add(TopicDependency(topic_id=topic.id, depends_on_id=prereq.id))
+    exercises: dict[int, list[Exercise]] = {}
+    for topic in topics:
+        exercises[topic.id] = [
+            Exercise(topic_id=topic.id, question=f'Q{topic.id}-{n}', answer='A', difficulty=round(rng.uniform(0.1, 2.0), 2))
+            for n in range(rng.randint(0, 4))
+        ]
+        db.add_all(exercises[topic.id])
+    db.commit()
+
+    now = datetime.utcnow()
+    for user in users:
+        for topic in rng.sample(topics, rng.randint(0, topic_count)):
+            last_seen = now - timedelta(days=rng.choice([0, 3, 20, 60, 100, 200]), hours=rng.randint(0, 23))
+            db.add(
+                UserMastery(
+                    user_id=user.id,
+                    topic_id=topic.id,
+                    mastery_score=rng.choice([0.0, 0.2, 0.5, 0.6, 0.7, 0.8, 0.9, 0.97, rng.random()]),
+                    last_updated=last_seen,
+                )
+            )
+            for exercise in exercises[topic.id][: rng.randint(0, 3)]:
+                for _ in range(rng.randint(0, 3)):
+                    db.add(
+                        Attempt(
+                            user_id=user.id,
+                            exercise_id=exercise.id,
+                            is_correct=rng.random() < 0.7,
+                            created_at=now - timedelta(days=rng.randint(0, 40)),
+                        )
+                    )
+    db.commit()
+    return [user.id for user in users]
+
+
 def test_thresholds_per_subject():
     """Threshold helper must resolve by criticality from each subject."""
     base = Subject(
@@ -331,3 +449,1369 @@ def test_certificate_generation_and_public_verification(tmp_path):
     verified = verify_certificate_hash(db, cert.verification_hash)
     assert verified is not None
     assert verified.id == cert.id
+
+
+def test_certificate_path_plans_remaining_topics_in_prerequisite_order(tmp_path):
+    """Following the planned targets completes the subject; the plan reads only user state."""
+    db = _session(tmp_path)
+    subject, _, module = _create_learning_structure(
+        db,
+        threshold_c1=0.6,
+        threshold_c2=0.6,
+        threshold_c3=0.6,
+        certificate_threshold=0.8,
+    )
+    user = User(email='path@example.com', hashed_password='hash', role='user')
+    topics = [
+        Topic(
+            subject_id=subject.id,
+            module_id=module.id,
+            name=f'Path {index}',
+            description=None,
+            difficulty_level=0.5,
+            criticality_level=1 + index % 3,
+        )
+        for index in range(6)
+    ]
+    db.add(user)
+    db.add_all(topics)
+    db.commit()
+    for previous, current in zip(topics, topics[1:]):
+        db.add(TopicDependency(topic_id=current.id, depends_on_id=previous.id))
+    now = datetime.utcnow()
+    db.add_all(
+        [
+            UserMastery(user_id=user.id, topic_id=topics[0].id, mastery_score=0.7, last_updated=now),
+            UserMastery(user_id=user.id, topic_id=topics[1].id, mastery_score=0.9, last_updated=now - timedelta(days=120)),
+            UserMastery(user_id=user.id, topic_id=topics[2].id, mastery_score=0.3, last_updated=now),
+        ]
+    )
+    db.commit()
+
+    plan_certificate_path(db, user.id, subject.id)
+    statements: list[str] = []
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.get_bind(), 'before_cursor_execute', _count)
+    try:
+        path = plan_certificate_path(db, user.id, subject.id)
+    finally:
+        event.remove(db.get_bind(), 'before_cursor_execute', _count)
+    assert len(statements) <= 2
+
+    reasons = {step.topic_id: step.reason for step in path.steps}
+    assert reasons[topics[1].id] == REASON_REVALIDATION
+    assert all(reasons[topic.id] == REASON_THRESHOLD for topic in topics[2:])
+    assert reasons.get(topics[0].id) in (None, REASON_AVERAGE)
+    assert not path.completed
+    assert path.projected_average >= subject.certificate_threshold - 1e-9
+
+    position = {step.topic_id: index for index, step in enumerate(path.steps)}
+    for step in path.steps:
+        assert all(position[prereq] < position[step.topic_id] for prereq in step.prerequisite_ids)
+
+    rows = {row.topic_id: row for row in db.query(UserMastery).filter(UserMastery.user_id == user.id)}
+    for step in path.steps:
+        row = rows.get(step.topic_id)
+        if row is None:
+            row = UserMastery(user_id=user.id, topic_id=step.topic_id)
+            db.add(row)
+        row.mastery_score = min(1.0, step.target_score + 1e-9)
+        row.last_updated = datetime.utcnow()
+    db.commit()
+
+    assert is_subject_completed(db, user.id, subject)[0]
+    finished = plan_certificate_path(db, user.id, subject.id)
+    assert finished.completed
+    assert finished.steps == []
+
+
+def test_curriculum_graph_snapshot_rebuilds_only_after_catalog_writes(tmp_path):
+    """Catalog snapshot is reused across reads and refreshed when topics change."""
+    db = _session(tmp_path)
+    subject, _, module = _create_learning_structure(db, threshold_c2=0.7)
+
+    first = Topic(
+        subject_id=subject.id,
+        module_id=module.id,
+        name='First',
+        description=None,
+        difficulty_level=0.3,
+        criticality_level=2,
+    )
+    db.add(first)
+    db.commit()
+    db.add(Exercise(topic_id=first.id, question='Q', answer='A', difficulty=0.5))
+    db.commit()
+
+    graph = get_curriculum_graph(db)
+    assert get_curriculum_graph(db) is graph
+    assert graph.topics[first.id].threshold == pytest.approx(0.7)
+    assert len(graph.exercise_ids[first.id]) == 1
+
+    db.add(User(email='graph@example.com', hashed_password='hash', role='user'))
+    db.commit()
+    assert get_curriculum_graph(db) is graph
+
+    second = Topic(
+        subject_id=subject.id,
+        module_id=module.id,
+        name='Second',
+        description=None,
+        difficulty_level=0.6,
+        criticality_level=1,
+    )
+    db.add(second)
+    db.commit()
+    db.add(TopicDependency(topic_id=second.id, depends_on_id=first.id))
+    db.commit()
+
+    rebuilt = get_curriculum_graph(db)
+    assert rebuilt.version > graph.version
+    assert rebuilt.topic_ids == (first.id, second.id)
+    assert rebuilt.prerequisites[second.id] == (first.id,)
+    assert rebuilt.dependents[first.id] == (second.id,)
+
+
+def test_curriculum_graph_snapshot_refreshes_after_writes_from_another_engine(tmp_path, monkeypatch):
+    """Catalog writes made outside this process are picked up on the next probe."""
+    db = _session(tmp_path)
+    _random_corpus(db, seed=17, topic_count=4, user_count=1)
+    graph = get_curriculum_graph(db)
+    topic_id = graph.topic_ids[0]
+
+    other_engine = create_engine(f"sqlite:///{tmp_path / 'engine_tests.db'}")
+    other = sessionmaker(bind=other_engine)()
+    exercise = Exercise(topic_id=topic_id, question='Q', answer='A', difficulty=0.5)
+    other.add(exercise)
+    other.commit()
+
+    monkeypatch.setattr(settings, 'CURRICULUM_GRAPH_CHECK_SECONDS', 3600)
+    assert get_curriculum_graph(db) is graph
+
+    monkeypatch.setattr(settings, 'CURRICULUM_GRAPH_CHECK_SECONDS', 0)
+    refreshed = get_curriculum_graph(db)
+    assert refreshed.version > graph.version
+    assert exercise.id in refreshed.exercise_ids[topic_id]
+    assert get_curriculum_graph(db) is refreshed
+
+    other.close()
+    other_engine.dispose()
+
+
+def test_select_next_exercise_query_count_is_independent_of_topic_count(tmp_path):
+    """User state is loaded once instead of per prerequisite and per topic."""
+    db = _session(tmp_path)
+    subject, _, module = _create_learning_structure(db)
+
+    user = User(email='bounded@example.com', hashed_password='hash', role='user')
+    db.add(user)
+    topics = [
+        Topic(
+            subject_id=subject.id,
+            module_id=module.id,
+            name=f'Chain {index}',
+            description=None,
+            difficulty_level=0.5,
+            criticality_level=1 + index % 3,
+        )
+        for index in range(12)
+    ]
+    db.add_all(topics)
+    db.commit()
+    for previous, current in zip(topics, topics[1:]):
+        db.add(TopicDependency(topic_id=current.id, depends_on_id=previous.id))
+    stale_time = datetime.utcnow() - timedelta(days=120)
+    for topic in topics:
+        db.add(Exercise(topic_id=topic.id, question=f'Q{topic.id}', answer='A', difficulty=0.5))
+        db.add(UserMastery(user_id=user.id, topic_id=topic.id, mastery_score=0.95, last_updated=stale_time))
+    db.commit()
+
+    select_next_exercise(db, user.id)
+    statements: list[str] = []
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.get_bind(), 'before_cursor_execute', _count)
+    try:
+        next_exercise = select_next_exercise(db, user.id)
+    finally:
+        event.remove(db.get_bind(), 'before_cursor_execute', _count)
+
+    assert next_exercise is not None
+    assert next_exercise.topic_id == topics[0].id
+    assert len(statements) <= 4
+
+
+def test_due_reviews_follow_persisted_next_review_at(tmp_path):
+    """Rows come due when their review priority reaches 1.0, most overdue first, via the index."""
+    db = _session(tmp_path)
+    subject, _, module = _create_learning_structure(db)
+    user = User(email='due@example.com', hashed_password='hash', role='user')
+    topics = [
+        Topic(subject_id=subject.id, module_id=module.id, name=f'Due {index}', description=None, difficulty_level=0.5)
+        for index in range(3)
+    ]
+    db.add(user)
+    db.add_all(topics)
+    db.commit()
+
+    for topic in topics:
+        update_mastery(db, user_id=user.id, topic_id=topic.id, is_correct=True, difficulty=1.0, criticality_level=1)
+    rows = {row.topic_id: row for row in db.query(UserMastery).filter_by(user_id=user.id)}
+    for row in rows.values():
+        due_at = calculate_next_review_at(row.mastery_score, row.last_updated)
+        assert row.next_review_at.replace(tzinfo=None) == due_at
+        assert calculate_review_priority(row.mastery_score, row.last_updated, now=due_at) == pytest.approx(1.0)
+
+    now = datetime.utcnow()
+    rows[topics[0].id].next_review_at = now - timedelta(days=5)
+    rows[topics[1].id].next_review_at = now - timedelta(days=9)
+    db.commit()
+
+    due = get_due_reviews(db, user.id, now=now)
+    assert [row.topic_id for row in due] == [topics[1].id, topics[0].id]
+    assert get_due_reviews(db, user.id, limit=1, now=now)[0].topic_id == topics[1].id
+
+    plan = db.execute(
+        text(
+            'EXPLAIN QUERY PLAN SELECT * FROM user_mastery '
+            'WHERE user_id = :user_id AND next_review_at <= :now ORDER BY next_review_at'
+        ),
+        {'user_id': user.id, 'now': now},
+    ).fetchall()
+    assert any('ix_user_mastery_user_next_review' in str(row) for row in plan)
+
+
+def test_bisect_exercise_pick_matches_full_scan():
+    """Indexed lookup must pick the same exercise as scoring every candidate."""
+    rng = random.Random(7)
+    for _ in range(300):
+        entries = sorted(
+            (round(rng.uniform(0.1, 2.0), 1), exercise_id)
+            for exercise_id in rng.sample(range(1, 500), rng.randint(1, 12))
+        )
+        index = ExerciseIndex(
+            difficulties=tuple(difficulty for difficulty, _ in entries),
+            exercise_ids=tuple(exercise_id for _, exercise_id in entries),
+        )
+        mastery = rng.choice([0.0, 0.1, 0.25, 0.3, 0.45, 0.55, 0.7, 0.75, 0.95, rng.random()])
+        review_priority = rng.uniform(0.0, 2.0)
+        target = min(2.0, max(0.1, mastery + 0.15))
+
+        expected = min(
+            entries,
+            key=lambda entry: _exercise_score(entry[0], entry[1], mastery, target, review_priority),
+        )[1]
+        assert _pick_exercise_id(index, mastery, review_priority) == expected
+
+
+def test_exercise_index_picks_up_exercises_written_by_another_engine(tmp_path, monkeypatch):
+    """Exercises added or edited out of process reach the bisect index after the next probe."""
+    monkeypatch.setattr(settings, 'CURRICULUM_GRAPH_CHECK_SECONDS', 0)
+    db = _session(tmp_path)
+    subject, _, module = _create_learning_structure(db)
+    topic = Topic(
+        subject_id=subject.id,
+        module_id=module.id,
+        name='Indexed',
+        description=None,
+        difficulty_level=0.5,
+        criticality_level=1,
+    )
+    db.add(topic)
+    db.commit()
+    hard = Exercise(topic_id=topic.id, question='Hard', answer='A', difficulty=2.0)
+    db.add(hard)
+    db.commit()
+    assert _pick_exercise_id(get_curriculum_graph(db).exercise_index[topic.id], 0.5, 0.0) == hard.id
+
+    other_engine = create_engine(f"sqlite:///{tmp_path / 'engine_tests.db'}")
+    other = sessionmaker(bind=other_engine)()
+    matched = Exercise(topic_id=topic.id, question='Matched', answer='A', difficulty=0.65)
+    other.add(matched)
+    other.commit()
+
+    index = get_curriculum_graph(db).exercise_index[topic.id]
+    assert index.exercise_ids == (matched.id, hard.id)
+    assert _pick_exercise_id(index, 0.5, 0.0) == matched.id
+
+    edited = other.get(Exercise, hard.id)
+    edited.difficulty = 0.65
+    edited.updated_at = datetime.utcnow() + timedelta(minutes=1)
+    other.commit()
+
+    index = get_curriculum_graph(db).exercise_index[topic.id]
+    assert index.exercise_ids == (hard.id, matched.id)
+    assert _pick_exercise_id(index, 0.5, 0.0) == hard.id
+
+    other.close()
+    other_engine.dispose()
+
+
+def test_recommendation_cache_reuses_suggestion_until_user_writes(tmp_path):
+    """Cached suggestion is served until the user's mastery changes."""
+    db = _session(tmp_path)
+    subject, _, module = _create_learning_structure(db)
+
+    user = User(email='cached@example.com', hashed_password='hash', role='user')
+    topic = Topic(
+        subject_id=subject.id,
+        module_id=module.id,
+        name='Cached',
+        description=None,
+        difficulty_level=0.5,
+        criticality_level=1,
+    )
+    db.add_all([user, topic])
+    db.commit()
+    db.add_all(
+        [
+            Exercise(topic_id=topic.id, question='Easy', answer='A', difficulty=0.2),
+            Exercise(topic_id=topic.id, question='Hard', answer='A', difficulty=1.9),
+        ]
+    )
+    db.commit()
+
+    first = recommend_next_exercise(db, user.id)
+    assert first is not None
+    assert first.question == 'Easy'
+    assert recommendation_cache.get(user.id, get_curriculum_graph(db).version, datetime.utcnow()) is not None
+
+    db.add(UserMastery(user_id=user.id, topic_id=topic.id, mastery_score=0.99))
+    db.commit()
+    assert recommendation_cache.get(user.id, get_curriculum_graph(db).version, datetime.utcnow()) is None
+
+    second = recommend_next_exercise(db, user.id)
+    assert second is not None
+    assert second.question == 'Hard'
+
+
+def test_recommendation_cache_expires_and_evicts_least_recent():
+    """Entries expire on TTL, version change, or decay boundary and respect the size bound."""
+    now = datetime.utcnow()
+    cache = RecommendationCache(maxsize=2, ttl_seconds=60)
+    cache.put(1, exercise_id=10, graph_version=1, generation=cache.generation(1))
+    cache.put(2, exercise_id=20, graph_version=1, generation=cache.generation(2), valid_until=now + timedelta(days=1))
+    assert cache.get(1, graph_version=1, now=now) is not None
+    cache.put(3, exercise_id=30, graph_version=1, generation=cache.generation(3))
+    assert cache.get(2, graph_version=1, now=now) is None
+    assert cache.get(1, graph_version=2, now=now) is None
+
+    cache.put(4, exercise_id=40, graph_version=1, generation=cache.generation(4), valid_until=now + timedelta(hours=1))
+    assert cache.get(4, graph_version=1, now=now + timedelta(hours=2)) is None
+
+    expired = RecommendationCache(maxsize=2, ttl_seconds=0)
+    expired.put(1, exercise_id=10, graph_version=1, generation=expired.generation(1))
+    assert expired.get(1, graph_version=1, now=now) is None
+
+
+def test_recommendation_cache_drops_suggestions_computed_before_a_write():
+    """A `put` racing an invalidation must not store the outdated suggestion."""
+    now = datetime.utcnow()
+    cache = RecommendationCache(maxsize=2, ttl_seconds=60)
+    generation = cache.generation(1)
+    cache.invalidate(1)
+    cache.put(1, exercise_id=10, graph_version=1, generation=generation)
+    assert cache.get(1, graph_version=1, now=now) is None
+    assert cache.last_known(1) is None
+
+    generation = cache.generation(1)
+    cache.clear()
+    cache.put(1, exercise_id=10, graph_version=1, generation=generation)
+    assert cache.get(1, graph_version=1, now=now) is None
+
+    # Another user's invalidation leaves a pending write valid.
+    generation = cache.generation(1)
+    cache.invalidate(2)
+    cache.put(1, exercise_id=10, graph_version=1, generation=generation)
+    assert cache.get(1, graph_version=1, now=now).exercise_id == 10
+
+
+def test_latency_budget_serves_fallback_and_refreshes_in_background(tmp_path, monkeypatch):
+    """Over budget, the last suggestion (or an entry exercise) is served and the cache refilled."""
+    db = _session(tmp_path)
+    user_ids = _random_corpus(db, seed=9)
+    recommendation_cache.clear()
+    user_id, new_user_id = user_ids[0], user_ids[1]
+
+    first = recommend_within_budget(db, user_id, budget_ms=5000)
+    assert not first.fallback
+    assert first.exercise.id == select_next_exercise(db, user_id).id
+
+    recommendation_cache.invalidate(user_id)
+    release = threading.Event()
+    original = adaptation_engine._select_from_state
+
+    def _slow_select(*args, **kwargs):
+        release.wait(5)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(adaptation_engine, '_select_from_state', _slow_select)
+    try:
+        stale = recommend_within_budget(db, user_id, budget_ms=20)
+        assert stale.fallback
+        assert stale.exercise.id == first.exercise.id
+
+        default = recommend_within_budget(db, new_user_id, budget_ms=20)
+        assert default.fallback
+        graph = get_curriculum_graph(db)
+        assert not graph.prerequisites.get(default.exercise.topic_id)
+    finally:
+        release.set()
+        for future in list(recommendation_budget._inflight.values()):
+            future.result(timeout=5)
+
+    graph = get_curriculum_graph(db)
+    refreshed = recommendation_cache.get(user_id, graph_version=graph.version, now=datetime.utcnow())
+    assert refreshed is not None
+    assert refreshed.exercise_id == first.exercise.id
+
+
+def test_daily_plans_are_served_until_first_submission(tmp_path):
+    """The batch job stores engine picks; a submission falls back to live selection."""
+    db = _session(tmp_path)
+    _random_corpus(db, seed=13)
+    recommendation_cache.clear()
+    database_url = f"sqlite:///{tmp_path / 'engine_tests.db'}"
+
+    stored = run_daily_plan_job(db, database_url=database_url, chunk_size=3, workers=2, plan_size=4)
+    active = active_user_ids(db, now=datetime.utcnow())
+    assert stored == len(active) > 0
+
+    today = datetime.utcnow().date()
+    user_id = active[0]
+    plan = get_active_daily_plan(db, user_id, today=today)
+    assert plan.exercise_ids == [exercise.id for exercise in build_practice_queue(db, user_id, size=4)]
+    assert recommend_next_exercise(db, user_id).id == plan.exercise_ids[0]
+    assert [exercise.id for exercise in recommend_practice_queue(db, user_id, size=3)] == plan.exercise_ids[:3]
+
+    db.add(Attempt(user_id=user_id, exercise_id=plan.exercise_ids[0], is_correct=True))
+    db.commit()
+    assert get_active_daily_plan(db, user_id, today=today) is None
+    assert get_active_daily_plan(db, active[1], today=today) is not None
+    live_queue = build_practice_queue(db, user_id, size=3)
+    assert recommend_practice_queue(db, user_id, size=3) == live_queue
+
+
+def test_daily_plans_follow_the_configured_selection_policy(tmp_path, monkeypatch):
+    """Plans are built by the selection policy live requests use."""
+    db = _session(tmp_path)
+    _random_corpus(db, seed=14)
+    monkeypatch.setattr(settings, 'ADAPTIVE_SELECTION_POLICY', 'review_first')
+    database_url = f"sqlite:///{tmp_path / 'engine_tests.db'}"
+
+    run_daily_plan_job(db, database_url=database_url, chunk_size=3, workers=1, plan_size=4)
+    today = datetime.utcnow().date()
+    for user_id in active_user_ids(db, now=datetime.utcnow()):
+        plan = get_active_daily_plan(db, user_id, today=today)
+        live = build_practice_queue(db, user_id, size=4, policy=get_selection_policy('review_first'))
+        assert plan.exercise_ids == [exercise.id for exercise in live]
+
+
+def test_offline_sync_matches_sequential_submissions_in_one_transaction(tmp_path):
+    """A synced batch yields the same mastery as one-by-one updates, with few statements."""
+    db = _session(tmp_path)
+    subject, _, module = _create_learning_structure(db)
+    online = User(email='online@example.com', hashed_password='hash', role='user')
+    offline = User(email='offline@example.com', hashed_password='hash', role='user')
+    topics = [
+        Topic(
+            subject_id=subject.id,
+            module_id=module.id,
+            name=f'Sync {index}',
+            description=None,
+            difficulty_level=0.5,
+            criticality_level=1 + index,
+        )
+        for index in range(3)
+    ]
+    db.add_all([online, offline, *topics])
+    db.commit()
+    exercises = [
+        Exercise(topic_id=topic.id, question=f'Q{topic.id}-{n}', answer=f'A{n}', difficulty=0.4 + 0.3 * n)
+        for topic in topics
+        for n in range(2)
+    ]
+    db.add_all(exercises)
+    db.commit()
+    db.add(UserMastery(user_id=online.id, topic_id=topics[0].id, mastery_score=0.4))
+    db.add(UserMastery(user_id=offline.id, topic_id=topics[0].id, mastery_score=0.4))
+    db.commit()
+
+    rng = random.Random(18)
+    started = datetime.utcnow() - timedelta(hours=2)
+    answers = []
+    for step in range(30):
+        exercise = rng.choice(exercises)
+        answers.append(
+            OfflineAnswer(
+                exercise_id=exercise.id,
+                answer=exercise.answer if rng.random() < 0.6 else 'wrong',
+                answered_at=started + timedelta(minutes=step),
+            )
+        )
+
+    for answer in answers:
+        exercise = db.get(Exercise, answer.exercise_id)
+        topic = db.get(Topic, exercise.topic_id)
+        update_mastery(
+            db,
+            user_id=online.id,
+            topic_id=topic.id,
+            is_correct=answer.answer == exercise.answer,
+            difficulty=float(exercise.difficulty),
+            criticality_level=int(topic.criticality_level),
+        )
+
+    get_curriculum_graph(db)
+    offline_id = offline.id
+    statements: list[str] = []
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.get_bind(), 'before_cursor_execute', _count)
+    try:
+        graded = submit_offline_answers(db, offline_id, answers)
+    finally:
+        event.remove(db.get_bind(), 'before_cursor_execute', _count)
+
+    assert len(graded) == len(answers)
+    assert len(statements) < len(answers) // 2
+    assert db.query(Attempt).filter(Attempt.user_id == offline.id).count() == len(answers)
+    last_attempt = (
+        db.query(Attempt).filter(Attempt.user_id == offline.id).order_by(Attempt.created_at.desc()).first()
+    )
+    assert last_attempt.created_at.replace(tzinfo=None) == answers[-1].answered_at
+
+    expected = {row.topic_id: row.mastery_score for row in db.query(UserMastery).filter(UserMastery.user_id == online.id)}
+    synced = {row.topic_id: row.mastery_score for row in db.query(UserMastery).filter(UserMastery.user_id == offline.id)}
+    assert synced.keys() == expected.keys()
+    for topic_id, score in expected.items():
+        assert synced[topic_id] == pytest.approx(score)
+
+
+def test_attempt_write_paths_commit_once_and_roll_back_together(tmp_path, monkeypatch):
+    """Attempt, mastery and certificate share one commit; a failure leaves neither behind."""
+    from app.routes import adaptive as adaptive_routes
+    from app.routes import attempts as attempt_routes
+    from app.schemas.attempt import AttemptCreate
+
+    db = _session(tmp_path)
+    subject, _, module = _create_learning_structure(db)
+    user = User(email='uow@example.com', hashed_password='hash', role='user')
+    topic = Topic(
+        subject_id=subject.id,
+        module_id=module.id,
+        name='Unit of work',
+        description=None,
+        difficulty_level=0.5,
+        criticality_level=2,
+    )
+    db.add_all([user, topic])
+    db.commit()
+    exercise = Exercise(topic_id=topic.id, question='2+2', answer='4', difficulty=0.8)
+    db.add(exercise)
+    db.commit()
+    user_id, exercise_id, topic_id = user.id, exercise.id, topic.id
+
+    commits: list[int] = []
+    statements: list[str] = []
+    event.listen(db.get_bind(), 'commit', lambda conn: commits.append(1))
+    event.listen(
+        db.get_bind(),
+        'before_cursor_execute',
+        lambda conn, cursor, statement, parameters, context, executemany: statements.append(statement),
+    )
+
+    observed: list[tuple] = []
+    monkeypatch.setattr(settings, 'ADAPTIVE_SELECTION_POLICY', 'bandit')
+    monkeypatch.setattr(attempt_routes, 'observe_answer', lambda *args, **kwargs: observed.append((args, kwargs)))
+    monkeypatch.setattr(adaptive_routes, 'observe_answer', lambda *args, **kwargs: observed.append((args, kwargs)))
+    created = attempt_routes.create_attempt(
+        AttemptCreate(user_id=user_id, exercise_id=exercise_id, is_correct=True),
+        db=db,
+    )
+    assert len(commits) == 1
+    assert created.id is not None and created.created_at is not None
+    assert not any(statement.lstrip().startswith('SELECT attempts') for statement in statements)
+    assert observed == [
+        (
+            (user_id,),
+            {'topic_id': topic_id, 'exercise_id': exercise_id, 'is_correct': True, 'mastery_gain': created.mastery_score},
+        )
+    ]
+
+    commits.clear()
+    submitted = adaptive_routes.submit_adaptive_answer(
+        adaptive_routes.AdaptiveSubmitRequest(user_id=user_id, exercise_id=exercise_id, answer=' 4 '),
+        db=db,
+    )
+    assert submitted.correct
+    assert len(commits) == 1
+    score_before_failure = db.query(UserMastery.mastery_score).filter(UserMastery.user_id == user_id).scalar()
+    assert submitted.mastery_score == pytest.approx(score_before_failure)
+
+    def _fail(*args, **kwargs):
+        raise RuntimeError('certificate store unavailable')
+
+    monkeypatch.setattr(attempt_routes, 'ensure_subject_certificate', _fail)
+    with pytest.raises(RuntimeError):
+        attempt_routes.create_attempt(
+            AttemptCreate(user_id=user_id, exercise_id=exercise_id, is_correct=True),
+            db=db,
+        )
+    assert db.query(Attempt).filter(Attempt.user_id == user_id).count() == 2
+    row = db.query(UserMastery).filter(UserMastery.user_id == user_id, UserMastery.topic_id == topic_id).one()
+    assert row.mastery_score == pytest.approx(score_before_failure)
+    # A rolled-back answer is not reported to the selection policy.
+    assert len(observed) == 2
+
+
+def test_mastery_gain_is_measured_only_for_learning_policies(tmp_path, monkeypatch):
+    """Submissions skip the prior-score read under policies that ignore answers and start from P(L0) otherwise."""
+    from app.routes import attempts as attempt_routes
+    from app.schemas.attempt import AttemptCreate
+
+    db = _session(tmp_path)
+    subject, _, module = _create_learning_structure(db)
+    user = User(email='gain@example.com', hashed_password='hash', role='user')
+    topic = Topic(
+        subject_id=subject.id,
+        module_id=module.id,
+        name='Traced',
+        description=None,
+        difficulty_level=0.5,
+        criticality_level=1,
+    )
+    db.add_all([user, topic])
+    db.commit()
+    exercise = Exercise(topic_id=topic.id, question='Q', answer='A', difficulty=0.8)
+    db.add(exercise)
+    db.commit()
+    user_id, subject_id, topic_id, exercise_id = user.id, subject.id, topic.id, exercise.id
+
+    table = MasteryRateTable(
+        knowledge_tracing=KnowledgeTracingTable(
+            subjects=frozenset({subject_id}),
+            default=KnowledgeTracingModel.from_parameters(KnowledgeTracingParameters(initial=0.35)),
+        )
+    )
+    path = tmp_path / 'mastery_rates.json'
+    save_mastery_rate_table(table, path)
+    monkeypatch.setattr(settings, 'MASTERY_RATES_PATH', str(path))
+    observed: list[dict] = []
+    monkeypatch.setattr(attempt_routes, 'observe_answer', lambda *args, **kwargs: observed.append(kwargs))
+
+    for policy_name in ('heuristic', 'review_first'):
+        monkeypatch.setattr(settings, 'ADAPTIVE_SELECTION_POLICY', policy_name)
+        assert adaptation_engine.mastery_before_answer(db, user_id, topic_id, subject_id=subject_id) is None
+    attempt_routes.create_attempt(AttemptCreate(user_id=user_id, exercise_id=exercise_id, is_correct=True), db=db)
+    assert observed == []
+    db.query(UserMastery).delete()
+    db.commit()
+
+    monkeypatch.setattr(settings, 'ADAPTIVE_SELECTION_POLICY', 'bandit')
+    assert adaptation_engine.mastery_before_answer(db, user_id, topic_id, subject_id=subject_id) == pytest.approx(0.35)
+    created = attempt_routes.create_attempt(
+        AttemptCreate(user_id=user_id, exercise_id=exercise_id, is_correct=True),
+        db=db,
+    )
+    assert observed[0]['mastery_gain'] == pytest.approx(created.mastery_score - 0.35)
+    assert adaptation_engine.mastery_before_answer(db, user_id, topic_id, subject_id=subject_id) == pytest.approx(
+        created.mastery_score
+    )
+
+
+def test_concurrent_mastery_updates_do_not_lose_answers(tmp_path):
+    """A second submit while the first transaction is open must build on its result, not overwrite it."""
+    db = _session(tmp_path)
+    subject, _, module = _create_learning_structure(db)
+    user = User(email='race@example.com', hashed_password='hash', role='user')
+    topic = Topic(subject_id=subject.id, module_id=module.id, name='Race', description=None, difficulty_level=0.5)
+    db.add_all([user, topic])
+    db.commit()
+    user_id, topic_id = user.id, topic.id
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'engine_tests.db'}",
+        connect_args={'check_same_thread': False, 'timeout': 10},
+    )
+    make_session = sessionmaker(bind=engine)
+    first, second = make_session(), make_session()
+    try:
+        # The first answer inserts the row and holds its transaction open.
+        update_mastery(first, user_id=user_id, topic_id=topic_id, is_correct=True, commit=False)
+        started = threading.Event()
+
+        def _second_submit() -> float:
+            started.set()
+            return float(update_mastery(second, user_id=user_id, topic_id=topic_id, is_correct=True).mastery_score)
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pending = pool.submit(_second_submit)
+            started.wait(timeout=5)
+            time.sleep(0.2)
+            assert not pending.done()
+            first.commit()
+            final_score = pending.result(timeout=10)
+    finally:
+        first.close()
+        second.close()
+        engine.dispose()
+
+    alpha, beta = calculate_effective_rates(0.0, difficulty=1.0, criticality=1)
+    expected = calculate_mastery_score(calculate_mastery_score(0.0, True, alpha, beta), True, alpha, beta)
+    assert final_score == expected
+    db.expire_all()
+    rows = db.query(UserMastery).filter_by(user_id=user_id, topic_id=topic_id).all()
+    assert len(rows) == 1
+    assert rows[0].mastery_score == expected
+
+
+def test_offline_sync_waits_for_concurrent_first_answer(tmp_path):
+    """A batch racing a live first answer on the same topic must build on it, not fail or overwrite it."""
+    db = _session(tmp_path)
+    subject, _, module = _create_learning_structure(db)
+    user = User(email='batch-race@example.com', hashed_password='hash', role='user')
+    topic = Topic(subject_id=subject.id, module_id=module.id, name='Batch race', description=None, difficulty_level=0.5)
+    db.add_all([user, topic])
+    db.commit()
+    exercise = Exercise(topic_id=topic.id, question='1+1', answer='2', difficulty=1.0)
+    db.add(exercise)
+    db.commit()
+    user_id, topic_id, exercise_id = user.id, topic.id, exercise.id
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'engine_tests.db'}",
+        connect_args={'check_same_thread': False, 'timeout': 10},
+    )
+    make_session = sessionmaker(bind=engine)
+    live, batch = make_session(), make_session()
+    try:
+        # The live answer creates the row and holds its transaction open.
+        update_mastery(live, user_id=user_id, topic_id=topic_id, is_correct=False, commit=False)
+        started = threading.Event()
+
+        def _sync() -> list[float]:
+            started.set()
+            graded = submit_offline_answers(
+                batch,
+                user_id,
+                [OfflineAnswer(exercise_id=exercise_id, answer='2'), OfflineAnswer(exercise_id=exercise_id, answer='2')],
+            )
+            return [answer.mastery_score for answer in graded]
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pending = pool.submit(_sync)
+            started.wait(timeout=5)
+            time.sleep(0.2)
+            assert not pending.done()
+            live.commit()
+            synced = pending.result(timeout=10)
+    finally:
+        live.close()
+        batch.close()
+        engine.dispose()
+
+    alpha, beta = calculate_effective_rates(0.0, difficulty=1.0, criticality=1)
+    score = calculate_mastery_score(0.0, False, alpha, beta)
+    expected = []
+    for _ in range(2):
+        score = calculate_mastery_score(score, True, alpha, beta)
+        expected.append(score)
+    assert synced == expected
+    db.expire_all()
+    rows = db.query(UserMastery).filter_by(user_id=user_id, topic_id=topic_id).all()
+    assert len(rows) == 1
+    assert rows[0].mastery_score == expected[-1]
+
+
+def test_mastery_updates_fall_back_to_locked_read_on_dialects_without_upsert(tmp_path, monkeypatch):
+    """Without ON CONFLICT support, answers still apply through a locked read and write."""
+    db = _session(tmp_path)
+    subject, _, module = _create_learning_structure(db)
+    users = [User(email=f'fallback{index}@example.com', hashed_password='hash', role='user') for index in range(2)]
+    topic = Topic(subject_id=subject.id, module_id=module.id, name='Fallback', description=None, difficulty_level=0.5)
+    db.add_all(users + [topic])
+    db.commit()
+    answers = (True, False, True, True)
+
+    upserted = [
+        float(update_mastery(db, user_id=users[0].id, topic_id=topic.id, is_correct=is_correct).mastery_score)
+        for is_correct in answers
+    ]
+    monkeypatch.setattr(mastery_engine, '_upsert_for', lambda dialect_name: None)
+    fallback = [
+        float(update_mastery(db, user_id=users[1].id, topic_id=topic.id, is_correct=is_correct).mastery_score)
+        for is_correct in answers
+    ]
+    assert fallback == upserted
+    row = db.query(UserMastery).filter_by(user_id=users[1].id, topic_id=topic.id).one()
+    assert row.last_seen_at is not None and row.review_priority is not None
+
+
+@pytest.mark.parametrize('policy_name', sorted(POLICY_FACTORIES))
+def test_batch_next_exercise_matches_single_user_engine(tmp_path, monkeypatch, policy_name):
+    """Cohort selection must return exactly what the per-user engine returns under every policy."""
+    monkeypatch.setattr(settings, 'ADAPTIVE_SELECTION_POLICY', policy_name)
+    db = _session(tmp_path)
+    user_ids: list[int] = []
+    for seed in range(4):
+        user_ids.extend(_random_corpus(db, seed=seed))
+
+    batch = select_next_exercises_for_users(db, user_ids)
+    assert list(batch) == user_ids
+    for user_id in user_ids:
+        expected = select_next_exercise(db, user_id)
+        actual = batch[user_id]
+        assert (actual.id if actual else None) == (expected.id if expected else None)
+
+
+def test_practice_queue_simulates_answers_without_writing(tmp_path):
+    """Each queued item must be what the engine serves after really answering the previous ones."""
+    db = _session(tmp_path)
+    user_ids = _random_corpus(db, seed=5, topic_count=8, user_count=4)
+
+    for user_id in user_ids:
+        for assume_correct in (True, False):
+            rows_before = [
+                (row.topic_id, row.mastery_score)
+                for row in db.query(UserMastery).filter_by(user_id=user_id).order_by(UserMastery.topic_id)
+            ]
+            queue = build_practice_queue(db, user_id, size=3, assume_correct=assume_correct)
+            rows_after = [
+                (row.topic_id, row.mastery_score)
+                for row in db.query(UserMastery).filter_by(user_id=user_id).order_by(UserMastery.topic_id)
+            ]
+            assert rows_after == rows_before
+
+            expected = select_next_exercise(db, user_id)
+            assert [exercise.id for exercise in queue[:1]] == ([expected.id] if expected else [])
+
+    user_id = user_ids[0]
+    queue = build_practice_queue(db, user_id, size=3, assume_correct=True)
+    for queued in queue:
+        assert select_next_exercise(db, user_id).id == queued.id
+        db.add(Attempt(user_id=user_id, exercise_id=queued.id, is_correct=True))
+        topic = db.get(Topic, queued.topic_id)
+        update_mastery(
+            db,
+            user_id=user_id,
+            topic_id=topic.id,
+            is_correct=True,
+            difficulty=float(queued.difficulty),
+            criticality_level=int(topic.criticality_level),
+        )
+
+
+def test_subject_scope_matches_single_subject_catalog(tmp_path):
+    """A subject-scoped pick must equal the pick on a platform that only has that subject."""
+    (tmp_path / 'solo').mkdir()
+    (tmp_path / 'shared').mkdir()
+    solo_db = _session(tmp_path / 'solo')
+    solo_users = _random_corpus(solo_db, seed=21)
+    shared_db = _session(tmp_path / 'shared')
+    shared_users = _random_corpus(shared_db, seed=21)
+    _random_corpus(shared_db, seed=22)
+    assert shared_users == solo_users
+
+    graph = get_curriculum_graph(shared_db)
+    subject_id = shared_db.get(Topic, graph.topic_ids[0]).subject_id
+    module_id = shared_db.get(Topic, graph.topic_ids[0]).module_id
+    scope = AdaptiveScope(subject_id=subject_id)
+    subject_topics = set(graph.topics_by_subject[subject_id])
+    assert set(graph.for_subject(subject_id).topic_ids) == subject_topics
+
+    batch = select_next_exercises_for_users(shared_db, shared_users, scope=scope)
+    for user_id in shared_users:
+        expected = select_next_exercise(solo_db, user_id)
+        scoped = select_next_exercise(shared_db, user_id, scope=scope)
+        assert (scoped.id if scoped else None) == (expected.id if expected else None)
+        assert (batch[user_id].id if batch[user_id] else None) == (scoped.id if scoped else None)
+        assert calculate_branch_level(shared_db, user_id, scope=scope) == calculate_branch_level(solo_db, user_id)
+
+        module_pick = recommend_next_exercise(shared_db, user_id, scope=AdaptiveScope(module_id=module_id))
+        if module_pick is not None:
+            assert module_pick.topic_id in graph.topics_by_module[module_id]
+
+    state = load_user_learning_state(shared_db, shared_users[0], subject_id=subject_id + 1)
+    assert not state.mastery_rows
+
+
+def test_sql_engine_matches_python_engine(tmp_path, monkeypatch):
+    """The single-statement ranking must pick the same exercise as the Python engine."""
+    db = _session(tmp_path)
+    user_ids: list[int] = []
+    for seed in range(4):
+        user_ids.extend(_random_corpus(db, seed=30 + seed, topic_count=12))
+
+    graph = get_curriculum_graph(db)
+    for user_id in user_ids:
+        expected = select_next_exercise(db, user_id)
+        actual = select_next_exercise_sql(db, user_id)
+        assert (actual.id if actual else None) == (expected.id if expected else None)
+        for subject_id in graph.topics_by_subject:
+            scope = AdaptiveScope(subject_id=subject_id)
+            expected = select_next_exercise(db, user_id, scope=scope)
+            actual = select_next_exercise_sql(
+                db,
+                user_id,
+                subject_id=subject_id,
+                scope_topic_ids=graph.topics_by_subject[subject_id],
+            )
+            assert (actual.id if actual else None) == (expected.id if expected else None)
+
+    monkeypatch.setattr(settings, 'ADAPTIVE_ENGINE_MODE', 'sql')
+    statements: list[str] = []
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.get_bind(), 'before_cursor_execute', _count)
+    try:
+        suggestion = select_next_exercise(db, user_ids[0])
+    finally:
+        event.remove(db.get_bind(), 'before_cursor_execute', _count)
+    assert len(statements) == 1
+    assert suggestion.id == select_next_exercise_sql(db, user_ids[0]).id
+    assert recommend_next_exercise(db, user_ids[0]).id == suggestion.id
+
+
+def test_materialized_revalidation_matches_attempt_counts(tmp_path):
+    """The per-row revalidation window must agree with counting recent correct attempts."""
+    db = _session(tmp_path)
+    for seed in range(3):
+        _random_corpus(db, seed=60 + seed, topic_count=8)
+
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=REVALIDATION_WINDOW_DAYS)
+    rows = db.query(UserMastery).all()
+    assert any(is_revalidated(row, now=now) for row in rows)
+    for row in rows:
+        recent_correct = (
+            db.query(Attempt)
+            .join(Exercise, Exercise.id == Attempt.exercise_id)
+            .filter(
+                Attempt.user_id == row.user_id,
+                Exercise.topic_id == row.topic_id,
+                Attempt.is_correct.is_(True),
+                Attempt.created_at >= cutoff,
+            )
+            .count()
+        )
+        assert is_revalidated(row, now=now) == (recent_correct >= REVALIDATION_CORRECT_REQUIRED)
+        assert len(row.recent_correct_at or []) <= REVALIDATION_CORRECT_REQUIRED
+
+    # Late-arriving (offline) answers may be older than the ones already recorded.
+    row = UserMastery(user_id=1, topic_id=1, mastery_score=0.5)
+    for days_ago in (1, 50, 2, 3):
+        record_correct_attempt(row, at=now - timedelta(days=days_ago))
+    assert row.revalidated_until == now - timedelta(days=3) + timedelta(days=REVALIDATION_WINDOW_DAYS)
+    record_correct_attempt(row, at=now - timedelta(days=60))
+    assert row.revalidated_until == now - timedelta(days=3) + timedelta(days=REVALIDATION_WINDOW_DAYS)
+
+
+def test_review_refresh_job_persists_decayed_priorities_in_chunks(tmp_path):
+    """The set-based refresh must match the Python decay formula without touching staleness."""
+    db = _session(tmp_path)
+    user_ids = _random_corpus(db, seed=70, topic_count=10)
+    answered = update_mastery(db, user_id=user_ids[0], topic_id=db.query(Topic.id).first()[0], is_correct=True)
+    assert answered.review_priority is not None
+    assert answered.last_seen_at is not None
+    assert answered.is_completed == is_topic_completed(answered.mastery_score)
+
+    before = {row.id: row.last_updated for row in db.query(UserMastery)}
+    later = datetime.utcnow() + timedelta(days=12)
+    statements: list[str] = []
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('UPDATE'):
+            statements.append(statement)
+
+    event.listen(db.get_bind(), 'before_cursor_execute', _count)
+    try:
+        updated = refresh_review_priorities(db, now=later, chunk_size=7)
+    finally:
+        event.remove(db.get_bind(), 'before_cursor_execute', _count)
+
+    rows = db.query(UserMastery).all()
+    assert updated == len(rows)
+    assert len(statements) == math.ceil((max(before) - min(before) + 1) / 7)
+    for row in rows:
+        expected = calculate_review_priority(row.mastery_score, _normalized_last_seen(row), now=later)
+        assert row.review_priority == pytest.approx(expected, abs=1e-6)
+        assert row.is_completed == is_topic_completed(row.mastery_score)
+        assert row.last_updated == before[row.id]
+
+    # Both engines read the persisted priorities.
+    for user_id in user_ids:
+        expected = select_next_exercise(db, user_id)
+        actual = select_next_exercise_sql(db, user_id)
+        assert (actual.id if actual else None) == (expected.id if expected else None)
+
+
+def test_vectorized_mastery_rebuild_matches_sequential_replay(tmp_path):
+    """The segmented scan must reproduce `update_mastery` arithmetic attempt by attempt."""
+    db = _session(tmp_path)
+    user_ids = _random_corpus(db, seed=80, topic_count=10)
+    user_ids += _random_corpus(db, seed=81, topic_count=6)
+    revalidation = {
+        (row.user_id, row.topic_id): (row.recent_correct_at, row.revalidated_until) for row in db.query(UserMastery)
+    }
+
+    expected: dict[tuple[int, int], float] = {}
+    history = (
+        db.query(Attempt, Exercise, Topic)
+        .join(Exercise, Exercise.id == Attempt.exercise_id)
+        .join(Topic, Topic.id == Exercise.topic_id)
+        .order_by(Attempt.user_id, Exercise.topic_id, Attempt.created_at, Attempt.id)
+    )
+    for attempt, exercise, topic in history:
+        key = (attempt.user_id, topic.id)
+        alpha, beta = calculate_effective_rates(0.0, exercise.difficulty, topic.criticality_level)
+        expected[key] = calculate_mastery_score(expected.get(key, 0.0), attempt.is_correct, alpha, beta)
+
+    resumed_from: list[int] = []
+    middle = sorted(user_ids)[len(user_ids) // 2]
+    written = rebuild_mastery(db, end_user_id=middle, chunk_size=3, on_chunk=lambda last, rows: resumed_from.append(last))
+    written += rebuild_mastery(db, start_user_id=resumed_from[-1] + 1, chunk_size=5)
+    assert resumed_from[-1] == middle
+    assert written == len(expected)
+
+    rows = {(row.user_id, row.topic_id): row for row in db.query(UserMastery)}
+    for key, score in expected.items():
+        row = rows[key]
+        assert row.mastery_score == pytest.approx(score, abs=1e-12)
+        assert row.is_completed == is_topic_completed(score)
+        assert row.last_seen_at is not None
+        assert (row.recent_correct_at, row.revalidated_until) == revalidation.get(key, (None, None))
+
+    # Rows of topics without attempts are left as they were.
+    untouched = [row for key, row in rows.items() if key not in expected]
+    assert all(row.last_seen_at is None for row in untouched)
+
+
+def test_rate_calibration_fits_partitions_and_feeds_the_engine(tmp_path, monkeypatch):
+    """Fitted rates must not predict worse than the defaults and must load from configuration."""
+    db = _session(tmp_path)
+    for seed in range(3):
+        _random_corpus(db, seed=90 + seed, topic_count=8, user_count=12)
+    monkeypatch.setattr(mastery_calibration, 'MIN_SCORED_ATTEMPTS', 20)
+
+    history = load_attempt_history(db)
+    squared_errors: list[float] = []
+    previous_key, score = None, 0.0
+    ordered = (
+        db.query(Attempt, Exercise, Topic)
+        .join(Exercise, Exercise.id == Attempt.exercise_id)
+        .join(Topic, Topic.id == Exercise.topic_id)
+        .order_by(Attempt.user_id, Exercise.topic_id, Attempt.created_at, Attempt.id)
+    )
+    for attempt, exercise, topic in ordered:
+        key = (attempt.user_id, topic.id)
+        if key != previous_key:
+            previous_key, score = key, 0.0
+        else:
+            squared_errors.append((score - float(attempt.is_correct)) ** 2)
+        alpha, beta = calculate_effective_rates(score, exercise.difficulty, topic.criticality_level)
+        score = calculate_mastery_score(score, attempt.is_correct, alpha, beta)
+    baseline = evaluate_rates(history, BASE_LEARNING_RATE_DEFAULT, BASE_DECAY_RATE_DEFAULT)
+    assert baseline.attempts == len(squared_errors)
+    assert baseline.brier == pytest.approx(sum(squared_errors) / len(squared_errors), abs=1e-12)
+
+    report = run_calibration(db, scopes=list(SCOPES), workers=1)
+    assert {fit.scope for fit in report.fits} == set(SCOPES)
+    for fit in report.fits:
+        assert fit.fitted.brier <= fit.baseline.brier + 1e-12
+    coordinate = run_calibration(db, scopes=[SCOPE_GLOBAL], search=SEARCH_COORDINATE, workers=1)
+    assert coordinate.fits[0].fitted.brier <= coordinate.fits[0].baseline.brier + 1e-12
+    pooled = run_calibration(db, scopes=[SCOPE_GLOBAL], workers=2)
+    assert pooled.fits[0].rates == next(fit.rates for fit in report.fits if fit.scope == SCOPE_GLOBAL)
+
+    table = report.rate_table()
+    path = tmp_path / 'mastery_rates.json'
+    save_mastery_rate_table(table, path)
+    monkeypatch.setattr(settings, 'MASTERY_RATES_PATH', str(path))
+    subject_id, subject_rates = next(iter(table.by_subject.items()))
+    alpha, beta = calculate_effective_rates(0.0, difficulty=1.0, criticality=1, subject_id=subject_id)
+    assert alpha == pytest.approx(subject_rates.learning_rate * math.log1p(1))
+    assert beta == pytest.approx(subject_rates.decay_rate * math.log1p(1))
+    critical_rates = table.by_criticality[2]
+    alpha, _ = calculate_effective_rates(0.0, difficulty=1.0, criticality=2, subject_id=-1)
+    assert alpha == pytest.approx(critical_rates.learning_rate * math.log1p(2))
+
+
+def test_knowledge_tracing_model_scores_configured_subjects(tmp_path, monkeypatch):
+    """Subjects listed for knowledge tracing follow BKT on every write path; others keep the logistic update."""
+    with pytest.raises(ValueError):
+        KnowledgeTracingParameters(slip=0.6, guess=0.5)
+    with pytest.raises(ValueError):
+        KnowledgeTracingParameters(initial=1.5)
+    legacy = KnowledgeTracingParameters.from_dict({'slip': 0.1, 'guess': 0.2, 'learn': 0.15})
+    assert legacy.initial == KnowledgeTracingParameters().initial
+    parameters = KnowledgeTracingParameters(slip=0.05, guess=0.3, learn=0.25, initial=0.35)
+    model = KnowledgeTracingModel.from_parameters(parameters)
+    for prior in np.linspace(0.0, 1.0, 11):
+        for is_correct in (True, False):
+            evidence = (1 - parameters.slip) if is_correct else parameters.slip
+            noise = parameters.guess if is_correct else (1 - parameters.guess)
+            posterior = prior * evidence / (prior * evidence + (1 - prior) * noise)
+            expected = posterior + (1 - posterior) * parameters.learn
+            assert model.update(prior, is_correct) == pytest.approx(expected, abs=1e-12)
+
+    db = _session(tmp_path)
+    user_ids = _random_corpus(db, seed=97, topic_count=8)
+    user_ids += _random_corpus(db, seed=98, topic_count=6)
+    traced_subject, logistic_subject = [subject.id for subject in db.query(Subject).order_by(Subject.id)]
+    traced_topic = db.query(Topic).filter(Topic.subject_id == traced_subject).order_by(Topic.id).first()
+    table = MasteryRateTable(
+        knowledge_tracing=KnowledgeTracingTable(subjects=frozenset({traced_subject}), by_topic={traced_topic.id: model})
+    )
+    path = tmp_path / 'mastery_rates.json'
+    save_mastery_rate_table(table, path)
+    assert load_mastery_rate_table(path) == table
+    monkeypatch.setattr(settings, 'MASTERY_RATES_PATH', str(path))
+
+    # The vectorized rebuild folds BKT histories with the same arithmetic as one update per answer.
+    expected: dict[tuple[int, int], float] = {}
+    history = (
+        db.query(Attempt, Exercise, Topic)
+        .join(Exercise, Exercise.id == Attempt.exercise_id)
+        .join(Topic, Topic.id == Exercise.topic_id)
+        .order_by(Attempt.user_id, Exercise.topic_id, Attempt.created_at, Attempt.id)
+    )
+    for attempt, exercise, topic in history:
+        key = (attempt.user_id, topic.id)
+        if topic.subject_id == traced_subject:
+            # Every learner starts a traced topic from its P(L0) prior.
+            topic_model = model if topic.id == traced_topic.id else table.knowledge_tracing.default
+            expected[key] = topic_model.update(expected.get(key, topic_model.initial), attempt.is_correct)
+        else:
+            alpha, beta = calculate_effective_rates(0.0, exercise.difficulty, topic.criticality_level)
+            expected[key] = calculate_mastery_score(expected.get(key, 0.0), attempt.is_correct, alpha, beta)
+    assert any(topic_id == traced_topic.id for _, topic_id in expected)
+    assert rebuild_mastery(db, chunk_size=4) == len(expected)
+    rows = {(row.user_id, row.topic_id): row for row in db.query(UserMastery)}
+    for key, score in expected.items():
+        assert rows[key].mastery_score == pytest.approx(score, abs=1e-12)
+
+    # The atomic SQL update, the in-memory state and offline sync agree with the model answer by answer,
+    # starting from the prior on a learner's first answer.
+    learner = User(email='bkt-first@example.com', hashed_password='hash', role='user')
+    offline_learner = User(email='bkt-offline@example.com', hashed_password='hash', role='user')
+    db.add_all([learner, offline_learner])
+    db.commit()
+    user_id = learner.id
+    node = get_curriculum_graph(db).topics[traced_topic.id]
+    exercise = db.query(Exercise).filter(Exercise.topic_id == traced_topic.id).first()
+    if exercise is None:
+        exercise = Exercise(topic_id=traced_topic.id, question='BKT', answer='A', difficulty=1.0)
+        db.add(exercise)
+        db.commit()
+    synced = submit_offline_answers(
+        db,
+        offline_learner.id,
+        [OfflineAnswer(exercise_id=exercise.id, answer='A'), OfflineAnswer(exercise_id=exercise.id, answer='B')],
+    )
+    offline_expected = model.update(model.update(model.initial, True), False)
+    assert [answer.mastery_score for answer in synced] == [model.update(model.initial, True), offline_expected]
+    score = model.initial
+    for is_correct in (True, False, True, True):
+        state = load_user_learning_state(db, user_id).detached_copy()
+        simulated = state.apply_answer(node, is_correct=is_correct, difficulty=1.0, at=datetime.utcnow())
+        mastery = update_mastery(
+            db,
+            user_id=user_id,
+            topic_id=traced_topic.id,
+            is_correct=is_correct,
+            criticality_level=node.criticality_level,
+            subject_id=traced_subject,
+        )
+        score = model.update(score, is_correct)
+        assert mastery.mastery_score == pytest.approx(score, abs=1e-12)
+        assert simulated == pytest.approx(score, abs=1e-12)
+    assert next_mastery_score(0.5, True, 1.0, 1, subject_id=logistic_subject) == calculate_mastery_score(
+        0.5, True, *calculate_effective_rates(0.5, 1.0, 1)
+    )
+
+
+def test_selection_policies_are_pluggable_and_replayable(tmp_path, monkeypatch):
+    """Every policy serves live requests and replays the logged attempts offline."""
+    db = _session(tmp_path)
+    user_ids = _random_corpus(db, seed=17, topic_count=12, user_count=9)
+    graph = get_curriculum_graph(db)
+
+    for name in POLICY_FACTORIES:
+        monkeypatch.setattr(settings, 'ADAPTIVE_SELECTION_POLICY', name)
+        for user_id in user_ids:
+            exercise = select_next_exercise(db, user_id)
+            assert exercise is not None
+            assert exercise.id in graph.exercise_ids[exercise.topic_id]
+
+    bandit = BanditPolicy()
+    state = load_user_learning_state(db, user_ids[0]).detached_copy()
+    servable = [topic for topic in graph.topic_list() if topic.id in graph.exercise_index]
+    first = bandit.choose_exercise_id(graph, state, servable)
+    first_topic = next(topic_id for topic_id, ids in graph.exercise_ids.items() if first in ids)
+    bandit.observe(user_ids[0], first_topic, first, True, 0.1)
+    second = bandit.choose_exercise_id(graph, state, servable)
+    assert second not in graph.exercise_ids[first_topic]
+    assert get_selection_policy('bandit') is get_selection_policy('bandit')
+
+    logged = db.query(Attempt).count()
+    active_users = db.query(Attempt.user_id).distinct().count()
+    results = run_policy_replay(
+        db,
+        database_url=f"sqlite:///{tmp_path / 'engine_tests.db'}",
+        policy_names=list(POLICY_FACTORIES),
+        chunk_size=4,
+    )
+    assert set(results) == set(POLICY_FACTORIES)
+    for metrics in results.values():
+        assert metrics.decisions == logged
+        assert metrics.users == active_users
+        assert len(metrics.latencies_ms) == logged
+        assert 0.0 <= metrics.exercise_match_rate <= metrics.topic_match_rate <= 1.0
+        assert metrics.latency_percentile(95) >= metrics.latency_percentile(50) >= 0.0
+
+
+def test_explain_trace_reports_stages_and_matches_selection(tmp_path):
+    """The explain trace must describe the same pick the engine serves."""
+    db = _session(tmp_path)
+    user_ids = _random_corpus(db, seed=17)
+
+    for user_id in user_ids:
+        trace = explain_next_exercise(db, user_id)
+        expected = select_next_exercise(db, user_id)
+        assert trace.picked_exercise_id == (expected.id if expected else None)
+
+        stage_names = [stage.name for stage in trace.stages]
+        assert stage_names[:2] == ['load', 'unlock']
+        assert set(trace.reinforcement_topic_ids) <= set(trace.unlocked_topic_ids)
+        assert sum(stage.statements for stage in trace.stages) == trace.statements
+        if trace.ranked_topics:
+            keys = [(topic.completed, -topic.urgency) for topic in trace.ranked_topics]
+            assert keys == sorted(keys)
+
+
+def test_incremental_unlock_frontier_matches_full_recompute(tmp_path):
+    """Updating only dependents of flipped topics must equal a from-scratch frontier."""
+    db = _session(tmp_path)
+    user_ids = _random_corpus(db, seed=11, topic_count=15, user_count=3)
+    graph = get_curriculum_graph(db)
+    rng = random.Random(3)
+    frontiers = UnlockFrontierCache(maxsize=10)
+
+    for _ in range(25):
+        user_id = rng.choice(user_ids)
+        topic_id = rng.choice(graph.topic_ids)
+        row = db.query(UserMastery).filter_by(user_id=user_id, topic_id=topic_id).first()
+        if row is None:
+            db.add(UserMastery(user_id=user_id, topic_id=topic_id, mastery_score=rng.random()))
+        else:
+            row.mastery_score = rng.choice([0.1, 0.6, 0.9, 1.0])
+            row.last_updated = datetime.utcnow() - timedelta(days=rng.choice([0, 120]))
+        db.commit()
+
+        for uid in user_ids:
+            state = load_user_learning_state(db, uid)
+            incremental = frontiers.unlocked_topic_ids(graph, state)
+            full = UnlockFrontierCache(maxsize=1).unlocked_topic_ids(graph, state)
+            assert incremental == full
+
+
+def test_bulk_dependency_import_rejects_cycles_and_builds_closure(tmp_path):
+    """Bulk import validates the batch in memory and feeds the prerequisite closure."""
+    db = _session(tmp_path)
+    subject, _, module = _create_learning_structure(db)
+    other_subject, _, other_module = _create_learning_structure(db)
+    chain = [
+        Topic(
+            subject_id=subject.id,
+            module_id=module.id,
+            name=f'Step {index}',
+            description=None,
+            difficulty_level=0.5,
+            criticality_level=1,
+        )
+        for index in range(4)
+    ]
+    outsider = Topic(
+        subject_id=other_subject.id,
+        module_id=other_module.id,
+        name='Elsewhere',
+        description=None,
+        difficulty_level=0.5,
+        criticality_level=1,
+    )
+    db.add_all(chain + [outsider])
+    db.commit()
+    a, b, c, d = (topic.id for topic in chain)
+
+    _, errors = validate_dependency_edges(db, [TopicDependencyIn(topic_id=a, depends_on_id=outsider.id)])
+    assert errors and 'same subject' in errors[0]
+
+    result = import_topic_dependencies(
+        db,
+        [
+            TopicDependencyIn(topic_id=b, depends_on_id=a),
+            TopicDependencyIn(topic_id=c, depends_on_id=b),
+            TopicDependencyIn(topic_id=d, depends_on_id=c),
+        ],
+    )
+    assert result.created == 3
+    assert get_curriculum_graph(db).all_prerequisites(d) == {a, b, c}
+    assert get_curriculum_graph(db).all_dependents(a) == {b, c, d}
+
+    _, errors = validate_dependency_edges(db, [TopicDependencyIn(topic_id=a, depends_on_id=d)])
+    assert errors and 'cycle' in errors[0]
+
+    db.add(TopicDependency(topic_id=a, depends_on_id=c))
+    with pytest.raises(ValueError, match='cycle'):
+        db.commit()
+    db.rollback()
+
+
+def test_scoring_kernel_matches_scalar_ranking():
+    """Vectorized review priority and ordering must equal the per-topic formulas."""
+    rng = random.Random(5)
+    now = datetime.utcnow()
+    for _ in range(200):
+        size = rng.randint(1, 30)
+        topic_ids = rng.sample(range(1, 1000), size)
+        mastery = [rng.choice([0.0, 0.2, 0.5, 0.8, 0.95, 1.0, rng.random()]) for _ in range(size)]
+        criticality = [rng.randint(1, 3) for _ in range(size)]
+        thresholds = [rng.choice([0.65, 0.75, 0.85]) for _ in range(size)]
+        last_seen = [
+            None if rng.random() < 0.2 else now - timedelta(days=rng.uniform(0, 60))
+            for _ in range(size)
+        ]
+
+        expected_review = [
+            calculate_review_priority(mastery[i], last_seen[i], now=now) for i in range(size)
+        ]
+
+        def scalar_key(i: int):
+            weakness = max(0.0, thresholds[i] - mastery[i])
+            urgency = (weakness * criticality[i] + weakness + expected_review[i]) * (1.0 + criticality[i] * 0.1)
+            return (1 if is_topic_completed(mastery[i]) else 0, -urgency, -criticality[i], topic_ids[i])
+
+        elapsed = np.array(
+            [np.nan if seen is None else (now - seen).total_seconds() / 86400.0 for seen in last_seen]
+        )
+        review = review_priorities(np.array(mastery), elapsed)
+        assert review.tolist() == expected_review
+
+        order = rank_topics(
+            np.array(topic_ids),
+            np.array(mastery),
+            np.array(criticality, dtype=float),
+            np.array(thresholds),
+            review,
+        )
+        assert order.tolist() == sorted(range(size), key=scalar_key)